@@ -1,15 +1,16 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, AuthenticationForm, PasswordResetForm, SetPasswordForm
 from django.utils.translation import gettext_lazy as _
+from saloon.styling import StyledFormMixin
 from .models import CustomUser
 
-class StyleFormMixin:
-    def style_fields(self):
-        for field in self.fields.values():
-            field.widget.attrs.update({
-                'class': 'w-full px-3 py-2 text-[#1E283D] border rounded-lg focus:outline-none focus:ring-2 focus:ring-[#4B49AC] focus:border-transparent',
-                'style': 'border-color: #E5E5E5;'
-            })
+class StyleFormMixin(StyledFormMixin):
+    widget_styles = (
+        ((forms.Widget,), {
+            'class': 'w-full px-3 py-2 text-[#1E283D] border rounded-lg focus:outline-none focus:ring-2 focus:ring-[#4B49AC] focus:border-transparent',
+            'style': 'border-color: #E5E5E5;'
+        }),
+    )
 
 class CustomUserCreationForm(UserCreationForm, StyleFormMixin):
     class Meta:
@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import SalonViewSet, BarberViewSet, ClientViewSet, BarberTypeViewSet, AttachmentViewSet
+from .async_views import salon_search, salon_dashboard
+from .views import SalonViewSet, BarberViewSet, ClientViewSet, BarberTypeViewSet, AttachmentViewSet, SearchView, AutocompleteView
 
 router = DefaultRouter()
 router.register(r'salons', SalonViewSet, basename='salon')
@@ -11,4 +12,8 @@ router.register(r'attachments', AttachmentViewSet, basename='attachment')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('search/', SearchView.as_view(), name='search'),
+    path('search/autocomplete/', AutocompleteView.as_view(), name='search_autocomplete'),
+    path('async/salons/', salon_search, name='async_salon_search'),
+    path('async/salons/<int:pk>/dashboard/', salon_dashboard, name='async_salon_dashboard'),
 ]
\ No newline at end of file
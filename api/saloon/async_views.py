@@ -0,0 +1,59 @@
+''' Async (ASGI) variants of the read-heavy salon endpoints '''
+
+import asyncio
+from functools import wraps
+from django.http import JsonResponse
+from rest_framework.utils.encoders import JSONEncoder
+from saloon.dashboard import aget_dashboard
+from saloon.models import Salon
+from saloon.ownership import aget_salon_ownership
+from saloon.search import search
+
+SALON_PAGE_SIZE = 10
+
+def owner_required(view):
+    """
+    Pass the loaded SalonOwnership of the authenticated user to ``view``;
+    anonymous requests get the same 403 as the DRF endpoints.
+    """
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        ownership = await aget_salon_ownership(request)
+        if ownership.user_id is None:
+            return json_response({'detail': "Authentication credentials were not provided."}, status=403)
+        return await view(request, ownership, *args, **kwargs)
+    return wrapper
+
+def json_response(data, status=200):
+    # Rendered like the DRF endpoints, so both return the same JSON
+    return JsonResponse(data, status=status, encoder=JSONEncoder)
+
+def not_found():
+    return json_response({'detail': "Not found."}, status=404)
+
+async def salon_search(request):
+    """
+    Active salons, newest first or best match first for ``?search=`` on
+    name and description. The page and the total count are fetched together.
+    """
+    queryset = Salon.objects.filter(is_active=True).order_by('-created_at', '-pk')
+    query = request.GET.get('search')
+    if query:
+        queryset = search('salons', query, queryset=queryset)
+    try:
+        page = max(int(request.GET.get('page', 1)), 1)
+    except ValueError:
+        return not_found()
+    start = (page - 1) * SALON_PAGE_SIZE
+    rows = queryset.values('id', 'name', 'description', 'address')[start:start + SALON_PAGE_SIZE]
+
+    async def results():
+        return [row async for row in rows]
+    salons, count = await asyncio.gather(results(), queryset.acount())
+    return json_response({'count': count, 'page': page, 'results': salons})
+
+@owner_required
+async def salon_dashboard(request, ownership, pk):
+    if not ownership.owns(pk):
+        return not_found()
+    return json_response(await aget_dashboard(pk))
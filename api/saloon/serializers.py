@@ -1,5 +1,77 @@
+from django.core.exceptions import ObjectDoesNotExist
 from rest_framework import serializers
 from saloon.models import Salon, Barber, Client, BarberType, Attachment
+from saloon.ownership import get_salon_ownership
+from saloon.reference import REFERENCES, get_reference, invalidate_reference, reference_name
+
+class ReferenceRelatedField(serializers.PrimaryKeyRelatedField):
+    """
+    A primary key looked up in, and offering the choices of, the cached
+    reference table ``reference``. Per-salon tables are limited to the
+    salons of the requesting user; without a request, as outside a view,
+    the field's queryset is used instead.
+    """
+    def __init__(self, reference=None, **kwargs):
+        self.reference = reference
+        super().__init__(**kwargs)
+
+    def rows(self):
+        """
+        The cached rows the field accepts, or None when they cannot be told
+        without a request.
+        """
+        if not REFERENCES[self.reference].scope:
+            return get_reference(self.reference)
+        request = self.context.get('request')
+        if request is None:
+            return None
+        salon_ids = sorted(get_salon_ownership(request).salon_ids)
+        return [row for salon_id in salon_ids for row in get_reference(self.reference, salon_id)]
+
+    def to_internal_value(self, data):
+        rows = self.rows()
+        if rows is None:
+            return super().to_internal_value(data)
+        if isinstance(data, bool) or not isinstance(data, (str, int)):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        row = next((row for row in rows if str(row.pk) == str(data)), None)
+        if row is None:
+            # The cached rows may predate a row added through another worker
+            row = self.lookup(data)
+        return row
+
+    def lookup(self, data):
+        reference = REFERENCES[self.reference]
+        queryset = self.get_queryset()
+        if reference.scope:
+            queryset = queryset.filter(**{f'{reference.scope}__in': get_salon_ownership(self.context['request']).salon_ids})
+        try:
+            row = queryset.get(pk=data)
+        except ObjectDoesNotExist:
+            self.fail('does_not_exist', pk_value=data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        invalidate_reference(self.reference, getattr(row, reference.scope) if reference.scope else None)
+        return row
+
+    def get_choices(self, cutoff=None):
+        rows = self.rows()
+        if rows is None:
+            return super().get_choices(cutoff)
+        rows = rows if cutoff is None else rows[:cutoff]
+        return {self.to_representation(row): self.display_value(row) for row in rows}
+
+class ReferenceFieldsMixin:
+    """
+    ModelSerializer mixin making the relations to reference tables
+    ReferenceRelatedFields, validated without querying.
+    """
+    def build_relational_field(self, field_name, relation_info):
+        field_class, field_kwargs = super().build_relational_field(field_name, relation_info)
+        name = reference_name(relation_info.related_model)
+        if name is not None and field_class is self.serializer_related_field:
+            field_class, field_kwargs = ReferenceRelatedField, dict(field_kwargs, reference=name)
+        return field_class, field_kwargs
 
 class AttachmentSerializer(serializers.ModelSerializer):
     class Meta:
@@ -18,7 +90,7 @@ class BarberTypeSerializer(serializers.ModelSerializer):
         model = BarberType
         fields = '__all__'
 
-class BarberSerializer(serializers.ModelSerializer):
+class BarberSerializer(ReferenceFieldsMixin, serializers.ModelSerializer):
     user_email = serializers.ReadOnlyField(source='user.email')
 
     class Meta:
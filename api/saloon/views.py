@@ -1,5 +1,15 @@
-from rest_framework import viewsets, permissions
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.utils.dateparse import parse_date
+from saloon.analytics import TRUNCATE, get_barber_analytics
+from saloon.dashboard import get_dashboard
 from saloon.models import Salon, Barber, Client, BarberType, Attachment
+from saloon.ownership import get_salon_ownership
+from saloon.search import INDEXES, search, autocomplete
+from saloonservices.models import Hairstyle
+from api.saloonservices.serializers import HairstyleSerializer
 from .serializers import SalonSerializer, BarberSerializer, ClientSerializer, BarberTypeSerializer, AttachmentSerializer
 from .permissions import IsSalonOwner, IsSalonOwnerForRelatedObjects
 
@@ -18,6 +28,38 @@ class SalonViewSet(viewsets.ModelViewSet):
             return [permissions.IsAuthenticated()]
         return [permissions.IsAuthenticated(), IsSalonOwner()]
 
+    @action(detail=True)
+    def dashboard(self, request, pk=None):
+        """
+        Revenue, expenses, balances, top hairstyles, stock alerts and team
+        size of the salon. Sections listed in ``stale`` are being recomputed.
+        """
+        return Response(get_dashboard(self.get_object().pk))
+
+    @action(detail=True, url_path='barber-analytics')
+    def barber_analytics(self, request, pk=None):
+        """
+        Shaves, revenue, average ticket, consumable cost and payout ratio
+        of every barber per ``?period=`` (week or month) between ``?start=``
+        and ``?end=`` (the last twelve months by default).
+        """
+        salon = self.get_object()
+        period = request.query_params.get('period', 'month')
+        if period not in TRUNCATE:
+            return Response({'period': [f"Select one of: {', '.join(TRUNCATE)}."]}, status=status.HTTP_400_BAD_REQUEST)
+        dates = {}
+        for name in ('start', 'end'):
+            value = request.query_params.get(name)
+            try:
+                dates[name] = parse_date(value) if value else None
+            except ValueError:
+                dates[name] = None
+            if value and dates[name] is None:
+                return Response({name: ["Enter a valid date (YYYY-MM-DD)."]}, status=status.HTTP_400_BAD_REQUEST)
+        if dates['start'] and dates['end'] and dates['start'] > dates['end']:
+            return Response({'start': ["Start must not be after end."]}, status=status.HTTP_400_BAD_REQUEST)
+        return Response(get_barber_analytics(salon.pk, period, dates['start'], dates['end']))
+
 class BarberTypeViewSet(viewsets.ModelViewSet):
     serializer_class = BarberTypeSerializer
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForRelatedObjects]
@@ -32,9 +74,43 @@ class BarberTypeViewSet(viewsets.ModelViewSet):
 class BarberViewSet(viewsets.ModelViewSet):
     serializer_class = BarberSerializer
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForRelatedObjects]
+    # The longest range ?start= to ?end= the headcount covers
+    headcount_days = 366
 
     def get_queryset(self):
-        return Barber.objects.filter(salon__owner=self.request.user)
+        queryset = Barber.objects.filter(salon__owner=self.request.user)
+        employed_on = self.request.query_params.get('employed_on')
+        if employed_on:
+            day = self.parse_date(employed_on)
+            queryset = queryset.employed_on(day) if day else queryset.none()
+        return queryset
+
+    @staticmethod
+    def parse_date(value):
+        try:
+            return parse_date(value)
+        except ValueError:
+            return None
+
+    @action(detail=False)
+    def headcount(self, request):
+        """
+        Number of barbers employed on each day from ``?start=`` to ``?end=``
+        in the user's salons, or in ``?salon=``.
+        """
+        start, end = (self.parse_date(request.query_params.get(name) or '') for name in ('start', 'end'))
+        if start is None or end is None or not 0 <= (end - start).days < self.headcount_days:
+            return Response(
+                {'detail': f"Enter a start and end date (YYYY-MM-DD) at most {self.headcount_days} days apart."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        ownership = get_salon_ownership(request)
+        salon = request.query_params.get('salon')
+        if salon is not None and not ownership.owns(salon):
+            return Response({'salon': ["Select one of your salons."]}, status=status.HTTP_400_BAD_REQUEST)
+        salon_ids = [int(salon)] if salon is not None else ownership.salon_ids
+        counts = Barber.objects.filter(salon_id__in=salon_ids).headcount(start, end)
+        return Response({'results': [{'date': day, 'barbers': count} for day, count in counts.items()]})
 
 class ClientViewSet(viewsets.ModelViewSet):
     serializer_class = ClientSerializer
@@ -48,4 +124,51 @@ class AttachmentViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForRelatedObjects]
 
     def get_queryset(self):
-        return Attachment.objects.filter(salon__owner=self.request.user)
\ No newline at end of file
+        return Attachment.objects.filter(salon__owner=self.request.user)
+
+class SearchView(APIView):
+    """
+    Salons, clients or hairstyles (``?type=``) matching every word of
+    ``?q=``, best match first. Clients and hairstyles come from the user's
+    salons, or from ``?salon=``; salons are every active salon.
+    """
+    permission_classes = [permissions.IsAuthenticated]
+    limit = 25
+    serializers = {'salons': SalonSerializer, 'clients': ClientSerializer, 'hairstyles': HairstyleSerializer}
+
+    def get_queryset(self, kind):
+        if kind == 'salons':
+            return Salon.objects.filter(is_active=True).select_related('owner')
+        if kind == 'clients':
+            return Client.objects.select_related('user')
+        return Hairstyle.objects.prefetch_related('tariff_history')
+
+    def get(self, request):
+        kind = request.query_params.get('type')
+        if kind not in INDEXES:
+            return Response({'type': [f"Select one of: {', '.join(INDEXES)}."]}, status=status.HTTP_400_BAD_REQUEST)
+        salon_ids = None
+        if INDEXES[kind].scope:
+            ownership = get_salon_ownership(request)
+            salon = request.query_params.get('salon')
+            if salon is None:
+                salon_ids = sorted(ownership.salon_ids)
+            elif ownership.owns(salon):
+                salon_ids = [int(salon)]
+            else:
+                return Response({'salon': ["Select one of your salons."]}, status=status.HTTP_400_BAD_REQUEST)
+        return self.results(kind, request.query_params.get('q', ''), salon_ids)
+
+    def results(self, kind, query, salon_ids):
+        rows = search(kind, query, salon_ids, self.get_queryset(kind))[:self.limit]
+        return Response({'results': self.serializers[kind](rows, many=True).data})
+
+class AutocompleteView(SearchView):
+    """
+    Completions of ``?q=`` while it is typed: the id and label fields of
+    the best matches, each word matching as a prefix.
+    """
+    limit = 10
+
+    def results(self, kind, query, salon_ids):
+        return Response({'results': autocomplete(kind, query, salon_ids, self.get_queryset(kind), limit=self.limit)})
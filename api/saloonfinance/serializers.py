@@ -1,12 +1,18 @@
 from rest_framework import serializers
-from saloonfinance.models import Currency, CashRegister, PaymentType, Payment, Transaction
+from api.saloon.serializers import ReferenceFieldsMixin
+from saloonfinance.models import Currency, ExchangeRate, CashRegister, PaymentType, Payment, Transaction
 
 class CurrencySerializer(serializers.ModelSerializer):
     class Meta:
         model = Currency
         fields = '__all__'
 
-class CashRegisterSerializer(serializers.ModelSerializer):
+class ExchangeRateSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ExchangeRate
+        fields = '__all__'
+
+class CashRegisterSerializer(ReferenceFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = CashRegister
         fields = '__all__'
@@ -17,12 +23,13 @@ class PaymentTypeSerializer(serializers.ModelSerializer):
         model = PaymentType
         fields = '__all__'
 
-class PaymentSerializer(serializers.ModelSerializer):
+class PaymentSerializer(ReferenceFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Payment
         fields = '__all__'
 
-class TransactionSerializer(serializers.ModelSerializer):
+class TransactionSerializer(ReferenceFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = Transaction
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+        read_only_fields = ('shave', 'purchase', 'payment')
@@ -1,7 +1,8 @@
 from rest_framework import viewsets, permissions
-from saloonfinance.models import Currency, CashRegister, PaymentType, Payment, Transaction
-from .serializers import CurrencySerializer, CashRegisterSerializer, PaymentTypeSerializer, PaymentSerializer, TransactionSerializer
+from saloonfinance.models import Currency, ExchangeRate, CashRegister, PaymentType, Payment, Transaction
+from .serializers import CurrencySerializer, ExchangeRateSerializer, CashRegisterSerializer, PaymentTypeSerializer, PaymentSerializer, TransactionSerializer
 from .permissions import IsSalonOwnerForFinance
+from .pagination import KeysetPagination
 from saloon.models import Salon
 
 class CurrencyViewSet(viewsets.ReadOnlyModelViewSet):
@@ -9,9 +10,20 @@ class CurrencyViewSet(viewsets.ReadOnlyModelViewSet):
     serializer_class = CurrencySerializer
     permission_classes = [permissions.IsAuthenticated]
 
+class ExchangeRateViewSet(viewsets.ReadOnlyModelViewSet):
+    serializer_class = ExchangeRateSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = ExchangeRate.objects.order_by('currency_id', '-date')
+        currency = self.request.query_params.get('currency')
+        return queryset.filter(currency__code=currency) if currency else queryset
+
 class CashRegisterViewSet(viewsets.ModelViewSet):
     serializer_class = CashRegisterSerializer
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForFinance]
+    pagination_class = KeysetPagination
+    keyset_date_field = 'created_at'
 
     def get_queryset(self):
         return CashRegister.objects.filter(salon__owner=self.request.user)
@@ -28,6 +40,8 @@ class PaymentTypeViewSet(viewsets.ReadOnlyModelViewSet):
 class PaymentViewSet(viewsets.ModelViewSet):
     serializer_class = PaymentSerializer
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForFinance]
+    pagination_class = KeysetPagination
+    keyset_date_field = 'date_payment'
 
     def get_queryset(self):
         return Payment.objects.filter(salon__owner=self.request.user)
@@ -39,6 +53,8 @@ class PaymentViewSet(viewsets.ModelViewSet):
 class TransactionViewSet(viewsets.ModelViewSet):
     serializer_class = TransactionSerializer
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForFinance]
+    pagination_class = KeysetPagination
+    keyset_date_field = 'date_trans'
 
     def get_queryset(self):
         return Transaction.objects.filter(salon__owner=self.request.user)
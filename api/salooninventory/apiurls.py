@@ -1,6 +1,6 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ItemViewSet, ItemUsedViewSet, ItemPurchaseViewSet
+from .views import ItemViewSet, ItemUsedViewSet, ItemPurchaseViewSet, SalonDataImportView, InventoryReportView
 
 router = DefaultRouter()
 router.register(r'items', ItemViewSet, basename='item')
@@ -9,4 +9,6 @@ router.register(r'item-purchases', ItemPurchaseViewSet, basename='itempurchase')
 
 urlpatterns = [
     path('', include(router.urls)),
-]
\ No newline at end of file
+    path('import/<str:kind>/', SalonDataImportView.as_view(), name='salon_data_import'),
+    path('reports/inventory/', InventoryReportView.as_view(), name='inventory_report'),
+]
@@ -1,9 +1,9 @@
 from rest_framework import permissions
-from saloon.models import Salon
+from saloon.ownership import get_salon_ownership
 
 class IsSalonOwnerForInventory(permissions.BasePermission):
     def has_permission(self, request, view):
-        return Salon.objects.filter(owner=request.user).exists()
+        return get_salon_ownership(request).has_salon()
 
     def has_object_permission(self, request, view, obj):
-        return obj.salon.owner == request.user
\ No newline at end of file
+        return get_salon_ownership(request).owns_object(obj)
@@ -1,8 +1,16 @@
-from rest_framework import viewsets, permissions
+import io
+from django.core.exceptions import ValidationError
+from rest_framework import viewsets, permissions, status
+from rest_framework.parsers import MultiPartParser
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from salooninventory.imports import IMPORTERS
 from salooninventory.models import Item, ItemUsed, ItemPurchase
+from salooninventory.reports import get_inventory_report
 from .serializers import ItemSerializer, ItemUsedSerializer, ItemPurchaseSerializer
 from .permissions import IsSalonOwnerForInventory
 from saloon.models import Salon
+from saloon.ownership import get_salon_ownership
 
 class ItemViewSet(viewsets.ModelViewSet):
     serializer_class = ItemSerializer
@@ -35,4 +43,53 @@ class ItemPurchaseViewSet(viewsets.ModelViewSet):
 
     def perform_create(self, serializer):
         salon = Salon.objects.get(owner=self.request.user)
-        serializer.save(salon=salon)
\ No newline at end of file
+        serializer.save(salon=salon)
+
+class SalonDataImportView(APIView):
+    """
+    Upload a CSV of clients, items or item purchases for one of the user's
+    salons. Nothing is written unless every line is valid.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForInventory]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request, kind):
+        if kind not in IMPORTERS:
+            return Response({'detail': f"Unknown import '{kind}'."}, status=status.HTTP_404_NOT_FOUND)
+        if not get_salon_ownership(request).owns(request.data.get('salon')):
+            return Response({'salon': ["Select one of your salons."]}, status=status.HTTP_400_BAD_REQUEST)
+        upload = request.FILES.get('file')
+        if upload is None:
+            return Response({'file': ["No file was submitted."]}, status=status.HTTP_400_BAD_REQUEST)
+        salon = Salon.objects.get(pk=request.data['salon'])
+        lines = io.TextIOWrapper(upload.file, encoding='utf-8-sig', newline='')
+        try:
+            report = IMPORTERS[kind](salon).run(lines)
+        except ValidationError as e:
+            errors = e.message_dict if hasattr(e, 'error_dict') else {'file': e.messages}
+            return Response(errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(report.as_dict(), status=status.HTTP_201_CREATED)
+
+class InventoryReportView(APIView):
+    """
+    Valuation (FIFO and weighted average), daily consumption, days of stock
+    left and reorder points of every item of one of the user's salons.
+    ``?window=`` sets the days of consumption history and ``?lead_time=``
+    the days a reorder takes to arrive.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForInventory]
+    limits = {'window': (90, 7, 730), 'lead_time': (7, 1, 90)}
+
+    def get(self, request):
+        if not get_salon_ownership(request).owns(request.query_params.get('salon')):
+            return Response({'salon': ["Select one of your salons."]}, status=status.HTTP_400_BAD_REQUEST)
+        options = {}
+        for name, (default, lowest, highest) in self.limits.items():
+            try:
+                options[name] = int(request.query_params.get(name, default))
+            except ValueError:
+                options[name] = lowest - 1
+            if not lowest <= options[name] <= highest:
+                return Response({name: [f"Enter a number of days between {lowest} and {highest}."]}, status=status.HTTP_400_BAD_REQUEST)
+        report = get_inventory_report(int(request.query_params['salon']), options['window'], options['lead_time'])
+        return Response(report)
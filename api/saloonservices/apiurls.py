@@ -1,6 +1,7 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import HairstyleViewSet, HairstyleTariffHistoryViewSet, ShaveViewSet
+from .async_views import shave_list, salon_tariffs
+from .views import HairstyleViewSet, HairstyleTariffHistoryViewSet, ShaveViewSet, AvailabilityView
 
 router = DefaultRouter()
 router.register(r'hairstyles', HairstyleViewSet, basename='hairstyle')
@@ -9,4 +10,7 @@ router.register(r'shaves', ShaveViewSet, basename='shave')
 
 urlpatterns = [
     path('', include(router.urls)),
+    path('availability/', AvailabilityView.as_view(), name='availability'),
+    path('async/shaves/', shave_list, name='async_shave_list'),
+    path('async/salons/<int:salon_id>/tariffs/', salon_tariffs, name='async_salon_tariffs'),
 ]
\ No newline at end of file
@@ -0,0 +1,70 @@
+''' Async (ASGI) variants of the shave list and tariff lookups '''
+
+import asyncio
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from rest_framework.utils.urls import replace_query_param
+from saloonfinance.pagination import KeysetPaginator, InvalidCursor
+from saloonservices.models import Hairstyle, Shave
+from saloonservices.tariffs import aget_tariff_timeline
+from api.saloon.async_views import owner_required, json_response, not_found
+from .serializers import ShaveSerializer
+
+SHAVE_PAGE_SIZE = 25
+
+@owner_required
+async def shave_list(request, ownership):
+    """
+    Shaves of the user's salons (or of ``?salon=``), newest first, with the
+    same fields and keyset cursors as the finance lists.
+    """
+    queryset = Shave.objects.filter(salon_id__in=ownership.salon_ids)
+    salon_id = request.GET.get('salon')
+    if salon_id is not None:
+        if not ownership.owns(salon_id):
+            return json_response({'salon': ["Select one of your salons."]}, status=400)
+        queryset = queryset.filter(salon_id=salon_id)
+    paginator = KeysetPaginator(queryset.with_totals().annotate_tariff_at_shave_date(), 'date_shave', SHAVE_PAGE_SIZE)
+    try:
+        page = await paginator.apage(request.GET.get('cursor'))
+    except InvalidCursor:
+        return json_response({'detail': "Invalid cursor."}, status=404)
+
+    def link(cursor):
+        return replace_query_param(request.build_absolute_uri(), 'cursor', cursor) if cursor else None
+    return json_response({
+        'next': link(page.next_cursor),
+        'previous': link(page.previous_cursor),
+        'results': ShaveSerializer(page, many=True).data,
+    })
+
+@owner_required
+async def salon_tariffs(request, ownership, salon_id):
+    """
+    Tariff of every hairstyle of a salon at ``?at=`` (a date or datetime,
+    now by default), read from the cached tariff timeline.
+    """
+    if not ownership.owns(salon_id):
+        return not_found()
+    at = request.GET.get('at')
+    if at:
+        try:
+            at = parse_datetime(at) or parse_date(at)
+        except ValueError:
+            at = None
+        if at is None:
+            return json_response({'at': ["Enter a valid date or date/time."]}, status=400)
+    else:
+        at = timezone.now()
+
+    async def hairstyles():
+        return [row async for row in Hairstyle.objects.filter(salon_id=salon_id).order_by('name').values('id', 'name', 'current_tariff')]
+    rows, timeline = await asyncio.gather(hairstyles(), aget_tariff_timeline(salon_id))
+    return json_response({
+        'salon': salon_id,
+        'at': at.isoformat(),
+        'results': [
+            dict(row, tariff=timeline.tariff_at(row['id'], at, default=row['current_tariff']))
+            for row in rows
+        ],
+    })
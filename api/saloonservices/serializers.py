@@ -1,23 +1,51 @@
+from django.core.exceptions import ValidationError as DjangoValidationError
+from django.utils import timezone
 from rest_framework import serializers
+from api.saloon.serializers import ReferenceFieldsMixin
 from saloonservices.models import HairstyleTariffHistory, Hairstyle, Shave
+from saloonservices.scheduling import check_booking
 
 class HairstyleTariffHistorySerializer(serializers.ModelSerializer):
     class Meta:
         model = HairstyleTariffHistory
         fields = '__all__'
 
-class HairstyleSerializer(serializers.ModelSerializer):
+class HairstyleSerializer(ReferenceFieldsMixin, serializers.ModelSerializer):
     tariff_history = HairstyleTariffHistorySerializer(many=True, read_only=True)
 
     class Meta:
         model = Hairstyle
         fields = '__all__'
 
-class ShaveSerializer(serializers.ModelSerializer):
+class ShaveSerializer(ReferenceFieldsMixin, serializers.ModelSerializer):
     total_amount = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
     tariff_difference = serializers.DecimalField(max_digits=10, decimal_places=2, read_only=True)
 
     class Meta:
         model = Shave
         fields = '__all__'
-        read_only_fields = ('amount_in_default_currency',)
\ No newline at end of file
+        read_only_fields = ('amount_in_default_currency',)
+
+    def validate(self, attrs):
+        # Bookings must not overlap another busy shave of the barber
+        def current(name, default=None):
+            return attrs[name] if name in attrs else getattr(self.instance, name, default)
+
+        if current('status', Shave.Status.SCHEDULED) == Shave.Status.SCHEDULED:
+            minutes = current('duration') or current('hairstyle').duration
+            try:
+                check_booking(current('barber'), current('date_shave') or timezone.now(), minutes, exclude=getattr(self.instance, 'pk', None))
+            except DjangoValidationError as e:
+                raise serializers.ValidationError(e.message_dict)
+        return attrs
+
+class ShaveBulkSerializer(serializers.ModelSerializer):
+    barber = serializers.IntegerField(source='barber_id')
+    hairstyle = serializers.IntegerField(source='hairstyle_id')
+    cashregister = serializers.IntegerField(source='cashregister_id')
+    currency = serializers.IntegerField(source='currency_id', required=False)
+    client = serializers.IntegerField(source='client_id', required=False, allow_null=True)
+
+    class Meta:
+        model = Shave
+        fields = ('barber', 'hairstyle', 'amount', 'currency', 'exchange_rate', 'client', 'cashregister', 'date_shave', 'status')
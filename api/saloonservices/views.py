@@ -1,6 +1,14 @@
-from rest_framework import viewsets, permissions
+from django.core.exceptions import ValidationError
+from rest_framework import viewsets, permissions, status
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.views import APIView
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from saloonservices.models import HairstyleTariffHistory, Hairstyle, Shave
-from .serializers import HairstyleTariffHistorySerializer, HairstyleSerializer, ShaveSerializer
+from saloonservices.scheduling import SalonDay
+from saloon.ownership import get_salon_ownership
+from .serializers import HairstyleTariffHistorySerializer, HairstyleSerializer, ShaveSerializer, ShaveBulkSerializer
 from .permissions import IsSalonOwnerForServices
 from saloon.models import Salon
 
@@ -27,8 +35,66 @@ class ShaveViewSet(viewsets.ModelViewSet):
     permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForServices]
 
     def get_queryset(self):
-        return Shave.objects.filter(salon__owner=self.request.user)
+        return Shave.objects.filter(salon__owner=self.request.user).with_totals().annotate_tariff_at_shave_date()
 
     def perform_create(self, serializer):
         salon = Salon.objects.get(owner=self.request.user)
-        serializer.save(salon=salon)
\ No newline at end of file
+        serializer.save(salon=salon)
+
+    @action(detail=False, methods=['post'], url_path='bulk')
+    def bulk(self, request):
+        """
+        Record ``{"salon": <id>, "shaves": [...]}``, a batch of shaves of one
+        of the user's salons, all or nothing.
+        """
+        data = request.data if isinstance(request.data, dict) else {}
+        if not get_salon_ownership(request).owns(data.get('salon')):
+            return Response({'salon': ["Select one of your salons."]}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ShaveBulkSerializer(data=data.get('shaves'), many=True)
+        serializer.is_valid(raise_exception=True)
+        salon_id = int(data['salon'])
+        shaves = [Shave(salon_id=salon_id, **values) for values in serializer.validated_data]
+        try:
+            shaves = Shave.objects.bulk_record(shaves)
+        except ValidationError as e:
+            return Response(e.message_dict, status=status.HTTP_400_BAD_REQUEST)
+        return Response({'created': len(shaves), 'ids': [shave.pk for shave in shaves]}, status=status.HTTP_201_CREATED)
+
+class AvailabilityView(APIView):
+    """
+    The bookings, free time and open slots of every barber of ``?salon=``
+    (the user's first salon by default) on ``?date=`` (today by default).
+    Slots of ``?duration=`` minutes, or of ``?hairstyle=``'s duration, are
+    listed per barber with the ``?limit=`` earliest overall under ``next``.
+    """
+    permission_classes = [permissions.IsAuthenticated, IsSalonOwnerForServices]
+    max_duration = 24 * 60
+
+    def get(self, request):
+        params = request.query_params
+        ownership = get_salon_ownership(request)
+        salon = params.get('salon', ownership.first_salon_id)
+        if not ownership.owns(salon):
+            return Response({'salon': ["Select one of your salons."]}, status=status.HTTP_400_BAD_REQUEST)
+        salon_id = int(salon)
+        today = timezone.localdate()
+        try:
+            day = parse_date(params['date']) if params.get('date') else today
+        except ValueError:
+            day = None
+        if day is None:
+            return Response({'date': ["Enter a valid date (YYYY-MM-DD)."]}, status=status.HTTP_400_BAD_REQUEST)
+        minutes = None
+        if params.get('hairstyle'):
+            hairstyles = Hairstyle.objects.filter(salon_id=salon_id, pk=params['hairstyle']) if params['hairstyle'].isdigit() else Hairstyle.objects.none()
+            minutes = hairstyles.values_list('duration', flat=True).first()
+            if minutes is None:
+                return Response({'hairstyle': ["Select one of the salon's hairstyles."]}, status=status.HTTP_400_BAD_REQUEST)
+        elif params.get('duration'):
+            minutes = int(params['duration']) if params['duration'].isdigit() else 0
+            if not 0 < minutes <= self.max_duration:
+                return Response({'duration': [f"Enter a number of minutes from 1 to {self.max_duration}."]}, status=status.HTTP_400_BAD_REQUEST)
+        limit = params.get('limit', '5')
+        limit = int(limit) if limit.isdigit() else 5
+        not_before = timezone.now() if day == today else None
+        return Response(SalonDay.load(salon_id, day).as_dict(minutes, not_before, limit))
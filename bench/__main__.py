@@ -0,0 +1,72 @@
+"""
+Seed synthetic salons and benchmark the key flows, writing timings and
+query counts to JSON.
+
+    python -m bench --shaves 1000000 --output results.json
+    python -m bench --sqlite /tmp/bench.sqlite3 --keepdb --only api html
+    python -m bench --baseline previous.json --tolerance 0.25
+
+Without --sqlite the configured database (the local PostgreSQL) is used to
+create a throwaway test database. With --keepdb the seeded database is kept
+and reused by the next run.
+"""
+
+import argparse
+import json
+import logging
+import sys
+import time
+
+def parse_args():
+    from .seed import Scale
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    defaults = Scale()
+    for field in Scale.fields:
+        parser.add_argument(f"--{field.replace('_', '-')}", type=int, default=getattr(defaults, field))
+    parser.add_argument('--seed', type=int, default=0, help="Random seed of the generated data.")
+    parser.add_argument('--repeat', type=int, default=10, help="Timed runs per benchmark after one warm-up run.")
+    parser.add_argument('--only', nargs='+', help="Benchmark names or groups to run.")
+    parser.add_argument('--output', default='bench-results.json')
+    parser.add_argument('--baseline', help="Previous results file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.2, help="Allowed median slowdown against the baseline.")
+    parser.add_argument('--sqlite', help="Run against this SQLite file instead of the configured database.")
+    parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+    args = parser.parse_args()
+    args.scale = Scale(**{field: getattr(args, field) for field in Scale.fields})
+    return args
+
+def main():
+    args = parse_args()
+    from .runner import setup_django, bench_database, run_benchmarks, environment, write_results, compare
+    setup_django(args.sqlite)
+    # The per-request profiler logs every request the list benchmarks make
+    logging.getLogger('saloon.profiling').setLevel(logging.WARNING)
+    from . import flows
+    from .seed import seed, bench_salons
+
+    with bench_database(keepdb=args.keepdb):
+        report = environment(args.scale)
+        salon = bench_salons().first()
+        if salon is None:
+            started = time.monotonic()
+            salon = seed(args.scale, seed=args.seed, progress=print)[0]
+            report['seed_seconds'] = round(time.monotonic() - started, 1)
+        else:
+            print(f"reusing the data seeded in {salon.name}")
+        context = flows.BenchContext(salon)
+        report['results'] = run_benchmarks(
+            context, repeat=args.repeat, only=args.only,
+            progress=lambda name, result: print(f"{name:28} {result['median_ms']:10.2f}ms {result['queries']:4} queries"),
+        )
+    write_results(args.output, report)
+    print(f"results written to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare(json.load(baseline_file), report['results'], args.tolerance)
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        sys.exit(1 if regressions else 0)
+
+if __name__ == '__main__':
+    main()
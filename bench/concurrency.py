@@ -0,0 +1,160 @@
+"""
+Compare the throughput of the read endpoints under concurrent load when
+served by uvicorn (ASGI, async views run on the event loop) and by a
+threaded WSGI server (gunicorn when installed, else the stdlib server).
+
+    python -m bench.concurrency --sqlite /tmp/bench.sqlite3 --keepdb
+    python -m bench.concurrency --concurrency 64 --requests 2000 --output concurrency.json
+
+Both servers are started against the same seeded benchmark database and
+get the same requests, authenticated as the owner of the first bench salon.
+"""
+
+import argparse
+import asyncio
+import importlib.util
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+ENDPOINTS = {
+    'salon_search': '/api/saloon/async/salons/?search=Bench',
+    'dashboard': '/api/saloon/async/salons/{salon}/dashboard/',
+    'dashboard_sync_view': '/api/saloon/salons/{salon}/dashboard/',
+    'shave_list': '/api/services/async/shaves/?salon={salon}',
+    'tariffs': '/api/services/async/salons/{salon}/tariffs/',
+}
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def server_commands(port, threads):
+    asgi = [sys.executable, '-m', 'uvicorn', 'config.asgi:application', '--port', str(port), '--log-level', 'warning', '--no-access-log']
+    if importlib.util.find_spec('gunicorn'):
+        wsgi = ('gunicorn', [sys.executable, '-m', 'gunicorn', 'config.wsgi:application', '--bind', f'127.0.0.1:{port}', '--threads', str(threads), '--log-level', 'warning'])
+    else:
+        wsgi = ('wsgiref', [sys.executable, '-m', 'bench.wsgiserver', str(port)])
+    return {'asgi': ('uvicorn', asgi), 'wsgi': wsgi}
+
+def wait_for_port(port, process, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"server exited with code {process.returncode}")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.5).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f"server did not listen on port {port} within {timeout}s")
+
+async def fetch(port, path, cookie):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write((
+        f'GET {path} HTTP/1.1\r\nHost: 127.0.0.1\r\nCookie: sessionid={cookie}\r\n'
+        f'Accept: application/json\r\nConnection: close\r\n\r\n'
+    ).encode())
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return int(response.split(b' ', 2)[1])
+
+async def load(port, path, cookie, concurrency, requests):
+    """
+    Send ``requests`` GETs from ``concurrency`` concurrent clients and
+    return the throughput and latency percentiles.
+    """
+    latencies, errors, remaining = [], 0, requests
+
+    async def client():
+        nonlocal errors, remaining
+        while remaining > 0:
+            remaining -= 1
+            started = time.perf_counter()
+            try:
+                ok = await fetch(port, path, cookie) == 200
+            except OSError:
+                ok = False
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += not ok
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    return {
+        'requests': requests,
+        'errors': errors,
+        'requests_per_second': round(requests / elapsed, 1),
+        'p50_ms': round(statistics.median(latencies), 2),
+        'p99_ms': round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))], 2),
+    }
+
+def run_server(name, command, port, environ, paths, cookie, args, progress):
+    process = subprocess.Popen(command, env=environ)
+    try:
+        wait_for_port(port, process)
+        results = {}
+        for endpoint, path in paths.items():
+            # One warm-up round fills the per-process caches
+            asyncio.run(load(port, path, cookie, args.concurrency, args.concurrency))
+            results[endpoint] = asyncio.run(load(port, path, cookie, args.concurrency, args.requests))
+            progress(name, endpoint, results[endpoint])
+        return results
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0], formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+    parser.add_argument('--concurrency', type=int, default=32, help="Concurrent clients.")
+    parser.add_argument('--requests', type=int, default=500, help="Requests per endpoint and server.")
+    parser.add_argument('--only', nargs='+', choices=sorted(ENDPOINTS), help="Endpoints to load.")
+    parser.add_argument('--output', default='concurrency-results.json')
+    parser.add_argument('--sqlite', help="Run against this SQLite file instead of the configured database.")
+    parser.add_argument('--keepdb', action='store_true', help="Keep the seeded database for the next run.")
+    return parser.parse_args()
+
+def main():
+    args = parse_args()
+    if not importlib.util.find_spec('uvicorn'):
+        sys.exit("uvicorn is required: pip install uvicorn")
+    from .runner import setup_django, bench_database, environment, write_results
+    setup_django(args.sqlite)
+    from django.test import Client
+    from .seed import Scale, seed, bench_salons
+
+    with bench_database(keepdb=args.keepdb) as connection:
+        scale = Scale()
+        salon = bench_salons().first() or seed(scale, progress=print)[0]
+        browser = Client()
+        browser.force_login(salon.owner)
+        cookie = browser.cookies['sessionid'].value
+        database = {key: connection.settings_dict[key] for key in ('ENGINE', 'NAME', 'USER', 'PASSWORD', 'HOST', 'PORT') if connection.settings_dict.get(key)}
+        environ = dict(os.environ, DJANGO_SETTINGS_MODULE='bench.server_settings', BENCH_DATABASE=json.dumps(database))
+        paths = {name: path.format(salon=salon.pk) for name, path in ENDPOINTS.items() if not args.only or name in args.only}
+        report = dict(environment(scale), concurrency=args.concurrency, servers={}, results={})
+        # Close this process's connection so the servers have the database to themselves
+        connection.close()
+        for kind in ('asgi', 'wsgi'):
+            port = free_port()
+            name, command = server_commands(port, args.concurrency)[kind]
+            report['servers'][kind] = name
+            report['results'][kind] = run_server(
+                name, command, port, environ, paths, cookie, args,
+                progress=lambda server, endpoint, result: print(
+                    f"{server:8} {endpoint:20} {result['requests_per_second']:8.1f} req/s "
+                    f"p50 {result['p50_ms']:7.1f}ms p99 {result['p99_ms']:7.1f}ms {result['errors']} errors"
+                ),
+            )
+    write_results(args.output, report)
+    print(f"results written to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""
+Export benchmark: stream a large transaction ledger through the CSV export
+and check that resident memory stays under a fixed ceiling.
+
+    python -m bench.export_rss --rows 1000000
+
+Runs against a throwaway test database created from the configured one.
+"""
+
+import argparse
+import sys
+import time
+from .runner import setup_django, bench_database, current_rss
+from .seed import Scale, seed
+
+def run(rows, ceiling_mb, export_format):
+    from saloonfinance.models import Transaction
+    from saloonfinance.exports import streaming_export
+    from saloonfinance.views import TransactionExportView
+
+    started = time.monotonic()
+    scale = Scale(salons=1, barbers=1, clients=0, hairstyles=0, items=0, purchases=0, shaves=0, transactions=rows, days=1500)
+    salon, = seed(scale)
+    print(f"seeded {rows} rows in {time.monotonic() - started:.1f}s")
+
+    queryset = Transaction.objects.for_salon(salon).order_by('date_trans', 'pk')
+    baseline = peak = current_rss()
+    response = streaming_export(queryset, TransactionExportView.export_fields, export_format, 'bench')
+    started = time.monotonic()
+    first_byte = None
+    written = 0
+    for index, chunk in enumerate(response.streaming_content):
+        if first_byte is None:
+            first_byte = time.monotonic() - started
+        written += len(chunk)
+        if index % 50 == 0:
+            peak = max(peak, current_rss())
+    elapsed = time.monotonic() - started
+    growth_mb = (max(peak, current_rss()) - baseline) / 2 ** 20
+    print(f"exported {written / 2 ** 20:.1f} MiB in {elapsed:.1f}s, first byte after {first_byte * 1000:.1f}ms")
+    print(f"RSS growth while streaming: {growth_mb:.1f} MiB (ceiling {ceiling_mb} MiB)")
+    return growth_mb <= ceiling_mb
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=1000000)
+    parser.add_argument('--rss-ceiling', type=float, default=64, help="Allowed RSS growth in MiB.")
+    parser.add_argument('--format', choices=('csv', 'ndjson'), default='csv')
+    parser.add_argument('--sqlite', help="Run against this SQLite file instead of the configured database.")
+    args = parser.parse_args()
+
+    setup_django(args.sqlite)
+    with bench_database():
+        ok = run(args.rows, args.rss_ceiling, args.format)
+    sys.exit(0 if ok else 1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+''' The benchmarked flows: writes, aggregations, list views and API lists '''
+
+from datetime import timedelta
+from decimal import Decimal
+from django.db.models import Sum
+from django.db.models.functions import TruncMonth
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from .runner import benchmark
+
+class BenchContext:
+    """
+    The rows of one seeded salon that the flows read from and write to.
+    """
+    def __init__(self, salon):
+        self.salon = salon
+        self.owner = salon.owner
+        self.barber = salon.barbers.select_related('user').first()
+        self.hairstyle = salon.hairstyles.first()
+        self.cashregister = salon.cash_registers.first()
+        self.client = salon.clients.first()
+        self.items = list(salon.items.all())
+        self.http = Client()
+        self.http.force_login(self.owner)
+        self.api = APIRequestFactory()
+
+    def shave(self, **kwargs):
+        from saloonservices.models import Shave
+        return Shave(
+            barber=self.barber, hairstyle=self.hairstyle, amount=self.hairstyle.current_tariff,
+            client=self.client, cashregister=self.cashregister, salon=self.salon,
+            status=Shave.Status.COMPLETED, **kwargs
+        )
+
+    def get(self, url_name, **kwargs):
+        response = self.http.get(reverse(url_name, kwargs=kwargs))
+        assert response.status_code == 200, (url_name, response.status_code)
+        return response
+
+    def api_list(self, viewset):
+        request = self.api.get('/')
+        force_authenticate(request, user=self.owner)
+        response = viewset.as_view({'get': 'list'})(request)
+        response.render()
+        assert response.status_code == 200, (viewset.__name__, response.status_code)
+        return response
+
+@benchmark('shave_create', 'write')
+def shave_create(context):
+    context.shave().save()
+
+@benchmark('shave_bulk_record_50', 'write')
+def shave_bulk_record(context):
+    from saloonservices.models import Shave
+    Shave.objects.bulk_record([context.shave() for _ in range(50)])
+
+@benchmark('revenue_total', 'aggregate')
+def revenue_total(context):
+    from saloonservices.models import Shave
+    Shave.get_total_revenue(context.salon, timezone.now() - timedelta(days=365), timezone.now())
+
+@benchmark('revenue_by_month', 'aggregate')
+def revenue_by_month(context):
+    from saloonservices.models import Shave
+    list(
+        Shave.objects.for_salon(context.salon).completed().annotate(month=TruncMonth('date_shave'))
+        .values('month').annotate(total=Sum('amount_in_default_currency')).order_by('month')
+    )
+
+@benchmark('cashregister_income', 'aggregate')
+def cashregister_income(context):
+    context.cashregister.get_total_income() - context.cashregister.get_total_expenses()
+
+@benchmark('inventory_value', 'inventory')
+def inventory_value(context):
+    from salooninventory.models import get_total_inventory_value
+    get_total_inventory_value(context.salon)
+
+@benchmark('inventory_average_prices', 'inventory')
+def inventory_average_prices(context):
+    sum((item.get_average_purchase_price() for item in context.items), Decimal('0'))
+
+@benchmark('inventory_report', 'inventory')
+def inventory_report(context):
+    from salooninventory.reports import InventoryReport
+    InventoryReport(context.salon.pk).compute()
+
+@benchmark('salon_dashboard', 'api')
+def salon_dashboard(context):
+    from api.saloon.views import SalonViewSet
+    request = context.api.get('/')
+    force_authenticate(request, user=context.owner)
+    response = SalonViewSet.as_view({'get': 'dashboard'})(request, pk=context.salon.pk)
+    response.render()
+    assert response.status_code == 200, ('dashboard', response.status_code)
+
+@benchmark('salon_dashboard_refresh', 'aggregate')
+def salon_dashboard_refresh(context):
+    from saloon.dashboard import refresh_dashboard
+    refresh_dashboard(context.salon.pk)
+
+@benchmark('barber_analytics', 'aggregate')
+def barber_analytics(context):
+    from saloon.analytics import BarberAnalytics
+    BarberAnalytics(context.salon.pk, 'week').compute()
+
+@benchmark('client_autocomplete', 'api')
+def client_autocomplete(context):
+    from saloon.search import autocomplete
+    autocomplete('clients', 'client 1', [context.salon.pk])
+
+@benchmark('barber_list', 'html')
+def barber_list(context):
+    context.get('salon:barber_list', salon_id=context.salon.pk)
+
+@benchmark('client_list', 'html')
+def client_list(context):
+    context.get('salon:client_list', salon_id=context.salon.pk)
+
+@benchmark('transaction_list', 'html')
+def transaction_list(context):
+    context.get('saloonfinance:transaction_list', salon_id=context.salon.pk)
+
+@benchmark('payment_list', 'html')
+def payment_list(context):
+    context.get('saloonfinance:payment_list', salon_id=context.salon.pk)
+
+@benchmark('transaction_export', 'html')
+def transaction_export(context):
+    response = context.get('saloonfinance:transaction_export', salon_id=context.salon.pk)
+    for _ in response.streaming_content:
+        pass
+
+@benchmark('api_transaction_list', 'api')
+def api_transaction_list(context):
+    from api.saloonfinance.views import TransactionViewSet
+    context.api_list(TransactionViewSet)
+
+@benchmark('api_payment_list', 'api')
+def api_payment_list(context):
+    from api.saloonfinance.views import PaymentViewSet
+    context.api_list(PaymentViewSet)
+
+@benchmark('api_cashregister_list', 'api')
+def api_cashregister_list(context):
+    from api.saloonfinance.views import CashRegisterViewSet
+    context.api_list(CashRegisterViewSet)
+
+@benchmark('salon_form_init', 'forms')
+def salon_form_init(context):
+    from saloon.forms import SalonForm
+    SalonForm(instance=context.salon)
+
+@benchmark('barber_form_init', 'forms')
+def barber_form_init(context):
+    from saloon.forms import BarberForm
+    BarberForm(instance=context.barber)
+
+@benchmark('payment_form_init', 'forms')
+def payment_form_init(context):
+    from saloonfinance.forms import PaymentForm
+    PaymentForm()
+
+@benchmark('transaction_form_init', 'forms')
+def transaction_form_init(context):
+    from saloonfinance.forms import TransactionForm
+    TransactionForm()
+
+@benchmark('cashregister_form_init', 'forms')
+def cashregister_form_init(context):
+    from saloonfinance.forms import CashRegisterForm
+    CashRegisterForm(instance=context.cashregister)
@@ -0,0 +1,138 @@
+''' Timing and query-count harness shared by the benchmarks '''
+
+import json
+import os
+import platform
+import resource
+import statistics
+import subprocess
+import sys
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone as dt_timezone
+
+BENCHMARKS = {}
+
+def benchmark(name, group):
+    """
+    Register ``function(context)`` as the benchmark ``name``. ``group``
+    lets a run select related benchmarks with ``--only``.
+    """
+    def register(function):
+        BENCHMARKS[name] = (group, function)
+        return function
+    return register
+
+def setup_django(sqlite=None):
+    """
+    Configure Django from DJANGO_SETTINGS_MODULE (config.settings, i.e. the
+    local PostgreSQL, by default) or against the SQLite file ``sqlite``.
+    """
+    os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'config.settings')
+    from django.conf import settings
+    if sqlite:
+        settings.DATABASES = {'default': {'ENGINE': 'django.db.backends.sqlite3', 'NAME': sqlite, 'TEST': {'NAME': sqlite}}}
+    import django
+    django.setup()
+
+@contextmanager
+def bench_database(keepdb=False):
+    """
+    Run against a test database created next to the configured one, kept
+    between runs when ``keepdb`` is set so that a large seed is reused.
+    """
+    from django.db import connection
+    from django.test.utils import setup_test_environment, teardown_test_environment
+
+    setup_test_environment()
+    old_name = connection.creation.create_test_db(verbosity=0, keepdb=keepdb)
+    try:
+        yield connection
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0, keepdb=keepdb)
+        teardown_test_environment()
+
+def current_rss():
+    try:
+        with open('/proc/self/statm') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except OSError:
+        # ru_maxrss is the peak, in kilobytes on Linux and bytes on macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == 'darwin' else peak * 1024
+
+def measure(function, repeat):
+    """
+    Run ``function`` once to warm caches while profiling its queries, then
+    ``repeat`` more times for the timings.
+    """
+    from saloon.profiling import QueryProfile
+
+    profile = QueryProfile()
+    with profile.capture():
+        function()
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        'queries': profile.count,
+        'duplicated_queries': sum(count - 1 for count in profile.duplicates.values()),
+        'runs': repeat,
+        'min_ms': round(min(timings), 3),
+        'median_ms': round(statistics.median(timings), 3),
+        'mean_ms': round(statistics.fmean(timings), 3),
+        'max_ms': round(max(timings), 3),
+    }
+
+def run_benchmarks(context, repeat=10, only=None, progress=None):
+    results = {}
+    for name, (group, function) in BENCHMARKS.items():
+        if only and name not in only and group not in only:
+            continue
+        results[name] = dict(measure(lambda: function(context), repeat), group=group)
+        if progress:
+            progress(name, results[name])
+    return results
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment(scale):
+    import django
+    from django.db import connection
+    return {
+        'started_at': datetime.now(dt_timezone.utc).isoformat(timespec='seconds'),
+        'revision': git_revision(),
+        'database': connection.vendor,
+        'django': django.get_version(),
+        'python': platform.python_version(),
+        'scale': scale.as_dict(),
+    }
+
+def write_results(path, report):
+    with open(path, 'w') as results_file:
+        json.dump(report, results_file, indent=2, sort_keys=True)
+        results_file.write('\n')
+
+def compare(baseline, results, tolerance=0.2):
+    """
+    Return the benchmarks that got slower than ``baseline`` by more than
+    ``tolerance`` (a fraction of the median) or that run more queries.
+    """
+    regressions = []
+    for name, result in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous is None:
+            continue
+        if result['queries'] > previous['queries']:
+            regressions.append(f"{name}: {previous['queries']} -> {result['queries']} queries")
+        if result['median_ms'] > previous['median_ms'] * (1 + tolerance):
+            regressions.append(f"{name}: median {previous['median_ms']:.1f}ms -> {result['median_ms']:.1f}ms")
+    return regressions
@@ -0,0 +1,271 @@
+''' Deterministic synthetic salons for the benchmarks '''
+
+import random
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from itertools import count
+
+BENCH_SALON_PREFIX = 'Bench salon'
+CENT = Decimal('0.01')
+
+class Scale:
+    """
+    Row counts of one seeded salon. ``shaves`` and ``transactions`` are
+    spread over the last ``days`` days; every completed shave also gets its
+    income transaction and up to ``items_per_shave`` item usages.
+    """
+    fields = (
+        'salons', 'barbers', 'clients', 'hairstyles', 'tariff_changes', 'items',
+        'purchases', 'shaves', 'items_per_shave', 'transactions', 'days',
+    )
+
+    def __init__(self, salons=2, barbers=8, clients=200, hairstyles=12, tariff_changes=6, items=20,
+                 purchases=200, shaves=20000, items_per_shave=2, transactions=5000, days=730):
+        self.salons = salons
+        self.barbers = barbers
+        self.clients = clients
+        self.hairstyles = hairstyles
+        self.tariff_changes = tariff_changes
+        self.items = items
+        self.purchases = purchases
+        self.shaves = shaves
+        self.items_per_shave = items_per_shave
+        self.transactions = transactions
+        self.days = days
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.fields}
+
+    def __repr__(self):
+        return 'Scale(%s)' % ', '.join(f'{field}={value}' for field, value in self.as_dict().items())
+
+class SalonSeeder:
+    """
+    Bulk-insert the rows of ``scale.salons`` salons. Receivers do not run for
+    bulk inserts, so the cash register balances, the daily rollups and the
+    stock ledger are brought in line once at the end.
+    """
+    def __init__(self, scale, seed=0, batch_size=5000, today=None, progress=None):
+        self.scale = scale
+        self.random = random.Random(seed)
+        self.batch_size = batch_size
+        self.today = today or date.today()
+        self.progress = progress
+        self.balance_deltas = defaultdict(Decimal)
+        self.names = count()
+
+    def log(self, message):
+        if self.progress:
+            self.progress(message)
+
+    def random_day(self):
+        return self.today - timedelta(days=self.random.randrange(self.scale.days))
+
+    def random_moment(self):
+        moment = datetime.combine(self.random_day(), time(self.random.randrange(8, 20), self.random.randrange(60)))
+        return moment.replace(tzinfo=dt_timezone.utc)
+
+    def price(self, low, high):
+        return Decimal(self.random.randrange(low * 100, high * 100)) / 100
+
+    def bulk_create(self, model, objects):
+        return model.objects.bulk_create(objects, batch_size=self.batch_size)
+
+    def seed(self):
+        from django.contrib.auth.hashers import make_password
+        from saloonfinance.models import Currency
+        from saloonfinance.rollups import rebuild_rollups
+        from salooninventory.ledger import rebuild_stock_ledger
+
+        self.password = make_password('bench')
+        self.currency_id = Currency.get_default()
+        first = self.next_salon_number()
+        salons = [self.seed_salon(number) for number in range(first, first + self.scale.salons)]
+        self.apply_balances()
+        self.log("rebuilding rollups and the stock ledger")
+        rebuild_rollups(salon_ids=[salon.pk for salon in salons])
+        rebuild_stock_ledger(salon_ids=[salon.pk for salon in salons])
+        return salons
+
+    def next_salon_number(self):
+        from saloon.models import Salon
+        return Salon.objects.filter(name__startswith=BENCH_SALON_PREFIX).count()
+
+    def create_users(self, prefix, number):
+        from accounts.models import CustomUser
+        users = [
+            CustomUser(
+                email=f'{prefix}-{next(self.names)}@bench.example.com', first_name=prefix.capitalize(),
+                last_name='Bench', password=self.password,
+            )
+            for _ in range(number)
+        ]
+        return self.bulk_create(CustomUser, users)
+
+    def seed_salon(self, number):
+        from saloon.models import Salon, BarberType, Barber, Client
+        from saloonfinance.models import CashRegister
+
+        self.log(f"seeding {BENCH_SALON_PREFIX} {number}")
+        owner, = self.create_users('owner', 1)
+        salon = Salon.objects.create(name=f'{BENCH_SALON_PREFIX} {number}', owner=owner)
+        barber_types = self.bulk_create(BarberType, [
+            BarberType(name=name, salon=salon) for name in ('Senior', 'Junior')
+        ])
+        barbers = self.bulk_create(Barber, [
+            Barber(
+                user=user, salon=salon, barber_type=self.random.choice(barber_types),
+                start_date=self.today - timedelta(days=self.scale.days + self.random.randrange(365)),
+            )
+            for user in self.create_users('barber', self.scale.barbers)
+        ])
+        clients = self.bulk_create(Client, [
+            Client(name=f'Client {index}', salon=salon) for index in range(self.scale.clients)
+        ])
+        cashregisters = self.bulk_create(CashRegister, [
+            CashRegister(name=name, currency_id=self.currency_id, salon=salon) for name in ('Front desk', 'Back office')
+        ])
+        hairstyles, timelines = self.seed_hairstyles(salon)
+        items = self.seed_items(salon, cashregisters)
+        self.seed_shaves(salon, barbers, clients, cashregisters, hairstyles, timelines, items)
+        self.seed_transactions(salon, cashregisters)
+        self.seed_payments(salon, barbers, cashregisters)
+        return salon
+
+    def seed_hairstyles(self, salon):
+        from saloonservices.models import Hairstyle, HairstyleTariffHistory
+
+        first_day = self.today - timedelta(days=self.scale.days)
+        timelines = []
+        for index in range(self.scale.hairstyles):
+            tariff = self.price(5, 40)
+            timeline = []
+            for change in range(self.scale.tariff_changes):
+                effective_date = first_day + timedelta(days=change * self.scale.days // self.scale.tariff_changes)
+                timeline.append((datetime.combine(effective_date, time()).replace(tzinfo=dt_timezone.utc), tariff))
+                tariff = (tariff * Decimal(self.random.uniform(1.0, 1.15))).quantize(CENT)
+            timelines.append(timeline)
+        hairstyles = self.bulk_create(Hairstyle, [
+            Hairstyle(name=f'Hairstyle {index}', current_tariff=timeline[-1][1], currency_id=self.currency_id, salon=salon)
+            for index, timeline in enumerate(timelines)
+        ])
+        self.bulk_create(HairstyleTariffHistory, [
+            HairstyleTariffHistory(hairstyle=hairstyle, tariff=tariff, effective_date=effective_date)
+            for hairstyle, timeline in zip(hairstyles, timelines)
+            for effective_date, tariff in timeline
+        ])
+        return hairstyles, timelines
+
+    def seed_items(self, salon, cashregisters):
+        from saloonfinance.models import Transaction
+        from salooninventory.models import Item, ItemPurchase
+
+        uses_per_item = self.scale.shaves * self.scale.items_per_shave // max(self.scale.items, 1) + 1
+        items = []
+        for index in range(self.scale.items):
+            price = self.price(1, 30)
+            items.append(Item(
+                name=f'Item {index}', price=price, amount_in_default_currency=price,
+                currency_id=self.currency_id, salon=salon, current_stock=uses_per_item * 2,
+            ))
+        items = self.bulk_create(Item, items)
+        purchases = []
+        for _ in range(self.scale.purchases if items else 0):
+            purchase_price = self.price(1, 20)
+            purchases.append(ItemPurchase(
+                item=self.random.choice(items), quantity=self.random.randrange(1, 50), purchase_price=purchase_price,
+                currency_id=self.currency_id, purchase_price_in_default_currency=purchase_price,
+                purchase_date=self.random_day(), supplier='Bench supplies',
+                cashregister=self.random.choice(cashregisters), salon=salon,
+            ))
+        purchases = self.bulk_create(ItemPurchase, purchases)
+        transactions = [purchase.build_transaction() for purchase in purchases]
+        for ledger_transaction in transactions:
+            self.balance_deltas[ledger_transaction.cashregister_id] -= ledger_transaction.amount
+        self.bulk_create(Transaction, transactions)
+        return items
+
+    def seed_shaves(self, salon, barbers, clients, cashregisters, hairstyles, timelines, items):
+        from saloonfinance.models import Transaction
+        from saloonservices.models import Shave
+        from salooninventory.models import ItemUsed
+
+        statuses = [Shave.Status.COMPLETED] * 18 + [Shave.Status.SCHEDULED, Shave.Status.CANCELLED]
+        for start in range(0, self.scale.shaves, self.batch_size):
+            shaves = []
+            for _ in range(start, min(start + self.batch_size, self.scale.shaves)):
+                index = self.random.randrange(len(hairstyles))
+                moment = self.random_moment()
+                tariff = next((tariff for effective_date, tariff in reversed(timelines[index]) if effective_date <= moment), timelines[index][0][1])
+                amount = tariff + self.random.choice((0, 0, 0, 1, 2, 5))
+                shaves.append(Shave(
+                    barber=self.random.choice(barbers), hairstyle=hairstyles[index], amount=amount,
+                    currency_id=self.currency_id, amount_in_default_currency=amount,
+                    client=self.random.choice(clients) if clients and self.random.random() < 0.7 else None,
+                    cashregister=self.random.choice(cashregisters), date_shave=moment, salon=salon,
+                    status=self.random.choice(statuses),
+                ))
+            shaves = self.bulk_create(Shave, shaves)
+            completed = [shave for shave in shaves if shave.status == Shave.Status.COMPLETED]
+            transactions = [shave.build_transaction() for shave in completed]
+            for ledger_transaction in transactions:
+                self.balance_deltas[ledger_transaction.cashregister_id] += ledger_transaction.amount
+            self.bulk_create(Transaction, transactions)
+            self.bulk_create(ItemUsed, [
+                ItemUsed(item=item, shave=shave, barber=shave.barber, quantity=self.random.randrange(1, 3), salon=salon)
+                for shave in completed
+                for item in self.random.sample(items, min(self.random.randrange(self.scale.items_per_shave + 1), len(items)))
+            ])
+            self.log(f"  {start + len(shaves)}/{self.scale.shaves} shaves")
+
+    def seed_transactions(self, salon, cashregisters):
+        from saloonfinance.models import Transaction
+
+        for start in range(0, self.scale.transactions, self.batch_size):
+            transactions = []
+            for index in range(start, min(start + self.batch_size, self.scale.transactions)):
+                trans_type = self.random.choice(Transaction.TransactionType.values)
+                amount = self.price(5, 500)
+                cashregister = self.random.choice(cashregisters)
+                transactions.append(Transaction(
+                    trans_name=f'{trans_type.title()} {index}', amount=amount, currency_id=self.currency_id,
+                    amount_in_default_currency=amount, date_trans=self.random_day(), trans_type=trans_type,
+                    cashregister=cashregister, salon=salon,
+                ))
+                self.balance_deltas[cashregister.pk] += amount if trans_type == Transaction.TransactionType.INCOME else -amount
+            self.bulk_create(Transaction, transactions)
+            self.log(f"  {start + len(transactions)}/{self.scale.transactions} transactions")
+
+    def seed_payments(self, salon, barbers, cashregisters):
+        from saloonfinance.models import Payment, Transaction
+
+        payments = []
+        for barber in barbers:
+            for month in range(self.scale.days // 30):
+                end_date = self.today - timedelta(days=30 * month)
+                amount = self.price(200, 600)
+                payments.append(Payment(
+                    barber=barber, amount=amount, currency_id=self.currency_id, amount_in_default_currency=amount,
+                    start_date=end_date - timedelta(days=29), end_date=end_date, date_payment=end_date,
+                    cashregister=cashregisters[0], salon=salon,
+                ))
+                self.balance_deltas[cashregisters[0].pk] -= amount
+        payments = self.bulk_create(Payment, payments)
+        self.bulk_create(Transaction, [payment.build_transaction() for payment in payments])
+
+    def apply_balances(self):
+        from saloonfinance.balances import apply_balance_deltas
+        apply_balance_deltas({pk: delta.quantize(CENT) for pk, delta in self.balance_deltas.items()})
+        self.balance_deltas.clear()
+
+def seed(scale=None, seed=0, batch_size=5000, progress=None):
+    """
+    Seed ``scale`` (a Scale) into the default database and return the new
+    salons. The same ``seed`` always produces the same rows.
+    """
+    return SalonSeeder(scale or Scale(), seed=seed, batch_size=batch_size, progress=progress).seed()
+
+def bench_salons():
+    from saloon.models import Salon
+    return Salon.objects.filter(name__startswith=BENCH_SALON_PREFIX).select_related('owner').order_by('pk')
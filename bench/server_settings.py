@@ -0,0 +1,13 @@
+''' Settings of the servers started by bench.concurrency '''
+
+import json
+import os
+from config.settings import *  # noqa: F401,F403
+from config.settings import LOGGING
+
+ROOT_URLCONF = 'bench.urls'
+DEBUG = False
+ALLOWED_HOSTS = ['*']
+# The benchmark database, passed by the process that seeded it
+DATABASES = {'default': json.loads(os.environ['BENCH_DATABASE'])}
+LOGGING['loggers']['saloon.profiling']['level'] = 'WARNING'
@@ -0,0 +1,9 @@
+''' URLs of the benchmark servers: the site plus the API apps it exercises '''
+
+from django.urls import path, include
+
+urlpatterns = [
+    path('api/saloon/', include('api.saloon.apiurls')),
+    path('api/services/', include('api.saloonservices.apiurls')),
+    path('', include('config.urls')),
+]
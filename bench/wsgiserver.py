@@ -0,0 +1,20 @@
+''' A threaded stdlib WSGI server, used by bench.concurrency when gunicorn is not installed '''
+
+import sys
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+    request_queue_size = 1024
+
+class QuietHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+def main():
+    from config.wsgi import application
+    make_server('127.0.0.1', int(sys.argv[1]), application, ThreadingWSGIServer, QuietHandler).serve_forever()
+
+if __name__ == '__main__':
+    main()
@@ -10,6 +10,8 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
+import sys
 from pathlib import Path
 from django.utils.translation import gettext_lazy as _
 
@@ -28,6 +30,8 @@ DEBUG = True
 
 ALLOWED_HOSTS = []
 
+TESTING = len(sys.argv) > 1 and sys.argv[1] == 'test'
+
 
 # Application definition
 
@@ -49,11 +53,13 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     #'corsheaders.middleware.CorsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'saloon.middleware.QueryProfilerMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.locale.LocaleMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'saloon.middleware.SalonOwnershipMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -95,6 +101,23 @@ DATABASES = {
 }
 
 
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Cached lookups (default currency, exchange rates, tariffs, dashboards,
+# ownership, reference tables) are invalidated by bumping versions in this
+# cache, which only reaches every worker when the backend is shared. Set
+# CACHE_BACKEND and CACHE_LOCATION when running several workers, e.g.
+# django.core.cache.backends.redis.RedisCache and redis://127.0.0.1:6379/1.
+# The process-local default suits a single worker, development and tests.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.environ.get('CACHE_LOCATION', ''),
+    }
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
@@ -149,6 +172,54 @@ AUTH_USER_MODEL = 'accounts.CustomUser'
 LOGIN_REDIRECT_URL = '/'
 LOGOUT_REDIRECT_URL = '/'
 
+# Query budgets per URL name, checked by saloon.middleware.QueryProfilerMiddleware.
+# Over-budget requests are logged, and raise under the test runner.
+
+QUERY_BUDGETS = {
+    'salon:salon_detail': 5,
+    'salon:barber_list': 6,
+    'salon:client_list': 6,
+    'salon:barber_type_list': 6,
+    'saloonfinance:cashregister_list': 5,
+    'saloonfinance:payment_list': 5,
+    'saloonfinance:transaction_list': 5,
+}
+QUERY_BUDGET_ENFORCE = TESTING
+
+# Salon dashboards (saloon.dashboard): items at or below this stock are
+# alerted on, and stale sections are recomputed in a background thread
+# except under the test runner.
+
+DASHBOARD_LOW_STOCK_THRESHOLD = 5
+DASHBOARD_REFRESH_IN_BACKGROUND = not TESTING
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'json': {
+            '()': 'saloon.log.JsonFormatter',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'json',
+        },
+    },
+    'root': {
+        'handlers': ['console'],
+        'level': 'WARNING',
+    },
+    'loggers': {
+        'saloon.profiling': {
+            'handlers': ['console'],
+            'level': 'WARNING' if TESTING else 'INFO',
+            'propagate': False,
+        },
+    },
+}
+
 #CRISPY_ALLOWED_TEMPLATE_PACKS = "bootstrap5"
 #CRISPY_TEMPLATE_PACK = "bootstrap5"
 
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from .ownership import get_salon_ownership
 from .models import Salon, Barber, Client
 
 class SalonAdmin(admin.ModelAdmin):
@@ -18,12 +19,12 @@ class SalonAdmin(admin.ModelAdmin):
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Salon, SalonAdmin)
 
@@ -36,20 +37,20 @@ class BarberAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return Salon.objects.filter(owner=request.user).exists() or request.user.is_superuser
+        return get_salon_ownership(request).has_salon() or request.user.is_superuser
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Barber, BarberAdmin)
 
@@ -62,19 +63,19 @@ class ClientAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return Salon.objects.filter(owner=request.user).exists() or request.user.is_superuser
+        return get_salon_ownership(request).has_salon() or request.user.is_superuser
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Client, ClientAdmin)
@@ -0,0 +1,164 @@
+''' Per-barber performance of a salon from grouped queries over shaves, payments and item usage '''
+
+from datetime import timedelta
+from decimal import Decimal
+from django.apps import apps
+from django.core.cache import cache
+from django.db.models import Count, DateField, DecimalField, ExpressionWrapper, F, Func, Sum, Window
+from django.db.models.functions import Rank, TruncMonth, TruncWeek
+from django.utils import timezone
+from .dashboard import section_versions, start_of
+
+ANALYTICS_KEY = 'saloon:barber_analytics:{salon_id}:{versions}:{period}:{start}:{end}'
+ANALYTICS_TIMEOUT = 60 * 60
+# The dashboard sections whose changes can alter the analytics
+ANALYTICS_SECTIONS = ('finance', 'stock', 'team')
+TRUNCATE = {'week': TruncWeek, 'month': TruncMonth}
+CENT = Decimal('0.01')
+# Metrics added up over the periods for a barber's totals
+SUMMED = ('shaves', 'revenue', 'items_used', 'consumable_cost', 'payout')
+
+class WindowSum(Func):
+    """
+    SUM() over a window of grouped rows, e.g. of a ``Sum`` aggregate,
+    which Django's own ``Sum`` refuses to nest.
+    """
+    function = 'SUM'
+    window_compatible = True
+
+def money(value):
+    return (value or Decimal('0')).quantize(CENT)
+
+def ratio(part, whole, places=4):
+    return round(float(part / whole), places) if whole else None
+
+class BarberAnalytics:
+    """
+    Throughput, revenue, average ticket, consumable cost and payout ratio
+    of every barber of a salon per week or month between ``start`` and
+    ``end``. Each source is one grouped query over all barbers, so the
+    query count does not depend on their number; revenue ranks, shares and
+    running totals come from window functions over the groups.
+    """
+    def __init__(self, salon_id, period='month', start=None, end=None):
+        self.salon_id = salon_id
+        self.period = period
+        self.end = end or timezone.localdate()
+        self.start = start or (self.end - timedelta(days=365)).replace(day=1)
+
+    def bucket(self, field):
+        return TRUNCATE[self.period](field, output_field=DateField())
+
+    def shaves(self):
+        Shave = apps.get_model('saloonservices', 'Shave')
+        revenue = Sum('amount_in_default_currency')
+        return Shave.objects.for_salon(self.salon_id).completed().filter(
+            date_shave__gte=start_of(self.start), date_shave__lt=start_of(self.end + timedelta(days=1)),
+        ).annotate(bucket=self.bucket('date_shave')).values('barber_id', 'bucket').annotate(
+            shaves=Count('id'), revenue=revenue,
+        ).annotate(
+            # Added after the aggregates so that they are not grouped by
+            revenue_rank=Window(Rank(), partition_by=F('bucket'), order_by=revenue.desc()),
+            bucket_revenue=Window(WindowSum(revenue), partition_by=F('bucket')),
+            running_revenue=Window(WindowSum(revenue), partition_by=F('barber_id'), order_by=F('bucket').asc()),
+        ).order_by()
+
+    def consumables(self):
+        ItemUsed = apps.get_model('salooninventory', 'ItemUsed')
+        # Consumables are valued at the item's current weighted average cost
+        cost = ExpressionWrapper(F('quantity') * F('item__average_cost'), output_field=DecimalField(max_digits=19, decimal_places=6))
+        return ItemUsed.objects.filter(
+            salon_id=self.salon_id, shave__date_shave__gte=start_of(self.start),
+            shave__date_shave__lt=start_of(self.end + timedelta(days=1)),
+        ).annotate(bucket=self.bucket('shave__date_shave')).values('barber_id', 'bucket').annotate(
+            items=Sum('quantity'), cost=Sum(cost),
+        ).order_by()
+
+    def payouts(self):
+        Payment = apps.get_model('saloonfinance', 'Payment')
+        return Payment.objects.for_salon(self.salon_id).between(self.start, self.end).annotate(
+            bucket=self.bucket('date_payment'),
+        ).values('barber_id', 'bucket').annotate(payout=Sum('amount_in_default_currency')).order_by()
+
+    def barbers(self):
+        Barber = apps.get_model('saloon', 'Barber')
+        return Barber.objects.filter(salon_id=self.salon_id).values_list(
+            'id', 'user__first_name', 'user__last_name', 'user__email', 'is_active',
+        )
+
+    def compute(self):
+        # Per barber, the metrics of each bucket it has any activity in
+        buckets = {}
+
+        def row(barber_id, bucket):
+            return buckets.setdefault(barber_id, {}).setdefault(bucket, {
+                'shaves': 0, 'revenue': Decimal('0'), 'revenue_rank': None, 'revenue_share': None,
+                'running_revenue': None, 'items_used': 0, 'consumable_cost': Decimal('0'), 'payout': Decimal('0'),
+            })
+
+        for entry in self.shaves():
+            row(entry['barber_id'], entry['bucket']).update(
+                shaves=entry['shaves'], revenue=entry['revenue'], revenue_rank=entry['revenue_rank'],
+                revenue_share=ratio(entry['revenue'], entry['bucket_revenue']), running_revenue=money(entry['running_revenue']),
+            )
+        for entry in self.consumables():
+            row(entry['barber_id'], entry['bucket']).update(items_used=entry['items'], consumable_cost=entry['cost'])
+        for entry in self.payouts():
+            row(entry['barber_id'], entry['bucket'])['payout'] = entry['payout']
+
+        barbers = []
+        for barber_id, first_name, last_name, email, is_active in self.barbers():
+            periods = buckets.get(barber_id, {})
+            totals = {name: sum(values[name] for values in periods.values()) for name in SUMMED}
+            barbers.append({
+                'id': barber_id,
+                'name': f'{first_name} {last_name}'.strip() or email,
+                'is_active': is_active,
+                'totals': self.describe(totals),
+                'periods': [dict(self.describe(periods[bucket]), start=bucket.isoformat()) for bucket in sorted(periods)],
+            })
+        barbers.sort(key=lambda barber: barber['totals']['revenue'], reverse=True)
+        return {
+            'salon': self.salon_id,
+            'period': self.period,
+            'start': self.start.isoformat(),
+            'end': self.end.isoformat(),
+            'barbers': barbers,
+        }
+
+    @staticmethod
+    def describe(values):
+        revenue = money(values['revenue'])
+        payout = money(values['payout'])
+        described = {
+            'shaves': values['shaves'],
+            'revenue': revenue,
+            'average_ticket': money(revenue / values['shaves']) if values['shaves'] else None,
+            'items_used': values['items_used'],
+            'consumable_cost': money(values['consumable_cost']),
+            'payout': payout,
+            'payout_ratio': ratio(payout, revenue),
+        }
+        for name in ('revenue_rank', 'revenue_share', 'running_revenue'):
+            if name in values:
+                described[name] = values[name]
+        return described
+
+def get_barber_analytics(salon_id, period='month', start=None, end=None):
+    """
+    Return the analytics of a salon from the cache, computing them on a
+    miss. The key carries the versions of the salon's finance, stock and
+    team dashboard sections, so any change to shaves, payments, item usage
+    or barbers makes the next call recompute.
+    """
+    analytics = BarberAnalytics(salon_id, period, start, end)
+    versions = section_versions(salon_id, ANALYTICS_SECTIONS)
+    key = ANALYTICS_KEY.format(
+        salon_id=salon_id, versions=':'.join(versions[name] for name in ANALYTICS_SECTIONS),
+        period=period, start=analytics.start.isoformat(), end=analytics.end.isoformat(),
+    )
+    result = cache.get(key)
+    if result is None:
+        result = analytics.compute()
+        cache.set(key, result, ANALYTICS_TIMEOUT)
+    return result
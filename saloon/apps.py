@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class SaloonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'saloon'
+
+    def ready(self):
+        from . import checks  # noqa: F401
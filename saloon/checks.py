@@ -0,0 +1,23 @@
+''' System checks of the deployment settings the cached lookups rely on '''
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """
+    Warn when the default cache is private to each process: invalidations
+    then only reach the worker that made the change.
+    """
+    if settings.CACHES.get('default', {}).get('BACKEND') in PROCESS_LOCAL_CACHES:
+        return [Warning(
+            "The default cache is local to each process, so cache invalidations do not reach other workers.",
+            hint="Set CACHE_BACKEND and CACHE_LOCATION to a shared cache when running several workers.",
+            id='saloon.W001',
+        )]
+    return []
@@ -0,0 +1,246 @@
+''' Per-salon dashboard KPIs, cached per section and refreshed in the background when stale '''
+
+import asyncio
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from asgiref.sync import sync_to_async
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections, transaction
+from django.db.models import Count, DecimalField, ExpressionWrapper, F, Q, Sum
+from django.utils import timezone
+
+DASHBOARD_VERSION_KEY = 'saloon:dashboard_version:{salon_id}:{section}'
+DASHBOARD_KEY = 'saloon:dashboard:{salon_id}:{section}:{day}'
+DASHBOARD_REFRESH_KEY = 'saloon:dashboard_refresh:{salon_id}:{section}'
+# Sections older than this are served but recomputed, even if nothing changed
+DASHBOARD_MAX_AGE = 5 * 60
+# How long a stale section may still be served while it is being recomputed
+DASHBOARD_TIMEOUT = 24 * 60 * 60
+# How long one refresh may hold a section before another may start
+DASHBOARD_REFRESH_TIMEOUT = 60
+TOP_HAIRSTYLES = 5
+LOW_STOCK_ITEMS = 10
+
+SECTIONS = {}
+
+def section(name):
+    """
+    Register ``function(salon_id, today)`` as a dashboard section. Each
+    section runs a fixed number of grouped queries and is cached and
+    invalidated on its own.
+    """
+    def register(function):
+        SECTIONS[name] = function
+        return function
+    return register
+
+def money(value):
+    return value or Decimal('0.00')
+
+def periods(today):
+    # Each period runs from its first day up to today
+    return {'today': today, 'month': today.replace(day=1), 'last_30_days': today - timedelta(days=29)}
+
+def start_of(day):
+    moment = datetime.combine(day, datetime.min.time())
+    return timezone.make_aware(moment) if settings.USE_TZ else moment
+
+@section('finance')
+def finance_section(salon_id, today):
+    DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+    Payment = apps.get_model('saloonfinance', 'Payment')
+    starts = periods(today)
+    first_day = min(starts.values())
+    rollups = DailyFinanceRollup.objects.filter(salon_id=salon_id, date__range=(first_day, today)).values('trans_type').annotate(
+        **{f'{period}_amount': Sum('amount_in_default_currency', filter=Q(date__gte=start)) for period, start in starts.items()},
+        **{f'{period}_count': Sum('count', filter=Q(date__gte=start)) for period, start in starts.items()},
+    ).order_by()
+    totals = {row['trans_type']: row for row in rollups}
+    payroll = Payment.objects.filter(salon_id=salon_id, date_payment__range=(first_day, today)).aggregate(**{
+        period: Sum('amount_in_default_currency', filter=Q(date_payment__gte=start)) for period, start in starts.items()
+    })
+
+    result = {}
+    for period in starts:
+        amounts = {trans_type: money(totals.get(trans_type, {}).get(f'{period}_amount')) for trans_type in DailyFinanceRollup.RollupType.values}
+        # Payments are posted as expense transactions; payroll is shown apart
+        income, expenses, salaries = amounts['INCOME'], amounts['EXPENSE'], money(payroll[period])
+        result[period] = {
+            'shave_revenue': amounts['SHAVE'],
+            'shaves': totals.get('SHAVE', {}).get(f'{period}_count') or 0,
+            'income': income,
+            'expenses': expenses - salaries,
+            'payroll': salaries,
+            'net': income - expenses,
+        }
+    return result
+
+@section('balances')
+def balances_section(salon_id, today):
+    CashRegister = apps.get_model('saloonfinance', 'CashRegister')
+    registers = list(CashRegister.objects.filter(salon_id=salon_id).order_by('name').values('id', 'name', 'balance', currency_code=F('currency__code')))
+    totals = {}
+    for register in registers:
+        totals[register['currency_code']] = totals.get(register['currency_code'], Decimal('0.00')) + register['balance']
+    return {'cash_registers': registers, 'totals': totals}
+
+@section('hairstyles')
+def hairstyles_section(salon_id, today):
+    Shave = apps.get_model('saloonservices', 'Shave')
+    since = start_of(periods(today)['last_30_days'])
+    top = Shave.objects.filter(salon_id=salon_id, status=Shave.Status.COMPLETED, date_shave__gte=since).values(
+        'hairstyle_id', name=F('hairstyle__name')
+    ).annotate(shaves=Count('id'), revenue=Sum('amount_in_default_currency')).order_by('-shaves', '-revenue', 'hairstyle_id')[:TOP_HAIRSTYLES]
+    return {'last_30_days': list(top)}
+
+@section('stock')
+def stock_section(salon_id, today):
+    Item = apps.get_model('salooninventory', 'Item')
+    threshold = settings.DASHBOARD_LOW_STOCK_THRESHOLD
+    items = Item.objects.filter(salon_id=salon_id)
+    value = ExpressionWrapper(F('current_stock') * F('amount_in_default_currency'), output_field=DecimalField(max_digits=19, decimal_places=2))
+    summary = items.aggregate(
+        items=Count('id'),
+        low_stock=Count('id', filter=Q(current_stock__lte=threshold)),
+        out_of_stock=Count('id', filter=Q(current_stock=0)),
+        retail_value=Sum(value),
+    )
+    low = items.filter(current_stock__lte=threshold).order_by('current_stock', 'name').values('id', 'name', 'current_stock')[:LOW_STOCK_ITEMS]
+    return dict(summary, retail_value=money(summary['retail_value']), low_stock_threshold=threshold, alerts=list(low))
+
+@section('team')
+def team_section(salon_id, today):
+    Barber = apps.get_model('saloon', 'Barber')
+    Client = apps.get_model('saloon', 'Client')
+    current = Barber.objects.employed_filter(today)
+    barbers = Barber.objects.filter(salon_id=salon_id).aggregate(barbers=Count('id'), active_barbers=Count('id', filter=current))
+    return dict(barbers, clients=Client.objects.filter(salon_id=salon_id).count())
+
+def section_versions(salon_id, names):
+    keys = {name: DASHBOARD_VERSION_KEY.format(salon_id=salon_id, section=name) for name in names}
+    stored = cache.get_many(keys.values())
+    versions, missing = {}, {}
+    for name, key in keys.items():
+        versions[name] = stored.get(key)
+        if versions[name] is None:
+            versions[name] = missing[key] = uuid.uuid4().hex
+    if missing:
+        cache.set_many(missing, None)
+    return versions
+
+def section_key(salon_id, name, today):
+    return DASHBOARD_KEY.format(salon_id=salon_id, section=name, day=today.isoformat())
+
+def refresh_dashboard(salon_id, names=None, today=None):
+    """
+    Recompute sections of a salon's dashboard and store them. The version
+    is read before computing, so a change made meanwhile leaves the stored
+    section stale rather than lost.
+    """
+    today = today or timezone.localdate()
+    names = list(names or SECTIONS)
+    versions = section_versions(salon_id, names)
+    entries = {}
+    for name in names:
+        entries[section_key(salon_id, name, today)] = {
+            'version': versions[name], 'computed_at': time.time(), 'data': SECTIONS[name](salon_id, today),
+        }
+    cache.set_many(entries, DASHBOARD_TIMEOUT)
+    return {name: entries[section_key(salon_id, name, today)] for name in names}
+
+def refresh_in_background(salon_id, names):
+    """
+    Recompute stale sections without holding up the request that found
+    them, one refresh per section at a time. Runs inline when
+    DASHBOARD_REFRESH_IN_BACKGROUND is off (as under the test runner).
+    """
+    claimed = [name for name in names if cache.add(DASHBOARD_REFRESH_KEY.format(salon_id=salon_id, section=name), True, DASHBOARD_REFRESH_TIMEOUT)]
+    if not claimed:
+        return
+
+    def refresh():
+        try:
+            refresh_dashboard(salon_id, claimed)
+        finally:
+            cache.delete_many([DASHBOARD_REFRESH_KEY.format(salon_id=salon_id, section=name) for name in claimed])
+
+    if not settings.DASHBOARD_REFRESH_IN_BACKGROUND:
+        refresh()
+        return
+
+    def run():
+        try:
+            refresh()
+        finally:
+            connections.close_all()
+    threading.Thread(target=run, name=f'dashboard-refresh-{salon_id}', daemon=True).start()
+
+def section_keys(salon_id, today):
+    return {name: section_key(salon_id, name, today) for name in SECTIONS}
+
+def stale_sections(keys, versions, entries):
+    now = time.time()
+    return sorted(
+        name for name, key in keys.items()
+        if key in entries and (entries[key]['version'] != versions[name] or now - entries[key]['computed_at'] > DASHBOARD_MAX_AGE)
+    )
+
+def build_dashboard(salon_id, today, keys, entries, computed, stale):
+    dashboard = {'salon': salon_id, 'date': today.isoformat(), 'stale': stale}
+    for name, key in keys.items():
+        dashboard[name] = (computed.get(name) or entries[key])['data']
+    return dashboard
+
+def get_dashboard(salon_id, refresh=refresh_in_background):
+    """
+    Return every section of a salon's dashboard. Missing sections are
+    computed inline; stale ones (invalidated or older than
+    DASHBOARD_MAX_AGE) are served as they are and handed to ``refresh``.
+    """
+    today = timezone.localdate()
+    keys = section_keys(salon_id, today)
+    versions = section_versions(salon_id, SECTIONS)
+    entries = cache.get_many(keys.values())
+    missing = [name for name, key in keys.items() if key not in entries]
+    computed = refresh_dashboard(salon_id, missing, today) if missing else {}
+    stale = stale_sections(keys, versions, entries)
+    if stale:
+        refresh(salon_id, stale)
+    return build_dashboard(salon_id, today, keys, entries, computed, stale)
+
+async def aget_dashboard(salon_id, refresh=refresh_in_background):
+    """
+    Async counterpart of ``get_dashboard``; the cache reads and the missing
+    sections are awaited together.
+    """
+    today = timezone.localdate()
+    keys = section_keys(salon_id, today)
+    versions, entries = await asyncio.gather(
+        sync_to_async(section_versions)(salon_id, SECTIONS), cache.aget_many(keys.values()),
+    )
+    missing = [name for name, key in keys.items() if key not in entries]
+    computed = {}
+    for result in await asyncio.gather(*(sync_to_async(refresh_dashboard)(salon_id, [name], today) for name in missing)):
+        computed.update(result)
+    stale = stale_sections(keys, versions, entries)
+    if stale:
+        await sync_to_async(refresh)(salon_id, stale)
+    return build_dashboard(salon_id, today, keys, entries, computed, stale)
+
+def invalidate_dashboard(salon_ids, sections):
+    """
+    Mark ``sections`` of the salons' dashboards stale, now and again once
+    the change is committed, so that no worker caches it from before.
+    """
+    def invalidate():
+        cache.delete_many([
+            DASHBOARD_VERSION_KEY.format(salon_id=salon_id, section=name)
+            for salon_id in salon_ids if salon_id is not None for name in sections
+        ])
+    invalidate()
+    transaction.on_commit(invalidate)
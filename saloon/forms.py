@@ -1,6 +1,10 @@
+from functools import partial
 from django import forms
+from django.forms.models import ModelChoiceIterator
 from django.utils.translation import gettext_lazy as _
 from .models import Salon, Barber, Client, BarberType
+from .reference import REFERENCES, get_reference
+from .styling import StyledFormMixin
 
 # Constants for styles
 FORM_CONTROL_CLASS = 'w-full px-3 py-2 text-[#1E283D] border rounded-lg focus:outline-none focus:ring-2 focus:ring-[#4B49AC] focus:border-transparent'
@@ -8,39 +12,85 @@ CHECKBOX_CLASS = 'form-checkbox h-5 w-5 text-[#4B49AC]'
 FILE_INPUT_CLASS = f'{FORM_CONTROL_CLASS} file:mr-4 file:py-2 file:px-4 file:rounded-full file:border-0 file:text-sm file:font-semibold file:bg-[#98BDFF] file:text-[#1E283D] hover:file:bg-[#7DA0FA]'
 BORDER_COLOR = '#E5E5E5'
 
-class StyleFormMixin:
-    def style_fields(self):
-        for field_name, field in self.fields.items():
-            if isinstance(field.widget, (forms.TextInput, forms.EmailInput, forms.Select, forms.Textarea)):
-                field.widget.attrs.update({
-                    'class': FORM_CONTROL_CLASS,
-                    'style': f'border-color: {BORDER_COLOR};'
-                })
-            elif isinstance(field.widget, forms.CheckboxInput):
-                field.widget.attrs.update({'class': CHECKBOX_CLASS})
-            elif isinstance(field.widget, forms.FileInput):
-                field.widget.attrs.update({
-                    'class': FILE_INPUT_CLASS,
-                    'style': f'border-color: {BORDER_COLOR};'
-                })
+class StyleFormMixin(StyledFormMixin):
+    widget_styles = (
+        ((forms.TextInput, forms.EmailInput, forms.Select, forms.Textarea), {'class': FORM_CONTROL_CLASS, 'style': f'border-color: {BORDER_COLOR};'}),
+        ((forms.CheckboxInput,), {'class': CHECKBOX_CLASS}),
+        ((forms.FileInput,), {'class': FILE_INPUT_CLASS, 'style': f'border-color: {BORDER_COLOR};'}),
+    )
+
+class ReferenceChoiceIterator(ModelChoiceIterator):
+    """
+    The choices of a ModelChoiceField read from the reference cache rather
+    than from its queryset.
+    """
+    def __init__(self, field, name, salon_id=None):
+        super().__init__(field)
+        self.name = name
+        self.salon_id = salon_id
+
+    def rows(self):
+        return get_reference(self.name, self.salon_id)
+
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for obj in self.rows():
+            yield self.choice(obj)
+
+    def __len__(self):
+        return len(self.rows()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(self.rows())
+
+def validate_salon(value, field, scope, salon_id):
+    if value is not None and getattr(value, scope) != salon_id:
+        raise forms.ValidationError(field.error_messages['invalid_choice'], code='invalid_choice')
+
+class ReferenceChoicesMixin:
+    """
+    Offer the choices of ``reference_fields`` (form field name to reference
+    table name) from the reference cache, so rendering the form does not
+    query them. Per-salon tables are limited to ``salon_id`` or the
+    instance's salon, and keep their queryset when neither is known.
+    Submitted values are still validated against the database.
+    """
+    reference_fields = {}
+
+    def use_reference_choices(self, salon_id=None):
+        salon_id = salon_id or getattr(self.instance, 'salon_id', None)
+        for field_name, name in self.reference_fields.items():
+            field = self.fields[field_name]
+            scope = REFERENCES[name].scope
+            if scope:
+                if salon_id is None:
+                    continue
+                # Cheaper per instance than filtering the field's queryset
+                field.validators.append(partial(validate_salon, field=field, scope=scope, salon_id=int(salon_id)))
+            field.iterator = lambda field, name=name: ReferenceChoiceIterator(field, name, salon_id)
+            field.widget.choices = field.choices
 
 class SalonForm(forms.ModelForm, StyleFormMixin):
     class Meta:
         model = Salon
-        fields = ['name', 'description', 'address', 'phone', 'email', 'owner', 'is_active']
+        fields = ['name', 'description', 'address', 'phone', 'email', 'owner', 'opens_at', 'closes_at', 'is_active']
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.style_fields()
 
-class BarberForm(forms.ModelForm, StyleFormMixin):
+class BarberForm(forms.ModelForm, StyleFormMixin, ReferenceChoicesMixin):
+    reference_fields = {'barber_type': 'barber_types'}
+
     class Meta:
         model = Barber
         fields = ['user', 'salon', 'barber_type', 'contract', 'phone', 'address', 'start_date', 'end_date', 'is_active']
 
-    def __init__(self, *args, **kwargs):
+    def __init__(self, *args, salon_id=None, **kwargs):
         super().__init__(*args, **kwargs)
         self.style_fields()
+        self.use_reference_choices(salon_id)
         self.fields['start_date'].widget = forms.DateInput(attrs={'type': 'date', 'class': FORM_CONTROL_CLASS})
         self.fields['end_date'].widget = forms.DateInput(attrs={'type': 'date', 'class': FORM_CONTROL_CLASS})
 
@@ -0,0 +1,33 @@
+import json
+from datetime import date
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from saloon.analytics import TRUNCATE, get_barber_analytics
+from saloon.models import Salon
+
+class Command(BaseCommand):
+    help = "Show the shaves, revenue, average ticket, consumable cost and payout ratio of a salon's barbers."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, required=True)
+        parser.add_argument('--period', choices=sorted(TRUNCATE), default='month')
+        parser.add_argument('--start', type=date.fromisoformat, help="First day (YYYY-MM-DD), twelve months back by default.")
+        parser.add_argument('--end', type=date.fromisoformat, help="Last day (YYYY-MM-DD), today by default.")
+        parser.add_argument('--json', action='store_true', help="Print every period of every barber as JSON.")
+
+    def handle(self, *args, **options):
+        if not Salon.objects.filter(pk=options['salon']).exists():
+            raise CommandError(f"Salon {options['salon']} does not exist.")
+        analytics = get_barber_analytics(options['salon'], options['period'], options['start'], options['end'])
+        if options['json']:
+            self.stdout.write(json.dumps(analytics, cls=DjangoJSONEncoder, indent=2))
+            return
+        self.stdout.write(f"{analytics['start']} to {analytics['end']}, per {analytics['period']}")
+        self.stdout.write(f"{'Barber':30} {'Shaves':>8} {'Revenue':>12} {'Ticket':>8} {'Consumables':>12} {'Payout':>10} {'Ratio':>6}")
+        for barber in analytics['barbers']:
+            totals = barber['totals']
+            ratio = '' if totals['payout_ratio'] is None else f"{totals['payout_ratio']:.1%}"
+            self.stdout.write(
+                f"{barber['name'][:30]:30} {totals['shaves']:>8} {totals['revenue']:>12} {totals['average_ticket'] or '':>8} "
+                f"{totals['consumable_cost']:>12} {totals['payout']:>10} {ratio:>6}"
+            )
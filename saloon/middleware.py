@@ -0,0 +1,91 @@
+import logging
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+from .ownership import get_salon_ownership
+from .profiling import QueryProfile
+
+logger = logging.getLogger('saloon.profiling')
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+class AsyncCapableMiddleware:
+    """
+    Base for middleware that runs natively under both WSGI and ASGI, so
+    async views are not pushed onto a thread by the middleware chain.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.handle(request)
+
+class SalonOwnershipMiddleware(AsyncCapableMiddleware):
+    """
+    Expose ``request.salon_ownership`` so that views and templates share the
+    ownership lookups of a request. Async views use ``aget_salon_ownership``.
+    """
+    def handle(self, request):
+        request.salon_ownership = SimpleLazyObject(lambda: get_salon_ownership(request))
+        return self.get_response(request)
+
+    async def __acall__(self, request):
+        request.salon_ownership = SimpleLazyObject(lambda: get_salon_ownership(request))
+        return await self.get_response(request)
+
+class QueryProfilerMiddleware(AsyncCapableMiddleware):
+    """
+    Count the queries, database time and repeated query shapes of every
+    request. The totals are sent as a ``Server-Timing`` header and logged.
+    A view that runs more queries than its ``QUERY_BUDGETS`` entry is logged
+    as a warning, or raises when ``QUERY_BUDGET_ENFORCE`` is set (as it is
+    under the test runner). Queries run while a streaming response is being
+    consumed are not counted.
+    """
+    def handle(self, request):
+        profile = QueryProfile()
+        with profile.capture():
+            response = self.get_response(request)
+        return self.record(request, response, profile)
+
+    async def __acall__(self, request):
+        profile = QueryProfile()
+        # The queries of an async request run on its sync thread, whose
+        # connections are the ones to wrap
+        capture = profile.capture()
+        await sync_to_async(capture.__enter__)()
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(capture.__exit__)(None, None, None)
+        return self.record(request, response, profile)
+
+    def record(self, request, response, profile):
+        url_name = request.resolver_match.view_name if request.resolver_match else None
+        response['Server-Timing'] = profile.server_timing()
+        duplicates = profile.duplicates
+        logger.log(
+            logging.WARNING if duplicates else logging.INFO, "%s %s", request.method, request.path,
+            extra={
+                'url_name': url_name,
+                'status': response.status_code,
+                'queries': profile.count,
+                'db_ms': round(profile.duration * 1000, 1),
+                'duplicated_queries': duplicates,
+            },
+        )
+        budget = getattr(settings, 'QUERY_BUDGETS', {}).get(url_name)
+        if budget is not None and profile.count > budget:
+            message = f"{url_name} ran {profile.count} queries, over its budget of {budget}"
+            if getattr(settings, 'QUERY_BUDGET_ENFORCE', False):
+                raise QueryBudgetExceeded(message)
+            logger.warning(message, extra={'url_name': url_name, 'queries': profile.count, 'budget': budget})
+        return response
@@ -0,0 +1,14 @@
+from django.db import migrations
+from saloon.search import CreateSearchIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+    ]
+
+    operations = [
+        CreateSearchIndex('Salon', ['name', 'description']),
+        CreateSearchIndex('Client', ['name', 'phone'], scope='salon_id'),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:20
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0004_search_index'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='barber',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['salon', 'start_date', 'end_date'], name='saloon_barber_employed_idx'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:24
+
+import datetime
+from django.db import migrations, models
+from saloon.search import RebuildSearchIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0005_barber_employed_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='salon',
+            name='closes_at',
+            field=models.TimeField(default=datetime.time(19, 0), verbose_name='Closes at'),
+        ),
+        migrations.AddField(
+            model_name='salon',
+            name='opens_at',
+            field=models.TimeField(default=datetime.time(9, 0), verbose_name='Opens at'),
+        ),
+        # Adding the columns rebuilds the table on SQLite, dropping its search triggers
+        RebuildSearchIndex('Salon', ['name', 'description']),
+    ]
@@ -1,11 +1,17 @@
 ''' Models for the saloon app '''
 
-from django.db import models
+from datetime import time, timedelta
+from django.db import models, transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
 from django.conf import settings
 from django.core.exceptions import ValidationError
 from django.utils import timezone
 from django.core.validators import RegexValidator
+from .dashboard import invalidate_dashboard
+from .ownership import invalidate_owned_salons_on_commit
+from .reference import invalidate_reference_on_commit
 
 class TimestampMixin(models.Model):
     created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
@@ -14,6 +20,24 @@ class TimestampMixin(models.Model):
     class Meta:
         abstract = True
 
+class SalonHistoryQuerySet(models.QuerySet):
+    """
+    Base queryset for dated, salon-scoped history tables. Filters are applied
+    in index column order: salon first, then equality filters, then the date range.
+    """
+    date_field = None
+
+    def for_salon(self, salon):
+        return self.filter(salon=salon)
+
+    def between(self, start_date=None, end_date=None):
+        queryset = self
+        if start_date is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__gte': start_date})
+        if end_date is not None:
+            queryset = queryset.filter(**{f'{self.date_field}__lte': end_date})
+        return queryset
+
 class Attachment(TimestampMixin):
     file = models.FileField(_("File"), upload_to="attachments/")
     description = models.CharField(_("Description"), max_length=255)
@@ -25,6 +49,18 @@ class Attachment(TimestampMixin):
         verbose_name = _("Attachment")
         verbose_name_plural = _("Attachments")
 
+class SalonQuerySet(models.QuerySet):
+    def update(self, **kwargs):
+        # Changing owners in bulk sends no signals, so invalidate here
+        if 'owner' not in kwargs and 'owner_id' not in kwargs:
+            return super().update(**kwargs)
+        with transaction.atomic(savepoint=False):
+            owner_ids = set(self.values_list('owner_id', flat=True))
+            updated = super().update(**kwargs)
+        new_owner = kwargs.get('owner', kwargs.get('owner_id'))
+        invalidate_owned_salons_on_commit(owner_ids | {getattr(new_owner, 'pk', new_owner)})
+        return updated
+
 class Salon(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255, unique=True)
     description = models.TextField(_("Description"), blank=True)
@@ -34,6 +70,10 @@ class Salon(TimestampMixin):
     email = models.EmailField(_("Email"), blank=True, null=True)
     owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name='owned_salons', verbose_name=_("Owner"))
     is_active = models.BooleanField(_("Is active"), default=True)
+    opens_at = models.TimeField(_("Opens at"), default=time(9))
+    closes_at = models.TimeField(_("Closes at"), default=time(19))
+
+    objects = SalonQuerySet.as_manager()
 
     class Meta:
         verbose_name = _("Salon")
@@ -46,9 +86,31 @@ class Salon(TimestampMixin):
     def __str__(self):
         return self.name
 
+    def clean(self):
+        if self.opens_at >= self.closes_at:
+            raise ValidationError(_("Closing time must be after opening time."))
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_owner_id = instance.__dict__.get('owner_id')
+        return instance
+
     def get_active_barbers(self):
-        today = timezone.now().date()
-        return self.barbers.filter(is_active=True, start_date__lte=today, end_date__gte=today | models.Q(end_date__isnull=True))
+        return self.barbers.employed_on(timezone.localdate())
+
+@receiver(post_save, sender=Salon)
+@receiver(post_delete, sender=Salon)
+def invalidate_salon_ownership(sender, instance, **kwargs):
+    invalidate_owned_salons_on_commit({instance.owner_id, getattr(instance, '_loaded_owner_id', None)})
+    instance._loaded_owner_id = instance.owner_id
+
+@receiver(post_save, sender=Salon)
+def invalidate_salon_reference_labels(sender, instance, created, **kwargs):
+    # Barber types and hairstyles are labelled with their salon's name
+    if not created:
+        invalidate_reference_on_commit('barber_types', instance.pk)
+        invalidate_reference_on_commit('hairstyles', instance.pk)
 
 class BarberType(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255)
@@ -63,6 +125,44 @@ class BarberType(TimestampMixin):
         verbose_name = _("Barber Type")
         verbose_name_plural = _("Barber Types")
 
+class BarberQuerySet(models.QuerySet):
+    """
+    Barbers by employment: an active barber is employed from its start date
+    through its end date, or indefinitely when it has none. Served by the
+    partial index on active barbers' (salon, start_date, end_date).
+    """
+    @staticmethod
+    def employed_filter(start, end=None, prefix=''):
+        # Employed on at least one day of [start, end]; ``prefix`` is the path to barbers from another model
+        end = start if end is None else end
+        return models.Q(**{f'{prefix}is_active': True, f'{prefix}start_date__lte': end}) & (
+            models.Q(**{f'{prefix}end_date__isnull': True}) | models.Q(**{f'{prefix}end_date__gte': start})
+        )
+
+    def employed_on(self, day):
+        return self.filter(self.employed_filter(day))
+
+    def employed_between(self, start, end):
+        return self.filter(self.employed_filter(start, end))
+
+    def headcount(self, start, end):
+        """
+        Number of barbers employed on each day from ``start`` to ``end``, in
+        one query: the employment windows overlapping the range are swept
+        into per-day counts.
+        """
+        days = (end - start).days + 1
+        changes = [0] * (days + 1)
+        for first, last in self.employed_between(start, end).order_by().values_list('start_date', 'end_date'):
+            changes[max((first - start).days, 0)] += 1
+            if last is not None and last < end:
+                changes[(last - start).days + 1] -= 1
+        counts, employed = {}, 0
+        for offset in range(days):
+            employed += changes[offset]
+            counts[start + timedelta(days=offset)] = employed
+        return counts
+
 class Barber(TimestampMixin):
     user = models.OneToOneField(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, verbose_name=_("user"))
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='barbers', verbose_name=_("Salon"))
@@ -75,6 +175,8 @@ class Barber(TimestampMixin):
     end_date = models.DateField(_("End date"), null=True, blank=True)
     is_active = models.BooleanField(_("Is active"), default=True)
 
+    objects = BarberQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.salon.name}"
 
@@ -85,6 +187,7 @@ class Barber(TimestampMixin):
         indexes = [
             models.Index(fields=['is_active']),
             models.Index(fields=['start_date', 'end_date']),
+            models.Index(fields=['salon', 'start_date', 'end_date'], condition=models.Q(is_active=True), name='saloon_barber_employed_idx'),
         ]
 
     def clean(self):
@@ -97,10 +200,12 @@ class Barber(TimestampMixin):
         self.full_clean()
         super().save(*args, **kwargs)
 
+    def is_employed_on(self, day):
+        return self.is_active and self.start_date <= day and (not self.end_date or self.end_date >= day)
+
     @property
     def is_current(self):
-        today = timezone.now().date()
-        return self.is_active and self.start_date <= today and (not self.end_date or self.end_date >= today)
+        return self.is_employed_on(timezone.localdate())
 
 class Client(TimestampMixin):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='clients', verbose_name=_("User"))
@@ -121,4 +226,16 @@ class Client(TimestampMixin):
         verbose_name_plural = _("Clients")
         indexes = [
             models.Index(fields=['name']),
-        ] 
\ No newline at end of file
+        ] 
+
+@receiver(post_save, sender=Barber)
+@receiver(post_delete, sender=Barber)
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_salon_team_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard({instance.salon_id}, ['team'])
+
+@receiver(post_save, sender=BarberType)
+@receiver(post_delete, sender=BarberType)
+def invalidate_barber_type_choices(sender, instance, **kwargs):
+    invalidate_reference_on_commit('barber_types', instance.salon_id)
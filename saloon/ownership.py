@@ -0,0 +1,102 @@
+''' Request-scoped resolution of the salons owned by the current user '''
+
+from django.core.cache import cache
+from django.db import transaction
+
+OWNED_SALONS_KEY = 'saloon:owned_salons:{user_id}'
+# Saves and deletes of salons invalidate the key, but only on the workers
+# sharing the cache; the timeout bounds how long a change can go unseen
+OWNED_SALONS_TIMEOUT = 60
+
+def load_owned_salon_ids(user_id):
+    from .models import Salon
+    key = OWNED_SALONS_KEY.format(user_id=user_id)
+    salon_ids = cache.get(key)
+    if salon_ids is None:
+        salon_ids = frozenset(Salon.objects.filter(owner_id=user_id).values_list('id', flat=True))
+        cache.set(key, salon_ids, OWNED_SALONS_TIMEOUT)
+    return salon_ids
+
+async def aload_owned_salon_ids(user_id):
+    from .models import Salon
+    key = OWNED_SALONS_KEY.format(user_id=user_id)
+    salon_ids = await cache.aget(key)
+    if salon_ids is None:
+        salon_ids = frozenset([pk async for pk in Salon.objects.filter(owner_id=user_id).values_list('id', flat=True)])
+        await cache.aset(key, salon_ids, OWNED_SALONS_TIMEOUT)
+    return salon_ids
+
+def invalidate_owned_salons(user_id):
+    cache.delete(OWNED_SALONS_KEY.format(user_id=user_id))
+
+def invalidate_owned_salons_on_commit(user_ids):
+    for user_id in set(user_ids) - {None}:
+        invalidate_owned_salons(user_id)
+        transaction.on_commit(lambda user_id=user_id: invalidate_owned_salons(user_id))
+
+class SalonOwnership:
+    """
+    The salon ids owned by one user, loaded at most once per request and
+    shared across requests through the cache. Ownership checks compare ids
+    so they never load the related salon or owner.
+    """
+    def __init__(self, user):
+        self.user_id = user.pk if user is not None and user.is_authenticated else None
+        self._salon_ids = None
+
+    @property
+    def salon_ids(self):
+        if self._salon_ids is None:
+            self._salon_ids = load_owned_salon_ids(self.user_id) if self.user_id is not None else frozenset()
+        return self._salon_ids
+
+    async def aload(self):
+        if self._salon_ids is None:
+            self._salon_ids = await aload_owned_salon_ids(self.user_id) if self.user_id is not None else frozenset()
+        return self
+
+    def has_salon(self):
+        return bool(self.salon_ids)
+
+    @property
+    def first_salon_id(self):
+        return min(self.salon_ids, default=None)
+
+    def owns(self, salon):
+        salon_id = getattr(salon, 'pk', salon)
+        try:
+            return int(salon_id) in self.salon_ids
+        except (TypeError, ValueError):
+            return False
+
+    def owns_object(self, obj):
+        if hasattr(obj, 'owner_id'):
+            return self.user_id is not None and obj.owner_id == self.user_id
+        return self.owns(obj.salon_id)
+
+def get_salon_ownership(request):
+    """
+    Return the SalonOwnership of ``request.user``, memoised on the request.
+    The user is re-checked on every call because API authentication only
+    sets it after the middleware has run.
+    """
+    user = getattr(request, 'user', None)
+    ownership = getattr(request, '_salon_ownership', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    if ownership is None or ownership.user_id != user_id:
+        ownership = SalonOwnership(user)
+        request._salon_ownership = ownership
+    return ownership
+
+async def aget_salon_ownership(request):
+    """
+    Async counterpart of ``get_salon_ownership``, with the owned salon ids
+    already loaded so that checks do not touch the database.
+    """
+    user = await request.auser()
+    ownership = getattr(request, '_salon_ownership', None)
+    user_id = user.pk if user is not None and user.is_authenticated else None
+    if ownership is None or ownership.user_id != user_id:
+        ownership = SalonOwnership(user)
+        request._salon_ownership = ownership
+    return await ownership.aload()
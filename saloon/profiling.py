@@ -0,0 +1,50 @@
+''' Per-request accounting of database queries '''
+
+import re
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+from django.db import connections
+
+IN_LIST = re.compile(r'\((?:\s*%s\s*,)+\s*%s\s*\)')
+NUMBER = re.compile(r'\b\d+\b')
+
+def sql_shape(sql):
+    """
+    Reduce a statement to its shape, so the same query with different
+    parameters or IN-list lengths is counted as a repeat.
+    """
+    return NUMBER.sub('?', IN_LIST.sub('(%s...)', sql))
+
+class QueryProfile:
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - started
+            self.count += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    @property
+    def duplicates(self):
+        return {shape: count for shape, count in self.shapes.items() if count > 1}
+
+    @contextmanager
+    def capture(self):
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(self))
+            yield self
+
+    def server_timing(self):
+        duplicated = sum(count - 1 for count in self.duplicates.values())
+        return (
+            f'db;dur={self.duration * 1000:.1f};desc="{self.count} queries", '
+            f'dbdup;desc="{duplicated} duplicated"'
+        )
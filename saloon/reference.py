@@ -0,0 +1,86 @@
+''' Read-through cache of the small, rarely changing tables forms and serializers offer as choices '''
+
+import uuid
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+
+REFERENCE_KEY = 'saloon:reference:{name}:{scope}'
+REFERENCE_VERSION_KEY = 'saloon:reference:{name}:{scope}:version'
+# Scope of the tables shared by every salon
+ALL_SALONS = 'all'
+# Bounds how long a change made through a worker not sharing the cache goes
+# unseen; saves and deletes otherwise bump the table's version
+REFERENCE_TIMEOUT = 5 * 60
+
+class Reference:
+    """
+    A cached table: ``model`` rows in ``ordering``, per salon when ``scope``
+    names the field holding their salon id. ``related`` are selected along
+    so that the cached rows can be labelled without further queries.
+    """
+    def __init__(self, model, ordering, scope=None, related=()):
+        self.model = model
+        self.ordering = list(ordering)
+        self.scope = scope
+        self.related = list(related)
+
+    def get_model(self):
+        return apps.get_model(self.model)
+
+    def queryset(self, salon_id=None):
+        queryset = self.get_model().objects.select_related(*self.related).order_by(*self.ordering)
+        return queryset.filter(**{self.scope: salon_id}) if self.scope else queryset
+
+REFERENCES = {
+    'currencies': Reference('saloonfinance.Currency', ['code']),
+    'payment_types': Reference('saloonfinance.PaymentType', ['name']),
+    'barber_types': Reference('saloon.BarberType', ['name'], scope='salon_id', related=['salon']),
+    'hairstyles': Reference('saloonservices.Hairstyle', ['name'], scope='salon_id', related=['salon']),
+}
+
+def reference_name(model):
+    """
+    The name of the cached table of ``model``, or None.
+    """
+    label = model._meta.label
+    return next((name for name, reference in REFERENCES.items() if reference.model == label), None)
+
+def reference_scope(name, salon_id=None):
+    if not REFERENCES[name].scope:
+        return ALL_SALONS
+    if salon_id is None:
+        raise ValueError(f"The {name} reference table is cached per salon.")
+    return int(salon_id)
+
+def get_reference_version(name, scope):
+    key = REFERENCE_VERSION_KEY.format(name=name, scope=scope)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+def get_reference(name, salon_id=None):
+    """
+    The rows of the reference table ``name``, of ``salon_id`` for per-salon
+    tables, read from the cache and loaded with one query on a miss. Saving
+    or deleting a row bumps the version of its table, so the next read
+    reloads it.
+    """
+    scope = reference_scope(name, salon_id)
+    version = get_reference_version(name, scope)
+    key = REFERENCE_KEY.format(name=name, scope=scope)
+    rows = cache.get(key, version=version)
+    if rows is None:
+        rows = list(REFERENCES[name].queryset(salon_id))
+        cache.set(key, rows, REFERENCE_TIMEOUT, version=version)
+    return rows
+
+def invalidate_reference(name, salon_id=None):
+    scope = reference_scope(name, salon_id)
+    cache.set(REFERENCE_VERSION_KEY.format(name=name, scope=scope), uuid.uuid4().hex, None)
+
+def invalidate_reference_on_commit(name, salon_id=None):
+    invalidate_reference(name, salon_id)
+    transaction.on_commit(lambda: invalidate_reference(name, salon_id))
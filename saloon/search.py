@@ -0,0 +1,199 @@
+''' Ranked search and prefix autocomplete over salons, clients and hairstyles '''
+
+import re
+from django.apps import apps
+from django.db import connections
+from django.db.migrations.operations.base import Operation
+from django.db.models import FloatField, Q, Value
+from django.db.models.functions import Coalesce, Greatest
+
+# Query words beyond this are ignored
+MAX_TERMS = 8
+
+class SearchIndex:
+    """
+    The text ``fields`` of a model that are searched, and the ``scope``
+    column (a salon) results are restricted to. PostgreSQL serves it from
+    trigram GIN indexes, SQLite from an FTS5 table kept in sync by triggers.
+    """
+    def __init__(self, model, fields, scope=None, label=None):
+        self.model_label = model
+        self.fields = list(fields)
+        self.scope = scope
+        self.label = list(label or fields)
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+INDEXES = {
+    'salons': SearchIndex('saloon.Salon', ['name', 'description'], label=['name', 'address']),
+    'clients': SearchIndex('saloon.Client', ['name', 'phone'], scope='salon_id'),
+    'hairstyles': SearchIndex('saloonservices.Hairstyle', ['name'], scope='salon_id', label=['name', 'current_tariff']),
+}
+
+def terms(query):
+    return re.findall(r'\w+', query or '')[:MAX_TERMS]
+
+def fts_table(table):
+    return f'{table}_fts'
+
+def fts_phrase(term):
+    return '"{}"*'.format(term.replace('"', '""'))
+
+def fts_match(index, words, salon_ids=None):
+    """
+    FTS5 query matching every word as a prefix of some word of the fields,
+    within the scoped salons so that only their rows are visited.
+    """
+    columns = '{%s}' % ' '.join(index.fields)
+    match = ' AND '.join(f'{columns} : {fts_phrase(word)}' for word in words)
+    if index.scope and salon_ids is not None:
+        match += ' AND {} : ({})'.format(index.scope, ' OR '.join(f'"{int(salon_id)}"' for salon_id in salon_ids))
+    return match
+
+def sqlite_search(index, queryset, words, salon_ids):
+    table = queryset.model._meta.db_table
+    fts = fts_table(table)
+    match = fts_match(index, words, salon_ids)
+    # bm25 ranks better matches lower; the scope column carries no weight
+    weights = ', '.join(['1.0'] * len(index.fields) + (['0.0'] if index.scope else []))
+    # The FTS table has to be joined, not queried in a subquery, so that the
+    # match drives the query and bm25 is computed once per matching row
+    return queryset.extra(
+        tables=[fts],
+        where=[f'"{fts}".rowid = "{table}"."id"', f'"{fts}" MATCH %s'],
+        params=[match],
+        select={'search_rank': f'-bm25("{fts}", {weights})'},
+    )
+
+def postgresql_search(index, queryset, words, salon_ids):
+    from django.contrib.postgres.search import TrigramWordSimilarity
+    # icontains compiles to UPPER(field::text) LIKE, which the trigram indexes serve
+    for word in words:
+        queryset = queryset.filter(Q.create([(f'{field}__icontains', word) for field in index.fields], connector=Q.OR))
+    query = ' '.join(words)
+    similarities = [Coalesce(TrigramWordSimilarity(query, field), Value(0.0)) for field in index.fields]
+    return queryset.annotate(search_rank=Greatest(*similarities) if len(similarities) > 1 else similarities[0])
+
+def fallback_search(index, queryset, words, salon_ids):
+    for word in words:
+        queryset = queryset.filter(Q.create([(f'{field}__icontains', word) for field in index.fields], connector=Q.OR))
+    return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+BACKENDS = {'sqlite': sqlite_search, 'postgresql': postgresql_search}
+
+def search(name, query, salon_ids=None, queryset=None):
+    """
+    Rows of the ``name`` index matching every word of ``query``, annotated
+    with ``search_rank`` (higher is better) and ordered by it. Words match
+    word prefixes on SQLite and any substring on PostgreSQL. ``salon_ids``
+    restricts scoped indexes to those salons.
+    """
+    index = INDEXES[name]
+    if queryset is None:
+        queryset = index.model._default_manager.all()
+    if index.scope and salon_ids is not None:
+        salon_ids = list(salon_ids)
+        queryset = queryset.filter(**{f'{index.scope}__in': salon_ids})
+    words = terms(query)
+    if not words or salon_ids == []:
+        return queryset.none()
+    backend = BACKENDS.get(connections[queryset.db].vendor, fallback_search)
+    return backend(index, queryset, words, salon_ids).order_by('-search_rank', 'pk')
+
+def autocomplete(name, query, salon_ids=None, queryset=None, limit=10):
+    """
+    The best ``limit`` completions of ``query``: the id and label fields
+    of each row.
+    """
+    index = INDEXES[name]
+    return list(search(name, query, salon_ids, queryset).values('id', *index.label)[:limit])
+
+class CreateSearchIndex(Operation):
+    """
+    Index the text ``fields`` of a model for ``search``: trigram GIN
+    indexes on PostgreSQL, an external-content FTS5 table with triggers on
+    SQLite. Other databases are left alone and fall back to scans.
+    """
+    reduces_to_sql = True
+    reversible = True
+
+    def __init__(self, model_name, fields, scope=None):
+        self.model_name = model_name
+        self.fields = list(fields)
+        self.scope = scope
+
+    def deconstruct(self):
+        kwargs = {'model_name': self.model_name, 'fields': self.fields}
+        if self.scope:
+            kwargs['scope'] = self.scope
+        return self.__class__.__qualname__, [], kwargs
+
+    def state_forwards(self, app_label, state):
+        pass
+
+    def describe(self):
+        return f"Create search index on {self.model_name}"
+
+    @property
+    def migration_name_fragment(self):
+        return f'{self.model_name.lower()}_search_index'
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        table = to_state.apps.get_model(app_label, self.model_name)._meta.db_table
+        for sql in self.create_sql(schema_editor.connection.vendor, table):
+            schema_editor.execute(sql)
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        table = from_state.apps.get_model(app_label, self.model_name)._meta.db_table
+        for sql in self.drop_sql(schema_editor.connection.vendor, table):
+            schema_editor.execute(sql)
+
+    def create_sql(self, vendor, table):
+        if vendor == 'postgresql':
+            return ['CREATE EXTENSION IF NOT EXISTS pg_trgm'] + [
+                f'CREATE INDEX IF NOT EXISTS "{table}_{field}_trgm" ON "{table}" USING gin ((UPPER("{field}"::text)) gin_trgm_ops)'
+                for field in self.fields
+            ]
+        if vendor != 'sqlite':
+            return []
+        fts = fts_table(table)
+        columns = self.fields + ([self.scope] if self.scope else [])
+        names = ', '.join(f'"{column}"' for column in columns)
+        new = ', '.join(f'new."{column}"' for column in columns)
+        old = ', '.join(f'old."{column}"' for column in columns)
+        delete = f"INSERT INTO \"{fts}\"(\"{fts}\", rowid, {names}) VALUES ('delete', old.\"id\", {old});"
+        insert = f'INSERT INTO "{fts}"(rowid, {names}) VALUES (new."id", {new});'
+        return [
+            f'CREATE VIRTUAL TABLE IF NOT EXISTS "{fts}" USING fts5({names}, content="{table}", content_rowid="id", '
+            f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_insert" AFTER INSERT ON "{table}" BEGIN {insert} END',
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_delete" AFTER DELETE ON "{table}" BEGIN {delete} END',
+            f'CREATE TRIGGER IF NOT EXISTS "{fts}_update" AFTER UPDATE OF {names} ON "{table}" BEGIN {delete} {insert} END',
+            f"INSERT INTO \"{fts}\"(\"{fts}\") VALUES ('rebuild')",
+        ]
+
+    def drop_sql(self, vendor, table):
+        if vendor == 'postgresql':
+            return [f'DROP INDEX IF EXISTS "{table}_{field}_trgm"' for field in self.fields]
+        if vendor != 'sqlite':
+            return []
+        fts = fts_table(table)
+        return [f'DROP TRIGGER IF EXISTS "{fts}_{event}"' for event in ('insert', 'delete', 'update')] + [f'DROP TABLE IF EXISTS "{fts}"']
+
+class RebuildSearchIndex(CreateSearchIndex):
+    """
+    Restore a search index after an operation that rebuilds its table, such
+    as adding a column with a default on SQLite, which drops the table's
+    triggers. Runs the same way in both directions.
+    """
+    def describe(self):
+        return f"Rebuild search index on {self.model_name}"
+
+    @property
+    def migration_name_fragment(self):
+        return f'{self.model_name.lower()}_rebuild_search_index'
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        self.database_forwards(app_label, schema_editor, from_state, to_state)
@@ -0,0 +1,63 @@
+''' Widget styling worked out once per form class '''
+
+import copy
+import threading
+
+class StyledFormMixin:
+    """
+    Give the widgets of a form's fields the attributes of the first
+    ``widget_styles`` entry (widget classes, attributes) they are an
+    instance of. The attributes of each widget class are looked up once,
+    and the fields of each form class are styled once, on its first
+    instantiation: Django copies ``base_fields`` into every later
+    instance, styled attributes included, along with a mark of the form
+    class that styled each widget. ``style_fields`` only styles the widgets
+    not marked as the instance's class's: fields added or re-widgeted
+    since, and the fields of an instance copied before the class was styled.
+    """
+    widget_styles = ()
+    _style_lock = threading.Lock()
+
+    @classmethod
+    def attrs_for(cls, widget_class):
+        cached = cls.__dict__.get('_widget_attrs')
+        if cached is None:
+            cached = cls._widget_attrs = {}
+        if widget_class not in cached:
+            cached[widget_class] = next(
+                (attrs for classes, attrs in cls.widget_styles if issubclass(widget_class, classes)), None,
+            )
+        return cached[widget_class]
+
+    @classmethod
+    def style_base_fields(cls):
+        """
+        Style the class's own copy of its base fields, which declared fields
+        otherwise share with the parent form. Returns whether it was done
+        by this call.
+        """
+        if '_base_fields_styled' in cls.__dict__:
+            return False
+        with cls._style_lock:
+            if '_base_fields_styled' in cls.__dict__:
+                return False
+            base_fields = copy.deepcopy(cls.base_fields)
+            for field in base_fields.values():
+                cls.style_widget(field.widget)
+            cls.base_fields = base_fields
+            cls._base_fields_styled = True
+        return True
+
+    @classmethod
+    def style_widget(cls, widget):
+        attrs = cls.attrs_for(type(widget))
+        if attrs:
+            widget.attrs.update(attrs)
+        widget._styled_by = cls
+
+    def style_fields(self):
+        self.style_base_fields()
+        form_class = type(self)
+        for field in self.fields.values():
+            if getattr(field.widget, '_styled_by', None) is not form_class:
+                self.style_widget(field.widget)
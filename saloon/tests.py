@@ -1,3 +1,498 @@
-from django.test import TestCase
+import copy
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, RequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path, reverse
+from django.utils import timezone
+from rest_framework import serializers
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import CustomUser
+from bench.flows import BenchContext
+from bench.runner import BENCHMARKS, run_benchmarks, compare
+from bench.seed import Scale, seed
+from saloonfinance.admin import CashRegisterAdmin
+from saloonfinance.models import Currency, CashRegister, Payment, Transaction
+from salooninventory.models import Item, ItemPurchase, ItemUsed
+from saloonservices.models import Hairstyle, Shave
+from api.saloon.serializers import BarberSerializer
+from api.saloon.views import SalonViewSet, BarberViewSet
+from api.saloonfinance.permissions import IsSalonOwnerForFinance
+from .analytics import BarberAnalytics, get_barber_analytics
+from .dashboard import DASHBOARD_REFRESH_KEY, get_dashboard
+from .forms import BarberForm, SalonForm, FORM_CONTROL_CLASS
+from .middleware import QueryBudgetExceeded
+from .reference import get_reference
+from .search import search
+from .models import Salon, BarberType, Barber, Client
+
+# The API is not mounted by config.urls
+urlpatterns = [
+    path('api/saloon/', include('api.saloon.apiurls')),
+    path('', include('config.urls')),
+]
+from .ownership import get_salon_ownership
+
+class SalonOwnershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.other = CustomUser.objects.create_user(email='other@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        self.other_salon = Salon.objects.create(name='Other salon', owner=self.other)
+        currency = Currency.objects.get(pk=Currency.get_default())
+        self.cashregister = CashRegister.objects.create(name='Front desk', currency=currency, salon=self.salon)
+        self.other_cashregister = CashRegister.objects.create(name='Front desk', currency=currency, salon=self.other_salon)
+
+    def make_request(self, user):
+        request = RequestFactory().get('/')
+        request.user = user
+        return request
+
+    def test_checks_share_one_lookup_per_request_and_across_requests(self):
+        request = self.make_request(self.owner)
+        permission = IsSalonOwnerForFinance()
+        cashregister_admin = CashRegisterAdmin(CashRegister, None)
+        cashregister = CashRegister.objects.get(pk=self.cashregister.pk)
+        other_cashregister = CashRegister.objects.get(pk=self.other_cashregister.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(permission.has_permission(request, None))
+            self.assertTrue(permission.has_object_permission(request, None, cashregister))
+            self.assertFalse(permission.has_object_permission(request, None, other_cashregister))
+            self.assertTrue(cashregister_admin.has_add_permission(request))
+            self.assertTrue(cashregister_admin.has_change_permission(request, cashregister))
+            self.assertFalse(cashregister_admin.has_delete_permission(request, other_cashregister))
+        with self.assertNumQueries(0):
+            self.assertTrue(get_salon_ownership(self.make_request(self.owner)).owns(self.salon))
+
+    def test_salon_changes_invalidate_the_cached_ids(self):
+        self.assertEqual(get_salon_ownership(self.make_request(self.other)).salon_ids, {self.other_salon.pk})
+        salon = Salon.objects.get(pk=self.salon.pk)
+        salon.owner = self.other
+        salon.save()
+        self.assertEqual(get_salon_ownership(self.make_request(self.other)).salon_ids, {self.salon.pk, self.other_salon.pk})
+        self.assertFalse(get_salon_ownership(self.make_request(self.owner)).has_salon())
+        salon.delete()
+        self.assertEqual(get_salon_ownership(self.make_request(self.other)).salon_ids, {self.other_salon.pk})
+
+    def test_bulk_owner_changes_invalidate_the_cached_ids(self):
+        self.assertTrue(get_salon_ownership(self.make_request(self.owner)).owns(self.salon))
+        self.assertFalse(get_salon_ownership(self.make_request(self.other)).owns(self.salon))
+        Salon.objects.filter(pk=self.salon.pk).update(owner=self.other)
+        self.assertFalse(get_salon_ownership(self.make_request(self.owner)).has_salon())
+        self.assertTrue(get_salon_ownership(self.make_request(self.other)).owns(self.salon))
+
+class QueryProfilerTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        self.client.force_login(self.owner)
+
+    def test_views_stay_within_their_query_budgets(self):
+        for url_name in ('salon:salon_detail', 'salon:barber_list', 'salon:client_list', 'salon:barber_type_list'):
+            kwargs = {'pk': self.salon.pk} if url_name == 'salon:salon_detail' else {'salon_id': self.salon.pk}
+            response = self.client.get(reverse(url_name, kwargs=kwargs))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('dbdup;desc="0 duplicated"', response['Server-Timing'])
+        for url_name in ('saloonfinance:cashregister_list', 'saloonfinance:payment_list', 'saloonfinance:transaction_list'):
+            response = self.client.get(reverse(url_name, kwargs={'salon_id': self.salon.pk}))
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('dbdup;desc="0 duplicated"', response['Server-Timing'])
+
+    @override_settings(QUERY_BUDGETS={'salon:salon_detail': 1}, QUERY_BUDGET_ENFORCE=True)
+    def test_exceeding_a_budget_raises(self):
+        with self.assertRaises(QueryBudgetExceeded):
+            self.client.get(reverse('salon:salon_detail', kwargs={'pk': self.salon.pk}))
+
+    @override_settings(QUERY_BUDGETS={'salon:salon_detail': 1}, QUERY_BUDGET_ENFORCE=False)
+    def test_exceeding_a_budget_is_logged_when_not_enforced(self):
+        with self.assertLogs('saloon.profiling', 'WARNING') as logs:
+            response = self.client.get(reverse('salon:salon_detail', kwargs={'pk': self.salon.pk}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(any('over its budget of 1' in line for line in logs.output))
+
+class BenchSuiteTests(TestCase):
+    def test_seed_and_run_every_benchmark(self):
+        cache.clear()
+        scale = Scale(salons=2, barbers=2, clients=3, hairstyles=2, tariff_changes=3, items=3, purchases=4, shaves=30, transactions=20, days=60)
+        salons = seed(scale)
+        self.assertEqual(len(salons), 2)
+        salon = salons[0]
+        self.assertEqual(salon.hairstyles.get(name='Hairstyle 0').tariff_history.count(), 3)
+        cashregister = salon.cash_registers.get(name='Front desk')
+        self.assertEqual(cashregister.balance, cashregister.get_total_income() - cashregister.get_total_expenses())
+
+        results = run_benchmarks(BenchContext(salon), repeat=1)
+        self.assertEqual(set(results), set(BENCHMARKS))
+        self.assertEqual(results['api_transaction_list']['queries'], 1)
+        slower = {name: dict(result, queries=result['queries'] - 1) for name, result in results.items()}
+        self.assertIn('revenue_total: 0 -> 1 queries', compare({'results': slower}, results))
+
+class SalonDashboardTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        barber_type = BarberType.objects.create(name='Senior', salon=self.salon)
+        barber_user = CustomUser.objects.create_user(email='barber@example.com', password='secret')
+        self.barber = Barber.objects.create(user=barber_user, salon=self.salon, barber_type=barber_type, start_date=date(2024, 1, 1))
+        Client.objects.create(name='Alice', salon=self.salon)
+        currency = Currency.objects.get(pk=Currency.get_default())
+        self.cashregister = CashRegister.objects.create(name='Front desk', currency=currency, salon=self.salon)
+        self.fade = Hairstyle.objects.create(name='Fade', current_tariff=Decimal('10.00'), salon=self.salon)
+        self.trim = Hairstyle.objects.create(name='Trim', current_tariff=Decimal('5.00'), salon=self.salon)
+        for hairstyle in (self.fade, self.fade, self.trim):
+            self.shave(hairstyle)
+        Item.objects.create(name='Wax', price=Decimal('4.00'), current_stock=2, salon=self.salon)
+        Item.objects.create(name='Gel', price=Decimal('3.00'), current_stock=50, salon=self.salon)
+        today = timezone.localdate()
+        Payment.objects.create(barber=self.barber, amount=Decimal('6.00'), start_date=today, end_date=today, cashregister=self.cashregister, salon=self.salon)
+
+    def shave(self, hairstyle):
+        Shave.objects.create(
+            barber=self.barber, hairstyle=hairstyle, amount=hairstyle.current_tariff, cashregister=self.cashregister,
+            salon=self.salon, status=Shave.Status.COMPLETED,
+        )
+
+class SalonDashboardTests(SalonDashboardTestMixin, TestCase):
+    def test_every_section_is_computed_with_a_fixed_number_of_queries(self):
+        cache.clear()
+        with self.assertNumQueries(8):
+            dashboard = get_dashboard(self.salon.pk)
+        self.assertEqual(dashboard['stale'], [])
+        today = dashboard['finance']['today']
+        self.assertEqual(today['shave_revenue'], Decimal('25.00'))
+        self.assertEqual(today['shaves'], 3)
+        self.assertEqual(today['income'], Decimal('25.00'))
+        self.assertEqual(today['payroll'], Decimal('6.00'))
+        self.assertEqual(today['net'], Decimal('19.00'))
+        self.assertEqual(dashboard['balances']['totals'], {'USD': CashRegister.objects.get(pk=self.cashregister.pk).balance})
+        self.assertEqual([(row['name'], row['shaves']) for row in dashboard['hairstyles']['last_30_days']], [('Fade', 2), ('Trim', 1)])
+        self.assertEqual([item['name'] for item in dashboard['stock']['alerts']], ['Wax'])
+        self.assertEqual(dashboard['stock']['retail_value'], Decimal('158.00'))
+        self.assertEqual(dashboard['team'], {'barbers': 1, 'active_barbers': 1, 'clients': 1})
+        with self.assertNumQueries(0):
+            self.assertEqual(get_dashboard(self.salon.pk), dashboard)
+
+    def test_changes_mark_only_their_sections_stale(self):
+        get_dashboard(self.salon.pk)
+        Transaction.objects.create(
+            trans_name='Rent', amount=Decimal('7.00'), trans_type=Transaction.TransactionType.EXPENSE,
+            cashregister=self.cashregister, salon=self.salon,
+        )
+        refreshed = []
+        dashboard = get_dashboard(self.salon.pk, refresh=lambda salon_id, names: refreshed.append(names))
+        self.assertEqual(dashboard['stale'], ['balances', 'finance'])
+        self.assertEqual(refreshed, [['balances', 'finance']])
+        self.assertEqual(dashboard['finance']['today']['expenses'], Decimal('0.00'))
+
+    def test_stale_sections_are_served_while_they_are_refreshed(self):
+        get_dashboard(self.salon.pk)
+        self.shave(self.trim)
+        self.assertEqual(get_dashboard(self.salon.pk)['hairstyles']['last_30_days'][1]['shaves'], 1)
+        dashboard = get_dashboard(self.salon.pk)
+        self.assertEqual(dashboard['stale'], [])
+        self.assertEqual(dashboard['hairstyles']['last_30_days'][1]['shaves'], 2)
+        self.assertEqual(dashboard['finance']['today']['shave_revenue'], Decimal('30.00'))
+
+    def test_a_section_is_refreshed_by_one_request_at_a_time(self):
+        get_dashboard(self.salon.pk)
+        Item.objects.create(name='Oil', price=Decimal('2.00'), salon=self.salon)
+        cache.add(DASHBOARD_REFRESH_KEY.format(salon_id=self.salon.pk, section='stock'), True)
+        self.assertEqual(get_dashboard(self.salon.pk)['stale'], ['stock'])
+        self.assertEqual(get_dashboard(self.salon.pk)['stale'], ['stock'])
+        cache.delete(DASHBOARD_REFRESH_KEY.format(salon_id=self.salon.pk, section='stock'))
+        get_dashboard(self.salon.pk)
+        self.assertEqual([item['name'] for item in get_dashboard(self.salon.pk)['stock']['alerts']], ['Oil', 'Wax'])
+
+    def test_endpoint_is_limited_to_the_owner(self):
+        other = CustomUser.objects.create_user(email='other@example.com', password='secret')
+        view = SalonViewSet.as_view({'get': 'dashboard'})
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=self.owner)
+        response = view(request, pk=self.salon.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['team']['clients'], 1)
+        request = APIRequestFactory().get('/')
+        force_authenticate(request, user=other)
+        self.assertEqual(view(request, pk=self.salon.pk).status_code, 404)
+
+class BarberEmploymentTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        self.barber_type = BarberType.objects.create(name='Senior', salon=self.salon)
+        self.open_ended = self.barber('open@example.com', date(2024, 1, 10))
+        self.left = self.barber('left@example.com', date(2024, 1, 1), date(2024, 1, 15))
+        self.inactive = self.barber('inactive@example.com', date(2024, 1, 1), is_active=False)
+
+    def barber(self, email, start_date, end_date=None, is_active=True):
+        user = CustomUser.objects.create_user(email=email, password='secret')
+        return Barber.objects.create(
+            user=user, salon=self.salon, barber_type=self.barber_type, start_date=start_date, end_date=end_date, is_active=is_active,
+        )
+
+    def test_employed_on_and_between(self):
+        self.assertEqual(set(Barber.objects.employed_on(date(2024, 1, 5))), {self.left})
+        self.assertEqual(set(Barber.objects.employed_on(date(2024, 1, 15))), {self.left, self.open_ended})
+        self.assertEqual(set(Barber.objects.employed_on(date(2024, 1, 16))), {self.open_ended})
+        self.assertEqual(set(Barber.objects.employed_between(date(2023, 12, 1), date(2024, 1, 9))), {self.left})
+        self.assertEqual(set(self.salon.get_active_barbers()), {self.open_ended})
+        self.assertTrue(self.left.is_employed_on(date(2024, 1, 15)))
+        self.assertFalse(self.inactive.is_current)
+
+    def test_headcount_matches_employed_on_in_one_query(self):
+        start, end = date(2023, 12, 30), date(2024, 1, 20)
+        with self.assertNumQueries(1):
+            counts = Barber.objects.filter(salon=self.salon).headcount(start, end)
+        self.assertEqual(len(counts), 22)
+        for day, count in counts.items():
+            self.assertEqual(count, Barber.objects.employed_on(day).count(), day)
+
+    def test_headcount_endpoint(self):
+        view = BarberViewSet.as_view({'get': 'headcount'})
+        request = APIRequestFactory().get('/', {'start': '2024-01-14', 'end': '2024-01-16'})
+        force_authenticate(request, user=self.owner)
+        response = view(request)
+        self.assertEqual([row['barbers'] for row in response.data['results']], [2, 2, 1])
+        request = APIRequestFactory().get('/', {'start': '2024-01-16', 'end': '2024-01-14'})
+        force_authenticate(request, user=self.owner)
+        self.assertEqual(view(request).status_code, 400)
+        request = APIRequestFactory().get('/', {'employed_on': '2024-01-05'})
+        force_authenticate(request, user=self.owner)
+        response = BarberViewSet.as_view({'get': 'list'})(request)
+        self.assertEqual([barber['id'] for barber in response.data], [self.left.pk])
+
+class BarberAnalyticsTests(SalonDashboardTestMixin, TestCase):
+    def add_barber(self, email):
+        barber_type = BarberType.objects.get(salon=self.salon)
+        user = CustomUser.objects.create_user(email=email, password='secret', first_name=email.split('@')[0].title())
+        return Barber.objects.create(user=user, salon=self.salon, barber_type=barber_type, start_date=date(2024, 1, 1))
+
+    def test_metrics_and_window_ranks(self):
+        junior = self.add_barber('junior@example.com')
+        Shave.objects.create(
+            barber=junior, hairstyle=self.trim, amount=Decimal('5.00'), cashregister=self.cashregister,
+            salon=self.salon, status=Shave.Status.COMPLETED,
+        )
+        gel = Item.objects.get(name='Gel')
+        ItemPurchase.objects.create(item=gel, quantity=10, purchase_price=Decimal('1.50'), cashregister=self.cashregister, salon=self.salon)
+        shave = Shave.objects.filter(barber=self.barber).first()
+        ItemUsed.objects.create(item=gel, shave=shave, barber=self.barber, quantity=2, salon=self.salon)
+        with self.assertNumQueries(4):
+            analytics = BarberAnalytics(self.salon.pk, 'month').compute()
+        senior, other = analytics['barbers']
+        self.assertEqual(senior['id'], self.barber.pk)
+        totals = senior['totals']
+        self.assertEqual((totals['shaves'], totals['revenue'], totals['average_ticket']), (3, Decimal('25.00'), Decimal('8.33')))
+        self.assertEqual((totals['items_used'], totals['payout'], totals['payout_ratio']), (2, Decimal('6.00'), 0.24))
+        self.assertEqual(totals['consumable_cost'], (2 * Item.objects.get(pk=gel.pk).average_cost).quantize(Decimal('0.01')))
+        month = senior['periods'][-1]
+        self.assertEqual((month['revenue_rank'], month['revenue_share'], month['running_revenue']), (1, 0.8333, Decimal('25.00')))
+        self.assertEqual((other['name'], other['periods'][-1]['revenue_rank']), ('Junior', 2))
+
+    def test_query_count_does_not_depend_on_the_barbers(self):
+        for index in range(5):
+            self.add_barber(f'barber{index}@example.com')
+        with self.assertNumQueries(4):
+            analytics = BarberAnalytics(self.salon.pk, 'week').compute()
+        self.assertEqual(len(analytics['barbers']), 6)
+
+    def test_cached_until_a_shave_changes(self):
+        first = get_barber_analytics(self.salon.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_barber_analytics(self.salon.pk), first)
+        self.shave(self.fade)
+        self.assertEqual(get_barber_analytics(self.salon.pk)['barbers'][0]['totals']['shaves'], 4)
+
+    def test_endpoint_and_command(self):
+        view = SalonViewSet.as_view({'get': 'barber_analytics'})
+        request = APIRequestFactory().get('/', {'period': 'week', 'start': '2024-01-01'})
+        force_authenticate(request, user=self.owner)
+        response = view(request, pk=self.salon.pk)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['start'], '2024-01-01')
+        for params in ({'period': 'year'}, {'start': '2024-02-30'}, {'start': '2024-03-01', 'end': '2024-02-01'}):
+            request = APIRequestFactory().get('/', params)
+            force_authenticate(request, user=self.owner)
+            self.assertEqual(view(request, pk=self.salon.pk).status_code, 400)
+        out = StringIO()
+        call_command('barber_analytics', '--salon', str(self.salon.pk), stdout=out)
+        self.assertIn('barber@example.com', out.getvalue())
+
+@override_settings(ROOT_URLCONF='saloon.tests')
+class AsyncEndpointTests(SalonDashboardTestMixin, TestCase):
+    async def test_salon_search_pages_active_salons(self):
+        await Salon.objects.acreate(name='Second salon', description='Beards', owner=self.owner)
+        await Salon.objects.acreate(name='Closed salon', description='Beards', owner=self.owner, is_active=False)
+        response = await self.async_client.get('/api/saloon/async/salons/', {'search': 'beard'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {
+            'count': 1, 'page': 1, 'results': [{'id': response.json()['results'][0]['id'], 'name': 'Second salon', 'description': 'Beards', 'address': None}],
+        })
+        self.assertIn('desc="2 queries"', response['Server-Timing'])
+
+    async def test_dashboard_matches_the_sync_endpoint(self):
+        response = await self.async_client.get(f'/api/saloon/async/salons/{self.salon.pk}/dashboard/')
+        self.assertEqual(response.status_code, 403)
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get(f'/api/saloon/async/salons/{self.salon.pk}/dashboard/')
+        self.assertEqual(response.status_code, 200)
+        synced = await self.async_client.get(f'/api/saloon/salons/{self.salon.pk}/dashboard/')
+        self.assertEqual(response.json(), synced.json())
+        self.assertEqual(response.json()['finance']['today']['shaves'], 3)
+        other = await CustomUser.objects.acreate(email='other@example.com')
+        await self.async_client.aforce_login(other)
+        response = await self.async_client.get(f'/api/saloon/async/salons/{self.salon.pk}/dashboard/')
+        self.assertEqual(response.status_code, 404)
+
+
+@override_settings(ROOT_URLCONF='saloon.tests')
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', description='Fades and beard trims', owner=self.owner)
+        self.other_salon = Salon.objects.create(name='Other salon', owner=CustomUser.objects.create_user(email='other@example.com', password='secret'))
+        self.jean = Client.objects.create(name='Jean Dupont', phone='+243812345678', salon=self.salon)
+        self.jeanne = Client.objects.create(name='Jeanne Jean-Baptiste', salon=self.salon)
+        Client.objects.create(name='Jean Other', salon=self.other_salon)
+        Hairstyle.objects.create(name='Skin fade', current_tariff=Decimal('10.00'), salon=self.salon)
+
+    def names(self, rows):
+        return [row.name for row in rows]
+
+    def test_words_match_prefixes_within_the_salons(self):
+        self.assertEqual(self.names(search('clients', 'jean', [self.salon.pk])), ['Jeanne Jean-Baptiste', 'Jean Dupont'])
+        self.assertEqual(self.names(search('clients', 'dup je', [self.salon.pk])), ['Jean Dupont'])
+        self.assertEqual(self.names(search('clients', '24381', [self.salon.pk])), ['Jean Dupont'])
+        self.assertEqual(len(search('clients', 'jean')), 3)
+        self.assertEqual(len(search('clients', 'jean', [])), 0)
+        self.assertEqual(len(search('clients', '  "*', [self.salon.pk])), 0)
+        self.assertEqual(self.names(search('salons', 'BEARD')), ['Main salon'])
+
+    def test_the_index_follows_changes(self):
+        self.jean.name = 'Paul Dupont'
+        self.jean.save()
+        self.assertEqual(self.names(search('clients', 'jean', [self.salon.pk])), ['Jeanne Jean-Baptiste'])
+        self.assertEqual(self.names(search('clients', 'paul', [self.salon.pk])), ['Paul Dupont'])
+        self.jeanne.delete()
+        self.assertEqual(len(search('clients', 'jean', [self.salon.pk])), 0)
+
+    def test_list_views_search(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('salon:client_list', kwargs={'salon_id': self.salon.pk}), {'search': 'dupont'})
+        self.assertEqual(self.names(response.context['clients']), ['Jean Dupont'])
+        response = self.client.get(reverse('salon:salon_list'), {'search': 'fades'})
+        self.assertEqual(self.names(response.context['salons']), ['Main salon'])
+
+    def test_api_is_limited_to_the_owned_salons(self):
+        self.client.force_login(self.owner)
+        response = self.client.get('/api/saloon/search/autocomplete/', {'type': 'clients', 'q': 'jea'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': self.jeanne.pk, 'name': 'Jeanne Jean-Baptiste', 'phone': None},
+            {'id': self.jean.pk, 'name': 'Jean Dupont', 'phone': '+243812345678'},
+        ])
+        response = self.client.get('/api/saloon/search/', {'type': 'hairstyles', 'q': 'fade', 'salon': self.salon.pk})
+        self.assertEqual([row['name'] for row in response.json()['results']], ['Skin fade'])
+        response = self.client.get('/api/saloon/search/', {'type': 'clients', 'q': 'jean', 'salon': self.other_salon.pk})
+        self.assertEqual(response.status_code, 400)
+        response = self.client.get('/api/saloon/search/', {'type': 'barbers', 'q': 'jean'})
+        self.assertEqual(response.status_code, 400)
+
+class ReferenceCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        BarberType.objects.create(name='Senior', salon=self.salon)
+        other = Salon.objects.create(name='Other salon', owner=CustomUser.objects.create_user(email='other@example.com', password='secret'))
+        BarberType.objects.create(name='Trainee', salon=other)
+
+    def render_barber_types(self):
+        return str(BarberForm(salon_id=self.salon.pk)['barber_type'])
+
+    def test_barber_form_choices_come_from_the_cache(self):
+        self.assertIn('Senior - Main salon', self.render_barber_types())
+        with self.assertNumQueries(0):
+            html = self.render_barber_types()
+        self.assertNotIn('Trainee', html)
+        with CaptureQueriesContext(connection) as context:
+            str(BarberForm(salon_id=self.salon.pk))
+        self.assertFalse([query for query in context.captured_queries if 'saloon_barbertype' in query['sql']])
+
+    def test_saves_and_deletes_bump_the_version(self):
+        self.render_barber_types()
+        junior = BarberType.objects.create(name='Junior', salon=self.salon)
+        self.assertIn('Junior - Main salon', self.render_barber_types())
+        self.salon.name = 'Renamed salon'
+        self.salon.save()
+        self.assertIn('Senior - Renamed salon', self.render_barber_types())
+        junior.delete()
+        self.assertNotIn('Junior', self.render_barber_types())
+
+    def test_other_salons_barber_types_are_rejected(self):
+        field = BarberForm(salon_id=self.salon.pk).fields['barber_type']
+        with self.assertRaises(ValidationError):
+            field.clean(BarberType.objects.get(name='Trainee').pk)
+        self.assertEqual(field.clean(BarberType.objects.get(name='Senior').pk).name, 'Senior')
+
+    def test_per_salon_tables_need_a_salon(self):
+        with self.assertRaises(ValueError):
+            get_reference('barber_types')
+        # Without a salon the form keeps querying its field
+        self.assertIn('Trainee', str(BarberForm()['barber_type']))
+
+    def test_serializers_without_a_request_query_per_salon_fields(self):
+        field = BarberSerializer().fields['barber_type']
+        senior = BarberType.objects.get(name='Senior')
+        self.assertEqual(field.to_internal_value(senior.pk), senior)
+        self.assertIn(senior.pk, field.get_choices())
+        with self.assertRaises(serializers.ValidationError):
+            field.to_internal_value(0)
+
+class StyledFormTests(TestCase):
+    def attrs(self, form):
+        return {name: field.widget.attrs for name, field in form.fields.items()}
+
+    def test_widgets_are_styled_once_per_form_class(self):
+        first = SalonForm()
+        self.assertEqual(first.fields['name'].widget.attrs['class'], FORM_CONTROL_CLASS)
+        self.assertEqual(SalonForm.base_fields['name'].widget.attrs['class'], FORM_CONTROL_CLASS)
+        self.assertEqual(self.attrs(SalonForm()), self.attrs(first))
+        # Later instances get the styled attributes as copies
+        first.fields['description'].widget.attrs['rows'] = 3
+        self.assertEqual(SalonForm().fields['description'].widget.attrs['rows'], '10')
+        # Dates use the widgets BarberForm gives them after styling
+        form = BarberForm()
+        self.assertEqual(form.fields['start_date'].widget.input_type, 'date')
+        self.assertEqual(form.fields['start_date'].widget.attrs, {'class': FORM_CONTROL_CLASS})
+
+    def test_instances_copied_before_the_class_was_styled_are_styled(self):
+        class LateForm(SalonForm):
+            pass
+
+        # What an instance created in another thread copied before the class was styled
+        unstyled = copy.deepcopy(LateForm.base_fields)
+        LateForm()
+        form = LateForm()
+        form.fields = unstyled
+        form.style_fields()
+        self.assertEqual(self.attrs(form), self.attrs(LateForm()))
+        self.assertEqual(form.fields['name'].widget.attrs['class'], FORM_CONTROL_CLASS)
+
+    def test_parent_forms_are_left_alone(self):
+        from django.contrib.auth.forms import AuthenticationForm
+        from accounts.forms import CustomAuthenticationForm
+        self.assertIn('class', CustomAuthenticationForm().fields['username'].widget.attrs)
+        self.assertNotIn('class', AuthenticationForm.base_fields['username'].widget.attrs)
+        self.assertNotIn('class', AuthenticationForm().fields['username'].widget.attrs)
 
-# Create your tests here.
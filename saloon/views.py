@@ -4,18 +4,33 @@ from django.urls import reverse_lazy
 from django.shortcuts import get_object_or_404, redirect
 from django.contrib import messages
 from django.utils.translation import gettext_lazy as _
-from django.db.models import Q
 from .models import Salon, Barber, Client, BarberType
+from .ownership import get_salon_ownership
+from .reference import get_reference
+from .search import search
 from .forms import SalonForm, BarberForm, ClientForm, BarberTypeForm
 
 class SalonOwnerMixin(UserPassesTestMixin):
     def test_func(self):
         salon = self.get_object()
-        return self.request.user == salon.owner
+        return get_salon_ownership(self.request).owns_object(salon)
+
+    def get_object(self, queryset=None):
+        # test_func and the view both fetch the salon; load it once
+        if queryset is not None:
+            return super().get_object(queryset)
+        if not hasattr(self, '_salon'):
+            self._salon = super().get_object()
+        return self._salon
 
 class HasSalonMixin(UserPassesTestMixin):
     def test_func(self):
-        return Salon.objects.filter(owner=self.request.user).exists()
+        return get_salon_ownership(self.request).has_salon()
+
+    def get_salon(self):
+        if not hasattr(self, '_salon'):
+            self._salon = get_object_or_404(Salon, pk=self.kwargs.get('salon_id'))
+        return self._salon
 
 class SalonListView(ListView):
     model = Salon
@@ -27,10 +42,7 @@ class SalonListView(ListView):
         queryset = Salon.objects.filter(is_active=True)
         search_query = self.request.GET.get('search')
         if search_query:
-            queryset = queryset.filter(
-                Q(name__icontains=search_query) |
-                Q(description__icontains=search_query)
-            )
+            return search('salons', search_query, queryset=queryset)
         return queryset.order_by('-created_at')
 
 class SalonCreateView(LoginRequiredMixin, CreateView):
@@ -56,6 +68,7 @@ class SalonUpdateView(LoginRequiredMixin, SalonOwnerMixin, UpdateView):
 
 class SalonDetailView(LoginRequiredMixin, SalonOwnerMixin, DetailView):
     model = Salon
+    queryset = Salon.objects.select_related('owner')
     template_name = 'saloon/salon_detail.html'
 
     def get_context_data(self, **kwargs):
@@ -96,12 +109,7 @@ class BarberListView(LoginRequiredMixin, HasSalonMixin, ListView):
     paginate_by = 10
 
     def test_func(self):
-        salon = self.get_salon()
-        return self.request.user == salon.owner
-    
-    def get_salon(self):
-        salon_id = self.kwargs.get('salon_id')
-        return get_object_or_404(Salon, pk=salon_id)
+        return get_salon_ownership(self.request).owns(self.get_salon())
 
     def get_queryset(self):
         salon = self.get_salon()
@@ -120,6 +128,9 @@ class BarberCreateView(LoginRequiredMixin, HasSalonMixin, CreateView):
     def get_success_url(self):
         return reverse_lazy('salon:barber_list')
 
+    def get_form_kwargs(self):
+        return dict(super().get_form_kwargs(), salon_id=get_salon_ownership(self.request).first_salon_id)
+
     def form_valid(self, form):
         form.instance.salon = get_object_or_404(Salon, owner=self.request.user)
         messages.success(self.request, _("Barber created successfully."))
@@ -134,8 +145,7 @@ class BarberUpdateView(LoginRequiredMixin, HasSalonMixin, UpdateView):
         return reverse_lazy('salon:barber_list')
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, owner=self.request.user)
-        return Barber.objects.filter(salon=salon)
+        return Barber.objects.filter(salon_id__in=get_salon_ownership(self.request).salon_ids)
 
     def form_valid(self, form):
         messages.success(self.request, _("Barber updated successfully."))
@@ -149,8 +159,7 @@ class BarberDeleteView(LoginRequiredMixin, HasSalonMixin, DeleteView):
         return reverse_lazy('salon:barber_list')
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, owner=self.request.user)
-        return Barber.objects.filter(salon=salon)
+        return Barber.objects.filter(salon_id__in=get_salon_ownership(self.request).salon_ids)
 
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, _("Barber deleted successfully."))
@@ -168,16 +177,14 @@ class ClientListView(LoginRequiredMixin, HasSalonMixin, ListView):
     paginate_by = 10
 
     def test_func(self):
-        salon = self.get_salon()
-        return self.request.user == salon.owner
-    
-    def get_salon(self):
-        salon_id = self.kwargs.get('salon_id')
-        return get_object_or_404(Salon, pk=salon_id)
+        return get_salon_ownership(self.request).owns(self.get_salon())
 
     def get_queryset(self):
         salon = self.get_salon()
-        return BarberType.objects.filter(salon=salon).order_by('-created_at')
+        search_query = self.request.GET.get('search')
+        if search_query:
+            return search('clients', search_query, salon_ids=[salon.pk])
+        return Client.objects.filter(salon=salon).order_by('-created_at')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -206,8 +213,7 @@ class ClientUpdateView(LoginRequiredMixin, HasSalonMixin, UpdateView):
         return reverse_lazy('salon:client_list')
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, owner=self.request.user)
-        return Client.objects.filter(salon=salon)
+        return Client.objects.filter(salon_id__in=get_salon_ownership(self.request).salon_ids)
 
     def form_valid(self, form):
         messages.success(self.request, _("Client updated successfully."))
@@ -221,8 +227,7 @@ class ClientDeleteView(LoginRequiredMixin, HasSalonMixin, DeleteView):
         return reverse_lazy('salon:client_list')
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, owner=self.request.user)
-        return Client.objects.filter(salon=salon)
+        return Client.objects.filter(salon_id__in=get_salon_ownership(self.request).salon_ids)
 
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, _("Client deleted successfully."))
@@ -240,16 +245,11 @@ class BarberTypeListView(LoginRequiredMixin, HasSalonMixin, ListView):
     paginate_by = 10
 
     def test_func(self):
-        salon = self.get_salon()
-        return self.request.user == salon.owner
-    
-    def get_salon(self):
-        salon_id = self.kwargs.get('salon_id')
-        return get_object_or_404(Salon, pk=salon_id)
+        return get_salon_ownership(self.request).owns(self.get_salon())
 
     def get_queryset(self):
         salon = self.get_salon()
-        return BarberType.objects.filter(salon=salon).order_by('-created_at')
+        return sorted(get_reference('barber_types', salon.pk), key=lambda barber_type: barber_type.created_at, reverse=True)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -278,8 +278,7 @@ class BarberTypeUpdateView(LoginRequiredMixin, HasSalonMixin, UpdateView):
         return reverse_lazy('salon:barber_type_list')
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, owner=self.request.user)
-        return BarberType.objects.filter(salon=salon)
+        return BarberType.objects.filter(salon_id__in=get_salon_ownership(self.request).salon_ids)
 
     def form_valid(self, form):
         messages.success(self.request, _("Barber Type updated successfully."))
@@ -287,7 +286,7 @@ class BarberTypeUpdateView(LoginRequiredMixin, HasSalonMixin, UpdateView):
     
     def test_func(self):
         barber_type = self.get_object()
-        return self.request.user == barber_type.salon.owner
+        return get_salon_ownership(self.request).owns_object(barber_type)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -302,8 +301,7 @@ class BarberTypeDeleteView(LoginRequiredMixin, HasSalonMixin, DeleteView):
         return reverse_lazy('salon:barber_type_list')
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, owner=self.request.user)
-        return BarberType.objects.filter(salon=salon)
+        return BarberType.objects.filter(salon_id__in=get_salon_ownership(self.request).salon_ids)
 
     def delete(self, request, *args, **kwargs):
         messages.success(self.request, _("Barber Type deleted successfully."))
@@ -1,5 +1,6 @@
 from django.contrib import admin
-from .models import Currency, CashRegister, PaymentType, Payment, Transaction
+from saloon.ownership import get_salon_ownership
+from .models import Currency, ExchangeRate, CashRegister, PaymentType, Payment, Transaction
 
 class CurrencyAdmin(admin.ModelAdmin):
     list_display = ('code', 'name', 'is_default')
@@ -7,6 +8,13 @@ class CurrencyAdmin(admin.ModelAdmin):
 
 admin.site.register(Currency, CurrencyAdmin)
 
+class ExchangeRateAdmin(admin.ModelAdmin):
+    list_display = ('currency', 'date', 'rate')
+    list_filter = ('currency',)
+    date_hierarchy = 'date'
+
+admin.site.register(ExchangeRate, ExchangeRateAdmin)
+
 class CashRegisterAdmin(admin.ModelAdmin):
     list_display = ('name', 'balance', 'currency', 'salon')
     list_filter = ('salon', 'currency')
@@ -16,20 +24,20 @@ class CashRegisterAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(CashRegister, CashRegisterAdmin)
 
@@ -49,20 +57,20 @@ class PaymentAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Payment, PaymentAdmin)
 
@@ -70,24 +78,25 @@ class TransactionAdmin(admin.ModelAdmin):
     list_display = ('trans_name', 'amount', 'currency', 'trans_type', 'date_trans', 'salon')
     list_filter = ('trans_type', 'salon', 'currency')
     search_fields = ('trans_name', 'salon__name')
+    readonly_fields = ('shave', 'purchase', 'payment')
 
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Transaction, TransactionAdmin)
@@ -0,0 +1,111 @@
+''' Atomic cash register balance updates '''
+
+import logging
+import threading
+import time
+from contextlib import nullcontext
+from decimal import Decimal
+from django.apps import apps
+from django.db import connections, router, transaction
+from django.db.models import F
+
+logger = logging.getLogger(__name__)
+
+CENT = Decimal('0.01')
+SLOW_LOCK_WAIT = 0.1
+
+class BalanceMetrics:
+    """
+    Process-wide counters for balance writes. ``wait`` is the time spent in
+    the locking statement, which is where a writer queues behind another
+    till's open transaction.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.updates = 0
+            self.total_wait = 0.0
+            self.max_wait = 0.0
+            self.slow_waits = 0
+
+    def record(self, wait, updates=1):
+        with self._lock:
+            self.updates += updates
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if wait >= SLOW_LOCK_WAIT:
+                self.slow_waits += 1
+        if wait >= SLOW_LOCK_WAIT:
+            logger.warning("Cash register balance update waited %.3fs for a row lock", wait)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'updates': self.updates,
+                'total_wait': self.total_wait,
+                'max_wait': self.max_wait,
+                'slow_waits': self.slow_waits,
+            }
+
+balance_metrics = BalanceMetrics()
+
+def supports_update_returning(connection):
+    if connection.vendor == 'postgresql':
+        return True
+    if connection.vendor == 'sqlite':
+        return connection.Database.sqlite_version_info >= (3, 35)
+    return False
+
+def _apply(CashRegister, connection, cashregister_id, delta):
+    field = CashRegister._meta.get_field('balance')
+    if supports_update_returning(connection):
+        table = connection.ops.quote_name(CashRegister._meta.db_table)
+        column = connection.ops.quote_name(field.column)
+        pk_column = connection.ops.quote_name(CashRegister._meta.pk.column)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {table} SET {column} = {column} + %s WHERE {pk_column} = %s RETURNING {column}',
+                [delta, cashregister_id],
+            )
+            row = cursor.fetchone()
+        if row is None:
+            raise CashRegister.DoesNotExist(cashregister_id)
+        return field.to_python(row[0]).quantize(CENT)
+    queryset = CashRegister.objects.filter(pk=cashregister_id)
+    if not queryset.update(balance=F('balance') + delta):
+        raise CashRegister.DoesNotExist(cashregister_id)
+    return queryset.values_list('balance', flat=True).get()
+
+def apply_balance_delta(cashregister_id, delta):
+    """
+    Add ``delta`` to one register with a single ``UPDATE ... RETURNING``
+    that only touches the balance column, and return the new balance.
+    """
+    return apply_balance_deltas({cashregister_id: delta})[cashregister_id]
+
+def apply_balance_deltas(deltas, lock=False):
+    """
+    Apply ``{cashregister_id: delta}`` and return the new balances. With
+    ``lock=True`` every register is first locked with ``SELECT ... FOR UPDATE``
+    in primary key order, so concurrent batches touching the same registers
+    queue instead of deadlocking.
+    """
+    CashRegister = apps.get_model('saloonfinance', 'CashRegister')
+    connection = connections[router.db_for_write(CashRegister)]
+    deltas = {cashregister_id: Decimal(delta) for cashregister_id, delta in deltas.items()}
+    if not deltas:
+        return {}
+    balances = {}
+    # A single UPDATE is atomic on its own; only batches need a transaction
+    atomic = transaction.atomic(using=connection.alias, savepoint=False) if lock or len(deltas) > 1 else nullcontext()
+    with atomic:
+        started = time.monotonic()
+        if lock:
+            list(CashRegister.objects.select_for_update().filter(pk__in=deltas).order_by('pk').values_list('pk', flat=True))
+        for cashregister_id in sorted(deltas):
+            balances[cashregister_id] = _apply(CashRegister, connection, cashregister_id, deltas[cashregister_id])
+        balance_metrics.record(time.monotonic() - started, updates=len(deltas))
+    return balances
@@ -0,0 +1,38 @@
+''' Cache helpers for the saloonfinance app '''
+
+import uuid
+from django.core.cache import cache
+
+DEFAULT_CURRENCY_KEY = 'saloonfinance:default_currency'
+DEFAULT_CURRENCY_VERSION_KEY = 'saloonfinance:default_currency:version'
+
+# Process-local copy of the resolved default currency, tagged with the
+# version it was read under so that a bump invalidates it. Other workers see
+# the bump only through a shared cache backend (see CACHES in the settings).
+_local_default_currency = {}
+
+def get_default_currency_version():
+    version = cache.get(DEFAULT_CURRENCY_VERSION_KEY)
+    if version is None:
+        cache.add(DEFAULT_CURRENCY_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(DEFAULT_CURRENCY_VERSION_KEY)
+    return version
+
+def get_default_currency_id(loader):
+    """
+    Return the default currency id, calling ``loader`` only when neither the
+    process-local copy nor the shared cache holds a value for the current version.
+    """
+    version = get_default_currency_version()
+    if _local_default_currency.get('version') == version:
+        return _local_default_currency['id']
+    currency_id = cache.get(DEFAULT_CURRENCY_KEY, version=version)
+    if currency_id is None:
+        currency_id = loader()
+        cache.set(DEFAULT_CURRENCY_KEY, currency_id, None, version=version)
+    _local_default_currency.update(version=version, id=currency_id)
+    return currency_id
+
+def invalidate_default_currency():
+    cache.set(DEFAULT_CURRENCY_VERSION_KEY, uuid.uuid4().hex, None)
+    _local_default_currency.clear()
@@ -0,0 +1,69 @@
+''' Streaming CSV and NDJSON exports of salon history tables '''
+
+import csv
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+EXPORT_CHUNK_SIZE = 2000
+LINES_PER_WRITE = 500
+# Leading characters that make a spreadsheet read a cell as a formula
+FORMULA_PREFIXES = ('=', '+', '-', '@', '\t', '\r')
+
+class Echo:
+    """
+    File-like object whose write() hands the line back, so csv.writer can
+    format rows without buffering them.
+    """
+    def write(self, value):
+        return value
+
+def batched_lines(lines):
+    batch = []
+    for line in lines:
+        batch.append(line)
+        if len(batch) >= LINES_PER_WRITE:
+            yield ''.join(batch)
+            batch = []
+    if batch:
+        yield ''.join(batch)
+
+def csv_safe(row):
+    """
+    Quote the text cells a spreadsheet would run as a formula with a leading
+    apostrophe. Numbers, including negative amounts, are left as they are.
+    """
+    return [
+        "'" + value if isinstance(value, str) and value.startswith(FORMULA_PREFIXES) else value
+        for value in row
+    ]
+
+def csv_lines(header, rows):
+    writer = csv.writer(Echo())
+    # Send the header on its own so the client gets a first byte before the query runs
+    yield writer.writerow(header)
+    yield from batched_lines(writer.writerow(csv_safe(row)) for row in rows)
+
+def ndjson_lines(header, rows):
+    encoder = DjangoJSONEncoder(separators=(',', ':'))
+    lines = (encoder.encode(dict(zip(header, row))) + '\n' for row in rows)
+    yield next(lines, '')
+    yield from batched_lines(lines)
+
+EXPORT_FORMATS = {
+    'csv': ('text/csv', csv_lines),
+    'ndjson': ('application/x-ndjson', ndjson_lines),
+}
+
+def export_rows(queryset, fields, chunk_size=EXPORT_CHUNK_SIZE):
+    return queryset.values_list(*fields).iterator(chunk_size=chunk_size)
+
+def streaming_export(queryset, fields, export_format, filename, chunk_size=EXPORT_CHUNK_SIZE):
+    """
+    Stream ``fields`` of every row of ``queryset``. Rows are fetched as
+    tuples in chunks of ``chunk_size``, so memory use does not grow with the
+    size of the export.
+    """
+    content_type, render = EXPORT_FORMATS[export_format]
+    response = StreamingHttpResponse(render(fields, export_rows(queryset, fields, chunk_size)), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{export_format}"'
+    return response
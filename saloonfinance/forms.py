@@ -2,29 +2,20 @@ from django import forms
 from .models import Currency, CashRegister, PaymentType, Payment, Transaction
 from django.templatetags.static import static
 from django.utils.translation import gettext_lazy as _
+from saloon.forms import ReferenceChoicesMixin
+from saloon.styling import StyledFormMixin
 
-class StyleFormMixin:
-    def style_fields(self):
-        for field_name, field in self.fields.items():
-            if isinstance(field.widget, (forms.TextInput, forms.EmailInput, forms.Select, forms.Textarea, forms.NumberInput)):
-                field.widget.attrs.update({
-                    'class': 'w-full px-3 py-2 text-[#1E283D] border rounded-lg focus:outline-none focus:ring-2 focus:ring-[#4B49AC] focus:border-transparent',
-                    'style': 'border-color: #E5E5E5;'
-                })
-            elif isinstance(field.widget, forms.CheckboxInput):
-                field.widget.attrs.update({
-                    'class': 'form-checkbox h-5 w-5 text-[#4B49AC]'
-                })
-            elif isinstance(field.widget, forms.FileInput):
-                field.widget.attrs.update({
-                    'class': 'w-full px-3 py-2 text-[#1E283D] border rounded-lg focus:outline-none focus:ring-2 focus:ring-[#4B49AC] focus:border-transparent file:mr-4 file:py-2 file:px-4 file:rounded-full file:border-0 file:text-sm file:font-semibold file:bg-[#98BDFF] file:text-[#1E283D] hover:file:bg-[#7DA0FA]',
-                    'style': 'border-color: #E5E5E5;'
-                })
-            elif isinstance(field.widget, forms.Select):
-                field.widget.attrs.update({
-                    'class': 'select2',
-                    'data-placeholder': _('Select an option...')
-                })
+FORM_CONTROL_CLASS = 'w-full px-3 py-2 text-[#1E283D] border rounded-lg focus:outline-none focus:ring-2 focus:ring-[#4B49AC] focus:border-transparent'
+CHECKBOX_CLASS = 'form-checkbox h-5 w-5 text-[#4B49AC]'
+FILE_INPUT_CLASS = f'{FORM_CONTROL_CLASS} file:mr-4 file:py-2 file:px-4 file:rounded-full file:border-0 file:text-sm file:font-semibold file:bg-[#98BDFF] file:text-[#1E283D] hover:file:bg-[#7DA0FA]'
+BORDER_COLOR = '#E5E5E5'
+
+class StyleFormMixin(StyledFormMixin):
+    widget_styles = (
+        ((forms.TextInput, forms.EmailInput, forms.Select, forms.Textarea, forms.NumberInput), {'class': FORM_CONTROL_CLASS, 'style': f'border-color: {BORDER_COLOR};'}),
+        ((forms.CheckboxInput,), {'class': CHECKBOX_CLASS}),
+        ((forms.FileInput,), {'class': FILE_INPUT_CLASS, 'style': f'border-color: {BORDER_COLOR};'}),
+    )
 
 class CurrencyForm(forms.ModelForm, StyleFormMixin):
     """
@@ -39,11 +30,13 @@ class CurrencyForm(forms.ModelForm, StyleFormMixin):
         super().__init__(*args, **kwargs)
         self.style_fields()
 
-class CashRegisterForm(forms.ModelForm, StyleFormMixin):
+class CashRegisterForm(forms.ModelForm, StyleFormMixin, ReferenceChoicesMixin):
     """
     Form for managing Cash Registers.
     Includes fields for name, balance, currency, and associated salon.
     """
+    reference_fields = {'currency': 'currencies'}
+
     class Meta:
         model = CashRegister
         fields = ['name', 'balance', 'currency', 'salon']
@@ -51,6 +44,7 @@ class CashRegisterForm(forms.ModelForm, StyleFormMixin):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.style_fields()
+        self.use_reference_choices()
 
 class PaymentTypeForm(forms.ModelForm, StyleFormMixin):
     class Meta:
@@ -62,7 +56,9 @@ class PaymentTypeForm(forms.ModelForm, StyleFormMixin):
         self.style_fields()
         self.fields['description'].widget.attrs.update({'rows': 3})
 
-class PaymentForm(forms.ModelForm, StyleFormMixin):
+class PaymentForm(forms.ModelForm, StyleFormMixin, ReferenceChoicesMixin):
+    reference_fields = {'currency': 'currencies', 'payment_type': 'payment_types'}
+
     class Meta:
         model = Payment
         fields = ['barber', 'amount', 'currency', 'exchange_rate', 'start_date', 'end_date', 'payment_type', 'cashregister', 'date_payment', 'salon']
@@ -70,6 +66,7 @@ class PaymentForm(forms.ModelForm, StyleFormMixin):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.style_fields()
+        self.use_reference_choices()
         self.fields['start_date'].widget = forms.DateInput(attrs={'type': 'date'})
         self.fields['end_date'].widget = forms.DateInput(attrs={'type': 'date'})
         self.fields['date_payment'].widget = forms.DateInput(attrs={'type': 'date'})
@@ -82,7 +79,9 @@ class PaymentForm(forms.ModelForm, StyleFormMixin):
             raise forms.ValidationError(_("Start date must be before end date."))
         return cleaned_data
 
-class TransactionForm(forms.ModelForm, StyleFormMixin):
+class TransactionForm(forms.ModelForm, StyleFormMixin, ReferenceChoicesMixin):
+    reference_fields = {'currency': 'currencies'}
+
     class Meta:
         model = Transaction
         fields = ['trans_name', 'amount', 'currency', 'exchange_rate', 'date_trans', 'trans_type', 'cashregister', 'salon']
@@ -90,6 +89,7 @@ class TransactionForm(forms.ModelForm, StyleFormMixin):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self.style_fields()
+        self.use_reference_choices()
         self.fields['date_trans'].widget = forms.DateInput(attrs={'type': 'date'})
         self.fields['trans_type'].widget = forms.Select(choices=Transaction.TransactionType.choices)
     
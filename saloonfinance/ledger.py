@@ -0,0 +1,146 @@
+''' Posting of transactions, the only writer of cash register balances '''
+
+from collections import defaultdict
+from decimal import Decimal
+from django.apps import apps
+from django.db import models, transaction
+from django.db.models import QuerySet
+from saloon.dashboard import invalidate_dashboard
+from .balances import apply_balance_deltas
+from .rollups import RollupDeltas, transaction_entry
+
+# The Transaction field pointing back at each kind of source document
+SOURCE_FIELDS = {
+    'saloonservices.shave': 'shave',
+    'salooninventory.itempurchase': 'purchase',
+    'saloonfinance.payment': 'payment',
+}
+# Copied from a source's freshly built transaction onto the posted one
+POSTED_FIELDS = (
+    'trans_name', 'amount', 'currency_id', 'exchange_rate', 'amount_in_default_currency',
+    'date_trans', 'trans_type', 'cashregister_id', 'salon_id',
+)
+
+def source_field(source):
+    return SOURCE_FIELDS[source._meta.label_lower]
+
+def signed_amount(entry):
+    Transaction = apps.get_model('saloonfinance', 'Transaction')
+    key, amount, _ = entry
+    return amount if key[4] == Transaction.TransactionType.INCOME else -amount
+
+def stored_value(field, value):
+    # What the column will hold, so an unchanged source is not reposted
+    if isinstance(field, models.DecimalField) and value is not None:
+        return Decimal(value).quantize(Decimal(1).scaleb(-field.decimal_places))
+    return field.to_python(value)
+
+def deleted_with_source(origin, source):
+    """
+    Whether ``source`` is being deleted on its own (its transaction is
+    reversed) rather than cascaded from a salon, barber or item, in which
+    case the money still moved and the transaction is kept.
+    """
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return origin is None or issubclass(model, type(source))
+
+class LedgerService:
+    """
+    Collects changes to transactions and applies them with one balance
+    delta per touched cash register and one rollup delta per touched day.
+    The transactions of shaves, purchases and payments point back at their
+    source, so reposting or reversing a source is one indexed lookup.
+    """
+    def __init__(self):
+        self.balances = defaultdict(Decimal)
+        self.rollups = RollupDeltas()
+        self.salon_ids = set()
+
+    def move(self, previous, current):
+        """
+        Account for a transaction going from the rollup entry ``previous``
+        to ``current``; None stands for no transaction.
+        """
+        for entry, sign in ((previous, -1), (current, 1)):
+            if entry is None:
+                continue
+            self.balances[entry[0][1]] += sign * signed_amount(entry)
+            self.rollups.add(entry, sign)
+            self.salon_ids.add(entry[0][0])
+
+    def post_new(self, sources):
+        """
+        Create the transactions of newly saved sources with one insert.
+        """
+        Transaction = apps.get_model('saloonfinance', 'Transaction')
+        transactions = [built for built in (source.build_transaction() for source in sources) if built is not None]
+        transactions = Transaction.objects.bulk_create(transactions)
+        for posted in transactions:
+            posted._rollup_entry = transaction_entry(posted)
+            self.move(None, posted._rollup_entry)
+        return transactions
+
+    def apply(self):
+        deltas = {cashregister_id: delta for cashregister_id, delta in self.balances.items() if delta}
+        with transaction.atomic(savepoint=False):
+            apply_balance_deltas(deltas, lock=len(deltas) > 1)
+            self.rollups.apply()
+        if self.salon_ids:
+            invalidate_dashboard(self.salon_ids, ['finance', 'balances'])
+        self.balances.clear()
+        self.salon_ids.clear()
+
+    @classmethod
+    def post(cls, source, created=False):
+        """
+        Make the transaction of ``source`` match it: create, update or
+        delete it (a shave that is not completed posts none) and apply the
+        difference. ``created`` skips looking for an existing transaction.
+        """
+        Transaction = apps.get_model('saloonfinance', 'Transaction')
+        field = source_field(source)
+        posted = None if created else Transaction.objects.filter(**{field: source.pk}).first()
+        ledger = cls()
+        with transaction.atomic(savepoint=False):
+            if posted is None:
+                ledger.post_new([source])
+            else:
+                wanted = source.build_transaction()
+                if wanted is None:
+                    Transaction.objects.filter(pk=posted.pk).delete()
+                else:
+                    changes = {}
+                    for name in POSTED_FIELDS:
+                        value = stored_value(Transaction._meta.get_field(name), getattr(wanted, name))
+                        if value != getattr(posted, name):
+                            changes[name] = value
+                    if changes:
+                        previous = transaction_entry(posted)
+                        Transaction.objects.filter(pk=posted.pk).update(**changes)
+                        for name, value in changes.items():
+                            setattr(posted, name, value)
+                        ledger.move(previous, transaction_entry(posted))
+            ledger.apply()
+
+    @classmethod
+    def reverse(cls, source):
+        """
+        Delete the transaction of ``source``, which takes its amount back
+        out of the balance.
+        """
+        Transaction = apps.get_model('saloonfinance', 'Transaction')
+        Transaction.objects.filter(**{source_field(source): source.pk}).delete()
+
+    @classmethod
+    def record(cls, posted):
+        """
+        Apply a transaction that was saved directly (rather than posted for
+        a source), from the values it was loaded with to its current ones.
+        """
+        current = transaction_entry(posted)
+        previous = getattr(posted, '_rollup_entry', None)
+        if previous != current:
+            ledger = cls()
+            ledger.move(previous, current)
+            ledger.apply()
+        posted._rollup_entry = current
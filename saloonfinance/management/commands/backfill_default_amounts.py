@@ -0,0 +1,80 @@
+from decimal import Decimal
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from saloonfinance.rates import get_default_currency, rates_many
+from saloonfinance.rollups import rebuild_rollups, to_rollup_date
+from salooninventory.ledger import rebuild_stock_ledger
+
+CENT = Decimal('0.01')
+RATE = Decimal('0.000001')
+# (model, amount field, converted field, date field or None for today)
+SOURCES = {
+    'shaves': ('saloonservices.Shave', 'amount', 'amount_in_default_currency', 'date_shave'),
+    'transactions': ('saloonfinance.Transaction', 'amount', 'amount_in_default_currency', 'date_trans'),
+    'payments': ('saloonfinance.Payment', 'amount', 'amount_in_default_currency', 'date_payment'),
+    'items': ('salooninventory.Item', 'price', 'amount_in_default_currency', None),
+    'purchases': ('salooninventory.ItemPurchase', 'purchase_price', 'purchase_price_in_default_currency', 'purchase_date'),
+}
+# Their converted amounts are summed in the daily rollups or the stock ledger's costs
+ROLLED_UP = {'shaves', 'transactions'}
+COSTED = {'purchases'}
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the default-currency amounts of existing rows from the exchange-rate table, "
+        "in primary-key chunks. Rows on dates the table has no rate for keep their own exchange rate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--only', nargs='+', choices=sorted(SOURCES), help="Only backfill these kinds of rows.")
+        parser.add_argument('--chunk-size', type=int, default=5000, help="Rows read and converted at a time.")
+        parser.add_argument('--dry-run', action='store_true', help="Count the rows that would change without writing them.")
+
+    def handle(self, *args, **options):
+        rolled_up, costed = set(), set()
+        for name in options['only'] or SOURCES:
+            salon_ids = rolled_up if name in ROLLED_UP else costed if name in COSTED else set()
+            changed = self.backfill(name, options['chunk_size'], options['dry_run'], salon_ids)
+            self.stdout.write(f"{name}: {changed} rows {'to update' if options['dry_run'] else 'updated'}")
+        if not options['dry_run']:
+            if rolled_up:
+                count = rebuild_rollups(salon_ids=sorted(rolled_up))
+                self.stdout.write(f"Rebuilt {count} rollup rows.")
+            if costed:
+                count = rebuild_stock_ledger(salon_ids=sorted(costed))
+                self.stdout.write(f"Rebuilt {count} stock movements.")
+        self.stdout.write(self.style.SUCCESS("Backfill complete."))
+
+    def backfill(self, name, chunk_size, dry_run, salon_ids):
+        label, amount_field, converted_field, date_field = SOURCES[name]
+        model = apps.get_model(label)
+        columns = ['pk', amount_field, 'currency_id', 'exchange_rate', converted_field, 'salon_id'] + ([date_field] if date_field else [])
+        changed, last_pk, today = 0, 0, timezone.localdate()
+        default_currency_id = get_default_currency()
+        while True:
+            rows = list(model.objects.filter(pk__gt=last_pk).order_by('pk').values_list(*columns)[:chunk_size])
+            if not rows:
+                return changed
+            last_pk = rows[-1][0]
+            pks, amounts, currencies, typed_rates, stored, salons = (list(column) for column in zip(*[row[:6] for row in rows]))
+            days = [to_rollup_date(row[6]) for row in rows] if date_field else [today] * len(rows)
+            # Only the rate lookup is vectorised: amounts are divided and rounded in Decimal, as convert() does
+            rates = rates_many(currencies, days, typed_rates).tolist()
+            updates = []
+            for index, pk in enumerate(pks):
+                if currencies[index] == default_currency_id:
+                    # convert() keeps the typed rate of amounts already in the default currency
+                    value, rate = amounts[index], typed_rates[index]
+                else:
+                    rate = Decimal(str(rates[index])).quantize(RATE)
+                    value = Decimal(amounts[index]) / rate
+                value = value.quantize(CENT)
+                if value != stored[index] or rate != typed_rates[index]:
+                    updates.append(model(pk=pk, **{converted_field: value, 'exchange_rate': rate}))
+                    salon_ids.add(salons[index])
+            changed += len(updates)
+            if updates and not dry_run:
+                with transaction.atomic():
+                    model.objects.bulk_update(updates, [converted_field, 'exchange_rate'], batch_size=500)
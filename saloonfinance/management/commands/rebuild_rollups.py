@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from saloonfinance.rollups import rebuild_rollups
+
+class Command(BaseCommand):
+    help = "Rebuild the daily finance rollups from the raw transactions and shaves."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, action='append', dest='salons', help="Only rebuild this salon (can be repeated).")
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(salon_ids=options['salons'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} rollup rows."))
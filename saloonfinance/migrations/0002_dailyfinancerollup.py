@@ -0,0 +1,64 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:43
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncDate
+
+
+def populate_rollups(apps, schema_editor):
+    DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+    Transaction = apps.get_model('saloonfinance', 'Transaction')
+    Shave = apps.get_model('saloonservices', 'Shave')
+    totals = {
+        'amount_total': Sum('amount'),
+        'amount_in_default_currency_total': Sum('amount_in_default_currency'),
+        'row_count': Count('id'),
+    }
+    rows = []
+    for row in Transaction.objects.values('salon_id', 'cashregister_id', 'currency_id', 'date_trans', 'trans_type').annotate(**totals).order_by():
+        rows.append(DailyFinanceRollup(
+            salon_id=row['salon_id'], cashregister_id=row['cashregister_id'], currency_id=row['currency_id'],
+            date=row['date_trans'], trans_type=row['trans_type'], amount=row['amount_total'],
+            amount_in_default_currency=row['amount_in_default_currency_total'], count=row['row_count'],
+        ))
+    shaves = Shave.objects.filter(status='COMPLETED').annotate(day=TruncDate('date_shave'))
+    for row in shaves.values('salon_id', 'cashregister_id', 'currency_id', 'day').annotate(**totals).order_by():
+        rows.append(DailyFinanceRollup(
+            salon_id=row['salon_id'], cashregister_id=row['cashregister_id'], currency_id=row['currency_id'],
+            date=row['day'], trans_type='SHAVE', amount=row['amount_total'],
+            amount_in_default_currency=row['amount_in_default_currency_total'], count=row['row_count'],
+        ))
+    DailyFinanceRollup.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+        ('saloonfinance', '0001_initial'),
+        ('saloonservices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyFinanceRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('trans_type', models.CharField(choices=[('INCOME', 'Income'), ('EXPENSE', 'Expense'), ('SHAVE', 'Shave revenue')], max_length=10, verbose_name='Type')),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Amount')),
+                ('amount_in_default_currency', models.DecimalField(decimal_places=2, default=0, max_digits=19, verbose_name='Amount in default currency')),
+                ('count', models.IntegerField(default=0, verbose_name='Count')),
+                ('cashregister', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='saloonfinance.cashregister', verbose_name='Cash Register')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='rollups', to='saloonfinance.currency', verbose_name='Currency')),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='finance_rollups', to='saloon.salon', verbose_name='Salon')),
+            ],
+            options={
+                'verbose_name': 'Daily Finance Rollup',
+                'verbose_name_plural': 'Daily Finance Rollups',
+                'unique_together': {('salon', 'cashregister', 'currency', 'date', 'trans_type')},
+            },
+        ),
+        migrations.RunPython(populate_rollups, migrations.RunPython.noop),
+    ]
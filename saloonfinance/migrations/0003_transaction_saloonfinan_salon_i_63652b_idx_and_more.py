@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+        ('saloonfinance', '0002_dailyfinancerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['salon', 'date_trans', 'trans_type'], name='saloonfinan_salon_i_63652b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['cashregister', 'date_trans'], name='saloonfinan_cashreg_7dfe6f_idx'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+        ('saloonfinance', '0003_transaction_saloonfinan_salon_i_63652b_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['salon', 'date_payment', 'id'], name='saloonfinan_salon_i_960602_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='transaction',
+            index=models.Index(fields=['salon', 'date_trans', 'id'], name='saloonfinan_salon_i_c19b07_idx'),
+        ),
+    ]
@@ -0,0 +1,160 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:05
+
+import re
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, F, Sum
+
+
+def legacy_sources(apps):
+    """
+    Per source field, the key the old receivers found a source's
+    transaction by (its name, amount, date, cash register and salon) for
+    every source they posted one for, with the source's pk.
+    """
+    Shave = apps.get_model('saloonservices', 'Shave')
+    ItemPurchase = apps.get_model('salooninventory', 'ItemPurchase')
+    to_date = models.DateField().to_python
+    # Only shaves saved as completed were posted, and only those were reversed
+    shaves = Shave.objects.filter(status='COMPLETED').order_by('pk').values_list(
+        'pk', 'hairstyle__name', 'amount', 'date_shave', 'cashregister_id', 'salon_id',
+    )
+    purchases = ItemPurchase.objects.order_by('pk').values_list(
+        'pk', 'item__name', 'purchase_price', 'quantity', 'purchase_date', 'cashregister_id', 'salon_id',
+    )
+    yield 'shave', (
+        (pk, (f"Shave: {name}", amount, to_date(date_shave), cashregister_id, salon_id))
+        for pk, name, amount, date_shave, cashregister_id, salon_id in shaves.iterator(chunk_size=2000)
+    )
+    yield 'purchase', (
+        (pk, (f"Purchase: {name}", price * quantity, purchase_date, cashregister_id, salon_id))
+        for pk, name, price, quantity, purchase_date, cashregister_id, salon_id in purchases.iterator(chunk_size=2000)
+    )
+
+
+def link_legacy_transactions(apps, field, prefix, sources, linked):
+    """
+    Point the transactions the old receivers posted without their source's
+    pk (``Shave: <hairstyle>``, ``Purchase: <item>``) at their source and
+    rename them to the ``... #<pk>`` form. ``linked`` are the sources whose
+    transaction is already linked.
+    """
+    Transaction = apps.get_model('saloonfinance', 'Transaction')
+    legacy = Transaction.objects.filter(trans_name__startswith=prefix, **{f'{field}__isnull': True}).values_list(
+        'pk', 'trans_name', 'amount', 'date_trans', 'cashregister_id', 'salon_id',
+    )
+    # Names are unique per salon and day, so a key matches one transaction
+    unlinked = {tuple(key): pk for pk, *key in legacy.iterator(chunk_size=2000)}
+    updates = []
+    for source_pk, key in sources:
+        posted_pk = None if source_pk in linked else unlinked.pop(key, None)
+        if posted_pk is not None:
+            updates.append(Transaction(pk=posted_pk, trans_name=f"{key[0]} #{source_pk}", **{f'{field}_id': source_pk}))
+    Transaction.objects.bulk_update(updates, [field, 'trans_name'], batch_size=100)
+
+
+def link_sources(apps, schema_editor):
+    """
+    Point the transactions posted for shaves and purchases (named
+    ``... #<pk>``, or by the old receivers without it) at their source, and
+    post the missing transactions of payments, which already moved the cash
+    register balance.
+    """
+    Transaction = apps.get_model('saloonfinance', 'Transaction')
+    Payment = apps.get_model('saloonfinance', 'Payment')
+    DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+    sources = {
+        'shave': (apps.get_model('saloonservices', 'Shave'), 'Shave: '),
+        'purchase': (apps.get_model('salooninventory', 'ItemPurchase'), 'Purchase: '),
+    }
+    linked_sources = {}
+    for field, (model, prefix) in sources.items():
+        linked, updates = set(), []
+        candidates = Transaction.objects.filter(trans_name__startswith=prefix).order_by('pk').only('pk', 'trans_name')
+        for posted in candidates.iterator(chunk_size=2000):
+            match = re.search(r'#(\d+)$', posted.trans_name)
+            if match and int(match.group(1)) not in linked:
+                linked.add(int(match.group(1)))
+                setattr(posted, f'{field}_id', int(match.group(1)))
+                updates.append(posted)
+        existing = set(model.objects.values_list('pk', flat=True).iterator(chunk_size=10000))
+        updates = [posted for posted in updates if getattr(posted, f'{field}_id') in existing]
+        Transaction.objects.bulk_update(updates, [field], batch_size=100)
+        linked_sources[field] = {getattr(posted, f'{field}_id') for posted in updates}
+    for field, legacy in legacy_sources(apps):
+        link_legacy_transactions(apps, field, sources[field][1], legacy, linked_sources[field])
+
+    posted = []
+    for payment in Payment.objects.order_by('pk').iterator(chunk_size=2000):
+        posted.append(Transaction(
+            trans_name=f"Payment #{payment.pk}", amount=payment.amount, currency_id=payment.currency_id,
+            exchange_rate=payment.exchange_rate, amount_in_default_currency=payment.amount_in_default_currency,
+            date_trans=payment.date_payment, trans_type='EXPENSE', cashregister_id=payment.cashregister_id,
+            salon_id=payment.salon_id, payment_id=payment.pk,
+        ))
+    Transaction.objects.bulk_create(posted, batch_size=1000)
+    totals = Payment.objects.values('salon_id', 'cashregister_id', 'currency_id', 'date_payment').annotate(
+        amount_total=Sum('amount'), amount_in_default_currency_total=Sum('amount_in_default_currency'), row_count=Count('id'),
+    ).order_by()
+    for row in totals:
+        lookup = {
+            'salon_id': row['salon_id'], 'cashregister_id': row['cashregister_id'], 'currency_id': row['currency_id'],
+            'date': row['date_payment'], 'trans_type': 'EXPENSE',
+        }
+        changes = {
+            'amount': F('amount') + row['amount_total'],
+            'amount_in_default_currency': F('amount_in_default_currency') + row['amount_in_default_currency_total'],
+            'count': F('count') + row['row_count'],
+        }
+        if not DailyFinanceRollup.objects.filter(**lookup).update(**changes):
+            DailyFinanceRollup.objects.create(
+                amount=row['amount_total'], amount_in_default_currency=row['amount_in_default_currency_total'],
+                count=row['row_count'], **lookup,
+            )
+
+
+def unlink_payments(apps, schema_editor):
+    Transaction = apps.get_model('saloonfinance', 'Transaction')
+    DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+    payments = Transaction.objects.filter(payment__isnull=False)
+    totals = payments.values('salon_id', 'cashregister_id', 'currency_id', 'date_trans').annotate(
+        amount_total=Sum('amount'), amount_in_default_currency_total=Sum('amount_in_default_currency'), row_count=Count('id'),
+    ).order_by()
+    for row in totals:
+        DailyFinanceRollup.objects.filter(
+            salon_id=row['salon_id'], cashregister_id=row['cashregister_id'], currency_id=row['currency_id'],
+            date=row['date_trans'], trans_type='EXPENSE',
+        ).update(
+            amount=F('amount') - row['amount_total'],
+            amount_in_default_currency=F('amount_in_default_currency') - row['amount_in_default_currency_total'],
+            count=F('count') - row['row_count'],
+        )
+    payments.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloonfinance', '0004_payment_saloonfinan_salon_i_960602_idx_and_more'),
+        ('salooninventory', '0003_stock_ledger'),
+        ('saloonservices', '0005_hairstyle_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transaction',
+            name='payment',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_transaction', to='saloonfinance.payment', verbose_name='Payment'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='purchase',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_transaction', to='salooninventory.itempurchase', verbose_name='Item purchase'),
+        ),
+        migrations.AddField(
+            model_name='transaction',
+            name='shave',
+            field=models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ledger_transaction', to='saloonservices.shave', verbose_name='Shave'),
+        ),
+        migrations.RunPython(link_sources, unlink_payments),
+    ]
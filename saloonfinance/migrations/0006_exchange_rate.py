@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:15
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloonfinance', '0005_ledger_transaction_sources'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('modified_at', models.DateTimeField(auto_now=True, verbose_name='Modified at')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('rate', models.DecimalField(decimal_places=6, help_text='Units of the currency per unit of the default currency, from this date on.', max_digits=10, verbose_name='Rate')),
+                ('currency', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='exchange_rates', to='saloonfinance.currency', verbose_name='Currency')),
+            ],
+            options={
+                'verbose_name': 'Exchange Rate',
+                'verbose_name_plural': 'Exchange Rates',
+                'unique_together': {('currency', 'date')},
+            },
+        ),
+    ]
@@ -1,14 +1,21 @@
 ''' Models for the saloonfinance app '''
 
 from django.db import models, transaction
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_delete, post_delete
 from django.dispatch import receiver
-from django.db.models import F, Sum
+from django.db.models import Sum
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
-from saloon.models import Salon, Barber, TimestampMixin
+from saloon.dashboard import invalidate_dashboard
+from saloon.reference import get_reference, invalidate_reference_on_commit
+from saloon.models import Salon, Barber, TimestampMixin, SalonHistoryQuerySet
 from decimal import Decimal
+from .balances import apply_balance_delta
+from .cache import get_default_currency_id, invalidate_default_currency
+from .ledger import LedgerService, deleted_with_source
+from .rates import convert, invalidate_exchange_rates_on_commit
+from .rollups import transaction_entry, remember_rollup_entry, ensure_rollup_entry
 
 class Currency(TimestampMixin):
     code = models.CharField(_("Code"), max_length=3, unique=True)
@@ -20,22 +27,56 @@ class Currency(TimestampMixin):
     
     @classmethod
     def get_default(cls):
-        default_currency, created = cls.objects.get_or_create(
-            code='USD',
-            defaults={'name': _('US Dollar'), 'is_default': True}
-        )
-        return default_currency.id
+        return get_default_currency_id(cls._load_default)
+
+    @classmethod
+    def _load_default(cls):
+        default_currency_id = cls.objects.filter(is_default=True).values_list('id', flat=True).first()
+        if default_currency_id is None:
+            default_currency, created = cls.objects.get_or_create(
+                code='USD',
+                defaults={'name': _('US Dollar'), 'is_default': True}
+            )
+            default_currency_id = default_currency.id
+        return default_currency_id
     
     def save(self, *args, **kwargs):
+        # Saving the current default or a new default flips the default currency
+        flips_default = self.is_default or (self.pk is not None and self.pk == Currency.get_default())
         if self.is_default:
             with transaction.atomic():
                 Currency.objects.filter(is_default=True).exclude(pk=self.pk).update(is_default=False)
         super().save(*args, **kwargs)
+        if flips_default:
+            # Invalidate now for this process and again once the new default is committed
+            invalidate_default_currency()
+            transaction.on_commit(invalidate_default_currency)
 
     class Meta:
         verbose_name = _("Currency")
         verbose_name_plural = _("Currencies")
 
+class ExchangeRate(TimestampMixin):
+    currency = models.ForeignKey(Currency, on_delete=models.CASCADE, related_name='exchange_rates', verbose_name=_("Currency"))
+    date = models.DateField(_("Date"))
+    rate = models.DecimalField(
+        _("Rate"), max_digits=10, decimal_places=6,
+        help_text=_("Units of the currency per unit of the default currency, from this date on."),
+    )
+
+    def __str__(self):
+        return f"{self.currency.code} {self.date}: {self.rate}"
+
+    def clean(self):
+        super().clean()
+        if self.rate is not None and self.rate <= 0:
+            raise ValidationError(_("Rate must be greater than zero."))
+
+    class Meta:
+        verbose_name = _("Exchange Rate")
+        verbose_name_plural = _("Exchange Rates")
+        unique_together = ['currency', 'date']
+
 class CashRegister(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255)
     balance = models.DecimalField(_("Balance"), max_digits=10, decimal_places=2, default=0)
@@ -47,16 +88,19 @@ class CashRegister(TimestampMixin):
 
     def update_balance(self, amount, transaction_type):
         if transaction_type == 'INCOME':
-            self.balance = F('balance') + amount
+            delta = amount
         elif transaction_type == 'EXPENSE':
-            self.balance = F('balance') - amount
-        self.save()
+            delta = -amount
+        else:
+            return self.balance
+        self.balance = apply_balance_delta(self.pk, delta)
+        return self.balance
 
     def get_total_income(self):
-        return self.transactions.filter(trans_type='INCOME').aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        return self.rollups.filter(trans_type=DailyFinanceRollup.RollupType.INCOME).aggregate(total=Sum('amount'))['total'] or Decimal('0')
 
     def get_total_expenses(self):
-        return self.transactions.filter(trans_type='EXPENSES').aggregate(total=Sum('amount'))['total'] or Decimal('0')
+        return self.rollups.filter(trans_type=DailyFinanceRollup.RollupType.EXPENSE).aggregate(total=Sum('amount'))['total'] or Decimal('0')
 
     class Meta:
         verbose_name = _("Cash Register")
@@ -73,7 +117,8 @@ class PaymentType(TimestampMixin):
 
     @classmethod
     def get_default(cls):
-        return cls.objects.get_or_create(
+        default = next((payment_type for payment_type in get_reference('payment_types') if payment_type.name == 'SALARY'), None)
+        return default or cls.objects.get_or_create(
             name='SALARY',
             defaults={'description': 'Regular salary payment'}
         )[0]
@@ -82,6 +127,9 @@ class PaymentType(TimestampMixin):
         verbose_name = _("Payment Type")
         verbose_name_plural = _("Payment Types")
 
+class PaymentQuerySet(SalonHistoryQuerySet):
+    date_field = 'date_payment'
+
 class Payment(TimestampMixin):
     barber = models.ForeignKey(Barber, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Barber"))
     amount = models.DecimalField(_("Amount"), max_digits=19, decimal_places=2)
@@ -95,15 +143,31 @@ class Payment(TimestampMixin):
     date_payment = models.DateField(_("Payment date"), default=timezone.now)
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='payments', verbose_name=_("Salon"))
 
+    objects = PaymentQuerySet.as_manager()
+
     def __str__(self):
         return f"{self.barber} - {self.amount} {self.currency.code} - {self.payment_type}"
     
     def save(self, *args, **kwargs):
-        if self.currency != Currency.get_default():
-            self.amount_in_default_currency = self.amount / self.exchange_rate
-        else:
-            self.amount_in_default_currency = self.amount
-        super().save(*args, **kwargs)
+        self.amount_in_default_currency, self.exchange_rate = convert(self.amount, self.currency_id, self.date_payment, self.exchange_rate)
+        created = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            LedgerService.post(self, created=created)
+
+    def build_transaction(self):
+        return Transaction(
+            trans_name=f"Payment #{self.pk}",
+            amount=self.amount,
+            currency_id=self.currency_id,
+            exchange_rate=self.exchange_rate,
+            amount_in_default_currency=self.amount_in_default_currency,
+            date_trans=self.date_payment,
+            trans_type=Transaction.TransactionType.EXPENSE,
+            cashregister_id=self.cashregister_id,
+            salon_id=self.salon_id,
+            payment=self,
+        )
 
     def clean(self):
         super().clean()
@@ -117,6 +181,34 @@ class Payment(TimestampMixin):
     class Meta:
         verbose_name = _("Payment")
         verbose_name_plural = _("Payments")
+        indexes = [
+            models.Index(fields=['salon', 'date_payment', 'id']),
+        ]
+
+class TransactionQuerySet(SalonHistoryQuerySet):
+    date_field = 'date_trans'
+
+    def for_cashregister(self, cashregister):
+        return self.filter(cashregister=cashregister)
+
+    def income(self):
+        return self.filter(trans_type=Transaction.TransactionType.INCOME)
+
+    def expense(self):
+        return self.filter(trans_type=Transaction.TransactionType.EXPENSE)
+
+    def delete(self):
+        """
+        Delete the transactions and reverse their balance and rollup effect
+        with one delta per cash register and day.
+        """
+        ledger = LedgerService()
+        with transaction.atomic(savepoint=False):
+            for posted in self:
+                ledger.move(getattr(posted, '_rollup_entry', None) or transaction_entry(posted), None)
+            deleted = super().delete()
+            ledger.apply()
+        return deleted
 
 class Transaction(TimestampMixin):
     class TransactionType(models.TextChoices):
@@ -132,13 +224,31 @@ class Transaction(TimestampMixin):
     trans_type = models.CharField(_("Transaction type"), max_length=10, choices=TransactionType.choices)
     cashregister = models.ForeignKey(CashRegister, on_delete=models.CASCADE, related_name='transactions', verbose_name=_("Cash Register"))
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='transactions', verbose_name=_("Salon"))
+    # The document a transaction was posted for, if any; see LedgerService
+    shave = models.OneToOneField('saloonservices.Shave', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_transaction', verbose_name=_("Shave"))
+    purchase = models.OneToOneField('salooninventory.ItemPurchase', on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_transaction', verbose_name=_("Item purchase"))
+    payment = models.OneToOneField(Payment, on_delete=models.SET_NULL, null=True, blank=True, related_name='ledger_transaction', verbose_name=_("Payment"))
+
+    objects = TransactionQuerySet.as_manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        return remember_rollup_entry(super().from_db(db, field_names, values), transaction_entry)
 
     def save(self, *args, **kwargs):
-        if self.currency != Currency.get_default():
-            self.amount_in_default_currency = self.amount / self.exchange_rate
-        else:
-            self.amount_in_default_currency = self.amount
-        super().save(*args, **kwargs)
+        self.amount_in_default_currency, self.exchange_rate = convert(self.amount, self.currency_id, self.date_trans, self.exchange_rate)
+        ensure_rollup_entry(self, transaction_entry)
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            LedgerService.record(self)
+
+    def delete(self, *args, **kwargs):
+        ledger = LedgerService()
+        ledger.move(getattr(self, '_rollup_entry', None) or transaction_entry(self), None)
+        with transaction.atomic(savepoint=False):
+            deleted = super().delete(*args, **kwargs)
+            ledger.apply()
+        return deleted
     
     def __str__(self):
         return f"{self.trans_name} - {self.amount} {self.currency.code} - {self.get_trans_type_display()}"
@@ -154,23 +264,64 @@ class Transaction(TimestampMixin):
         verbose_name = _("Transaction")
         verbose_name_plural = _("Transactions")
         unique_together = ['trans_name', 'salon', 'date_trans']
+        indexes = [
+            models.Index(fields=['salon', 'date_trans', 'trans_type']),
+            models.Index(fields=['cashregister', 'date_trans']),
+            models.Index(fields=['salon', 'date_trans', 'id']),
+        ]
 
-# Signals to update CashRegister balance
-@receiver(post_save, sender=Payment)
-@receiver(post_save, sender=Transaction)
-def update_cashregister_balance(sender, instance, created, **kwargs):
-    if created:
-        with transaction.atomic():
-            if sender == Transaction and instance.trans_type == Transaction.TransactionType.INCOME:
-                instance.cashregister.update_balance(instance.amount, 'INCOME')
-            else:
-                instance.cashregister.update_balance(instance.amount, 'EXPENSE')
+class DailyFinanceRollup(models.Model):
+    """
+    Per-day totals of transactions and completed shaves, maintained
+    incrementally by the signal receivers and rebuilt by ``rebuild_rollups``.
+    """
+    class RollupType(models.TextChoices):
+        INCOME = 'INCOME', _('Income')
+        EXPENSE = 'EXPENSE', _('Expense')
+        SHAVE = 'SHAVE', _('Shave revenue')
+
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='finance_rollups', verbose_name=_("Salon"))
+    cashregister = models.ForeignKey(CashRegister, on_delete=models.CASCADE, related_name='rollups', verbose_name=_("Cash Register"))
+    currency = models.ForeignKey(Currency, on_delete=models.PROTECT, related_name='rollups', verbose_name=_("Currency"))
+    date = models.DateField(_("Date"))
+    trans_type = models.CharField(_("Type"), max_length=10, choices=RollupType.choices)
+    amount = models.DecimalField(_("Amount"), max_digits=19, decimal_places=2, default=0)
+    amount_in_default_currency = models.DecimalField(_("Amount in default currency"), max_digits=19, decimal_places=2, default=0)
+    count = models.IntegerField(_("Count"), default=0)
+
+    def __str__(self):
+        return f"{self.date} - {self.get_trans_type_display()} - {self.amount}"
+
+    class Meta:
+        verbose_name = _("Daily Finance Rollup")
+        verbose_name_plural = _("Daily Finance Rollups")
+        unique_together = ['salon', 'cashregister', 'currency', 'date', 'trans_type']
 
 @receiver(pre_delete, sender=Payment)
-@receiver(pre_delete, sender=Transaction)
-def revert_cashregister_balance(sender, instance, **kwargs):
-    with transaction.atomic():
-        if sender == Transaction and instance.trans_type == Transaction.TransactionType.INCOME:
-            instance.cashregister.update_balance(instance.amount, 'EXPENSE')
-        else:
-            instance.cashregister.update_balance(instance.amount, 'INCOME') 
\ No newline at end of file
+def reverse_payment_transaction(sender, instance, origin=None, **kwargs):
+    if deleted_with_source(origin, instance):
+        LedgerService.reverse(instance)
+
+@receiver(post_save, sender=CashRegister)
+@receiver(post_delete, sender=CashRegister)
+def invalidate_salon_balances_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard({instance.salon_id}, ['balances'])
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_rate_tables(sender, instance, **kwargs):
+    invalidate_exchange_rates_on_commit()
+
+@receiver(post_delete, sender=Currency)
+def invalidate_default_currency_on_delete(sender, instance, **kwargs):
+    invalidate_default_currency()
+
+@receiver(post_save, sender=Currency)
+@receiver(post_delete, sender=Currency)
+def invalidate_currency_choices(sender, instance, **kwargs):
+    invalidate_reference_on_commit('currencies')
+
+@receiver(post_save, sender=PaymentType)
+@receiver(post_delete, sender=PaymentType)
+def invalidate_payment_type_choices(sender, instance, **kwargs):
+    invalidate_reference_on_commit('payment_types')
@@ -0,0 +1,106 @@
+''' Keyset pagination shared by the finance list views and API viewsets '''
+
+import base64
+import binascii
+import json
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+class InvalidCursor(ValueError):
+    pass
+
+def encode_cursor(value, pk, direction):
+    payload = json.dumps([value.isoformat(), pk, direction], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk, direction = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError):
+        raise InvalidCursor(cursor)
+    if direction not in ('next', 'previous') or not isinstance(pk, int):
+        raise InvalidCursor(cursor)
+    return value, pk, direction
+
+class KeysetPage:
+    def __init__(self, object_list, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+class KeysetPaginator:
+    """
+    Paginates newest first on (date_field, pk). Each page is a single indexed
+    range query, so deep pages cost the same as the first one.
+    """
+    def __init__(self, queryset, date_field, per_page=25):
+        self.queryset = queryset
+        self.date_field = date_field
+        self.per_page = per_page
+
+    def page(self, cursor=None):
+        queryset, direction = self._page_queryset(cursor)
+        return self._page(list(queryset), direction)
+
+    async def apage(self, cursor=None):
+        queryset, direction = self._page_queryset(cursor)
+        return self._page([row async for row in queryset], direction)
+
+    def _page_queryset(self, cursor):
+        """
+        The query of the page after (or before) ``cursor``, fetching one row
+        more than a page to tell whether there is another page.
+        """
+        date_field = self.date_field
+        descending = self.queryset.order_by(f'-{date_field}', '-pk')
+        if not cursor:
+            return descending[:self.per_page + 1], None
+
+        value, pk, direction = decode_cursor(cursor)
+        try:
+            value = self.queryset.model._meta.get_field(date_field).to_python(value)
+        except ValidationError:
+            raise InvalidCursor(cursor)
+        if direction == 'next':
+            after = Q(**{f'{date_field}__lt': value}) | Q(**{date_field: value, 'pk__lt': pk})
+            return descending.filter(after)[:self.per_page + 1], direction
+        before = Q(**{f'{date_field}__gt': value}) | Q(**{date_field: value, 'pk__gt': pk})
+        return self.queryset.order_by(date_field, 'pk').filter(before)[:self.per_page + 1], direction
+
+    def _page(self, rows, direction):
+        if direction is None:
+            return self._build_page(rows, has_next=len(rows) > self.per_page, has_previous=False)
+        if direction == 'next':
+            return self._build_page(rows, has_next=len(rows) > self.per_page, has_previous=True)
+        has_previous = len(rows) > self.per_page
+        rows = rows[:self.per_page][::-1]
+        return self._build_page(rows, has_next=True, has_previous=has_previous)
+
+    def _build_page(self, rows, has_next, has_previous):
+        rows = rows[:self.per_page]
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = encode_cursor(getattr(rows[-1], self.date_field), rows[-1].pk, 'next')
+        if rows and has_previous:
+            previous_cursor = encode_cursor(getattr(rows[0], self.date_field), rows[0].pk, 'previous')
+        return KeysetPage(rows, self, next_cursor, previous_cursor)
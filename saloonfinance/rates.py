@@ -0,0 +1,121 @@
+''' Exchange-rate timelines and conversion of amounts to the default currency '''
+
+import uuid
+from bisect import bisect_right
+from decimal import Decimal
+from functools import lru_cache
+import numpy as np
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from .rollups import to_rollup_date
+
+RATE_TABLE_KEY = 'saloonfinance:exchange_rates:{currency_id}'
+RATE_VERSION_KEY = 'saloonfinance:exchange_rates:version'
+# Rate tables kept in each process, across currencies and versions
+LOCAL_RATE_TABLES = 64
+
+class RateTable:
+    """
+    Sorted effective dates and rates of one currency, in units of the
+    currency per unit of the default currency. A rate applies from its date
+    until the next one; dates before the first rate have none.
+    """
+    def __init__(self, currency_id, dates, rates):
+        self.currency_id = currency_id
+        self.dates = dates
+        self.rates = rates
+        self.day_array = np.array(dates, dtype='datetime64[D]')
+        self.rate_array = np.array(rates, dtype=float)
+
+    @classmethod
+    def build(cls, currency_id):
+        ExchangeRate = apps.get_model('saloonfinance', 'ExchangeRate')
+        rows = list(ExchangeRate.objects.filter(currency_id=currency_id).order_by('date').values_list('date', 'rate'))
+        return cls(currency_id, [day for day, _ in rows], [rate for _, rate in rows])
+
+    def rate_on(self, day):
+        index = bisect_right(self.dates, day)
+        return self.rates[index - 1] if index else None
+
+    def rates_on(self, days):
+        """
+        The rate of every day of the ``datetime64[D]`` array ``days``, NaN
+        where there is none.
+        """
+        index = np.searchsorted(self.day_array, days, side='right')
+        found = self.rate_array[np.maximum(index - 1, 0)] if len(self.rate_array) else np.zeros(len(days))
+        return np.where(index > 0, found, np.nan)
+
+def get_rates_version():
+    version = cache.get(RATE_VERSION_KEY)
+    if version is None:
+        cache.add(RATE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(RATE_VERSION_KEY)
+    return version
+
+@lru_cache(maxsize=LOCAL_RATE_TABLES)
+def load_rate_table(currency_id, version):
+    # Tables of an outdated version are never asked for again and age out
+    table = cache.get(RATE_TABLE_KEY.format(currency_id=currency_id), version=version)
+    if table is None:
+        table = RateTable.build(currency_id)
+        cache.set(RATE_TABLE_KEY.format(currency_id=currency_id), table, None, version=version)
+    return table
+
+def get_rate_table(currency_id):
+    return load_rate_table(currency_id, get_rates_version())
+
+def invalidate_exchange_rates():
+    cache.set(RATE_VERSION_KEY, uuid.uuid4().hex, None)
+    load_rate_table.cache_clear()
+
+def invalidate_exchange_rates_on_commit():
+    invalidate_exchange_rates()
+    transaction.on_commit(invalidate_exchange_rates)
+
+def get_default_currency():
+    return apps.get_model('saloonfinance', 'Currency').get_default()
+
+def convert(amount, currency_id, day=None, exchange_rate=None, default_currency_id=None):
+    """
+    ``amount`` in the default currency and the rate it was converted at:
+    the rate table's rate for ``day`` (today when omitted), else the
+    ``exchange_rate`` typed in with the amount. Amounts already in the
+    default currency are returned unchanged with ``exchange_rate``.
+    """
+    if default_currency_id is None:
+        default_currency_id = get_default_currency()
+    if currency_id == default_currency_id:
+        return amount, exchange_rate
+    day = timezone.localdate() if day is None else to_rollup_date(day)
+    rate = get_rate_table(currency_id).rate_on(day) or Decimal(exchange_rate if exchange_rate is not None else 1)
+    return Decimal(amount) / rate, rate
+
+def rates_many(currencies, dates, fallback_rates=None):
+    """
+    The rate of each (currency, date) pair as a float array: 1 for the
+    default currency, the rate table's otherwise, falling back to
+    ``fallback_rates`` (or NaN) where the table has none.
+    """
+    currencies = np.asarray(currencies)
+    days = np.asarray(dates, dtype='datetime64[D]')
+    rates = np.full(len(currencies), np.nan) if fallback_rates is None else np.array(fallback_rates, dtype=float)
+    default = get_default_currency()
+    for currency_id in np.unique(currencies):
+        rows = currencies == currency_id
+        if currency_id == default:
+            rates[rows] = 1.0
+            continue
+        found = get_rate_table(int(currency_id)).rates_on(days[rows])
+        rates[rows] = np.where(np.isnan(found), rates[rows], found)
+    return rates
+
+def convert_many(amounts, currencies, dates, fallback_rates=None):
+    """
+    Convert whole columns of amounts to the default currency at once, each
+    at the rate of its currency on its date (see ``rates_many``). Returns
+    a float array rounded to cents; NaN where no rate is known.
+    """
+    return np.round(np.asarray(amounts, dtype=float) / rates_many(currencies, dates, fallback_rates), 2)
@@ -0,0 +1,155 @@
+''' Incremental maintenance of the DailyFinanceRollup table '''
+
+from collections import defaultdict
+from datetime import datetime
+from decimal import Decimal
+from django.apps import apps
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from saloon.dashboard import invalidate_dashboard
+
+CENT = Decimal('0.01')
+
+def to_rollup_date(value):
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.localtime(value)
+        return value.date()
+    return value
+
+def transaction_entry(instance):
+    key = (instance.salon_id, instance.cashregister_id, instance.currency_id, to_rollup_date(instance.date_trans), instance.trans_type)
+    return key, instance.amount, instance.amount_in_default_currency
+
+def shave_entry(instance):
+    DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+    Shave = apps.get_model('saloonservices', 'Shave')
+    if instance.status != Shave.Status.COMPLETED:
+        return None
+    key = (instance.salon_id, instance.cashregister_id, instance.currency_id, to_rollup_date(instance.date_shave), DailyFinanceRollup.RollupType.SHAVE)
+    return key, instance.amount, instance.amount_in_default_currency
+
+class RollupDeltas:
+    """
+    Accumulates signed contributions per rollup key so that a batch of changes
+    costs one UPDATE (or INSERT) per touched key.
+    """
+    def __init__(self):
+        self.deltas = defaultdict(lambda: [Decimal('0'), Decimal('0'), 0])
+
+    def add(self, entry, sign=1):
+        if entry is None:
+            return
+        key, amount, amount_in_default_currency = entry
+        delta = self.deltas[key]
+        delta[0] += sign * Decimal(amount).quantize(CENT)
+        delta[1] += sign * Decimal(amount_in_default_currency).quantize(CENT)
+        delta[2] += sign
+
+    def apply(self):
+        DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+        for key, (amount, amount_in_default_currency, count) in self.deltas.items():
+            if not (amount or amount_in_default_currency or count):
+                continue
+            salon_id, cashregister_id, currency_id, date, trans_type = key
+            lookup = {
+                'salon_id': salon_id,
+                'cashregister_id': cashregister_id,
+                'currency_id': currency_id,
+                'date': date,
+                'trans_type': trans_type,
+            }
+            changes = {
+                'amount': F('amount') + amount,
+                'amount_in_default_currency': F('amount_in_default_currency') + amount_in_default_currency,
+                'count': F('count') + count,
+            }
+            if DailyFinanceRollup.objects.filter(**lookup).update(**changes):
+                continue
+            try:
+                with transaction.atomic():
+                    DailyFinanceRollup.objects.create(
+                        amount=amount, amount_in_default_currency=amount_in_default_currency, count=count, **lookup
+                    )
+            except IntegrityError:
+                DailyFinanceRollup.objects.filter(**lookup).update(**changes)
+        self.deltas.clear()
+
+def update_rollup(instance, entry_function):
+    """
+    Move the rollup contribution of ``instance`` from the values it was loaded
+    with to its current values.
+    """
+    previous = getattr(instance, '_rollup_entry', None)
+    current = entry_function(instance)
+    if previous != current:
+        deltas = RollupDeltas()
+        deltas.add(previous, -1)
+        deltas.add(current)
+        deltas.apply()
+    instance._rollup_entry = current
+
+def remove_rollup(instance, entry_function):
+    deltas = RollupDeltas()
+    deltas.add(getattr(instance, '_rollup_entry', None) or entry_function(instance), -1)
+    deltas.apply()
+    instance._rollup_entry = None
+
+def remember_rollup_entry(instance, entry_function):
+    """
+    Remember the rollup contribution an instance was loaded with. Partially
+    loaded instances fall back to reading the stored row in ``pre_save``.
+    """
+    if not instance.get_deferred_fields():
+        instance._rollup_entry = entry_function(instance)
+    return instance
+
+def ensure_rollup_entry(instance, entry_function):
+    if instance.pk is None or hasattr(instance, '_rollup_entry'):
+        return
+    stored = type(instance)._default_manager.filter(pk=instance.pk).first()
+    instance._rollup_entry = entry_function(stored) if stored else None
+
+def rebuild_rollups(salon_ids=None):
+    """
+    Recompute the rollup table from the raw Transaction and Shave rows.
+    Returns the number of rollup rows written.
+    """
+    DailyFinanceRollup = apps.get_model('saloonfinance', 'DailyFinanceRollup')
+    Transaction = apps.get_model('saloonfinance', 'Transaction')
+    Shave = apps.get_model('saloonservices', 'Shave')
+
+    transactions = Transaction.objects.all()
+    shaves = Shave.objects.filter(status=Shave.Status.COMPLETED)
+    rollups = DailyFinanceRollup.objects.all()
+    if salon_ids is not None:
+        transactions = transactions.filter(salon_id__in=salon_ids)
+        shaves = shaves.filter(salon_id__in=salon_ids)
+        rollups = rollups.filter(salon_id__in=salon_ids)
+
+    totals = {
+        'amount_total': Sum('amount'),
+        'amount_in_default_currency_total': Sum('amount_in_default_currency'),
+        'row_count': Count('id'),
+    }
+    rows = []
+    for row in transactions.values('salon_id', 'cashregister_id', 'currency_id', 'date_trans', 'trans_type').annotate(**totals).order_by():
+        rows.append(DailyFinanceRollup(
+            salon_id=row['salon_id'], cashregister_id=row['cashregister_id'], currency_id=row['currency_id'],
+            date=row['date_trans'], trans_type=row['trans_type'], amount=row['amount_total'],
+            amount_in_default_currency=row['amount_in_default_currency_total'], count=row['row_count'],
+        ))
+    for row in shaves.annotate(day=TruncDate('date_shave')).values('salon_id', 'cashregister_id', 'currency_id', 'day').annotate(**totals).order_by():
+        rows.append(DailyFinanceRollup(
+            salon_id=row['salon_id'], cashregister_id=row['cashregister_id'], currency_id=row['currency_id'],
+            date=row['day'], trans_type=DailyFinanceRollup.RollupType.SHAVE, amount=row['amount_total'],
+            amount_in_default_currency=row['amount_in_default_currency_total'], count=row['row_count'],
+        ))
+
+    with transaction.atomic():
+        rollups.delete()
+        DailyFinanceRollup.objects.bulk_create(rows, batch_size=1000)
+    invalidate_dashboard({row.salon_id for row in rows} | set(salon_ids or ()), ['finance'])
+    return len(rows)
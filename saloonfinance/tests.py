@@ -1,3 +1,358 @@
-from django.test import TestCase
+import csv
+import json
+import threading
+from datetime import date
+from io import StringIO
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import OperationalError, connection, connections
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from rest_framework import serializers
+from accounts.models import CustomUser
+from saloon.models import Salon, BarberType, Barber
+from api.saloonfinance.serializers import PaymentSerializer
+from .forms import PaymentForm
+from .models import Currency, ExchangeRate, CashRegister, PaymentType, Payment, Transaction, DailyFinanceRollup
+from .balances import apply_balance_deltas, balance_metrics
+from .pagination import KeysetPaginator, InvalidCursor
+from .rates import convert, convert_many
+
+class FinanceTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        self.currency = Currency.objects.get(pk=Currency.get_default())
+        self.cashregister = CashRegister.objects.create(name='Front desk', currency=self.currency, salon=self.salon)
+
+    def make_transaction(self, name, amount, trans_type=Transaction.TransactionType.INCOME, date_trans=date(2024, 3, 1)):
+        return Transaction.objects.create(
+            trans_name=name, amount=Decimal(amount), trans_type=trans_type, date_trans=date_trans,
+            cashregister=self.cashregister, salon=self.salon,
+        )
+
+class DailyFinanceRollupTests(FinanceTestMixin, TestCase):
+    def test_rollups_follow_create_update_and_delete(self):
+        first = self.make_transaction('Sale 1', '10.00')
+        self.make_transaction('Sale 2', '5.00')
+        self.make_transaction('Rent', '7.00', Transaction.TransactionType.EXPENSE)
+        self.assertEqual(self.cashregister.get_total_income(), Decimal('15.00'))
+        self.assertEqual(self.cashregister.get_total_expenses(), Decimal('7.00'))
+
+        first = Transaction.objects.get(pk=first.pk)
+        first.amount = Decimal('20.00')
+        first.save()
+        self.assertEqual(self.cashregister.get_total_income(), Decimal('25.00'))
+
+        first.delete()
+        rollup = DailyFinanceRollup.objects.get(trans_type=DailyFinanceRollup.RollupType.INCOME)
+        self.assertEqual((rollup.amount, rollup.count), (Decimal('5.00'), 1))
+
+    def test_rebuild_rollups_matches_incremental_rollups(self):
+        self.make_transaction('Sale 1', '10.00')
+        self.make_transaction('Sale 2', '5.00', date_trans=date(2024, 3, 2))
+        incremental = list(DailyFinanceRollup.objects.order_by('date').values_list('date', 'trans_type', 'amount', 'count'))
+        call_command('rebuild_rollups', stdout=StringIO())
+        rebuilt = list(DailyFinanceRollup.objects.order_by('date').values_list('date', 'trans_type', 'amount', 'count'))
+        self.assertEqual(incremental, rebuilt)
+
+    def test_queryset_delete_reverses_balances_and_rollups(self):
+        self.make_transaction('Sale 1', '10.00')
+        self.make_transaction('Sale 2', '5.00')
+        self.make_transaction('Rent', '7.00', Transaction.TransactionType.EXPENSE)
+        Transaction.objects.filter(trans_name__startswith='Sale').delete()
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal('-7.00'))
+        self.assertEqual(self.cashregister.get_total_income(), Decimal('0.00'))
+        self.assertEqual(self.cashregister.get_total_expenses(), Decimal('7.00'))
+
+class PaymentLedgerTests(FinanceTestMixin, TestCase):
+    def test_payment_posts_and_reverses_an_expense(self):
+        barber = Barber.objects.create(
+            user=CustomUser.objects.create_user(email='barber@example.com', password='secret'), salon=self.salon,
+            barber_type=BarberType.objects.create(name='Senior', salon=self.salon), start_date=date(2024, 1, 1),
+        )
+        payment = Payment.objects.create(
+            barber=barber, amount=Decimal('40.00'), start_date=date(2024, 2, 1), end_date=date(2024, 2, 29),
+            cashregister=self.cashregister, date_payment=date(2024, 3, 1), salon=self.salon,
+        )
+        posted = Transaction.objects.get(payment=payment)
+        self.assertEqual((posted.trans_type, posted.amount), (Transaction.TransactionType.EXPENSE, Decimal('40.00')))
+        self.assertEqual(self.cashregister.get_total_expenses(), Decimal('40.00'))
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal('-40.00'))
+
+        payment.delete()
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal('0.00'))
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.cashregister.get_total_expenses(), Decimal('0.00'))
+
+class ExchangeRateTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.euro = Currency.objects.create(code='EUR', name='Euro')
+        ExchangeRate.objects.create(currency=self.euro, date=date(2024, 3, 1), rate=Decimal('0.5'))
+        ExchangeRate.objects.create(currency=self.euro, date=date(2024, 4, 1), rate=Decimal('0.8'))
+
+    def test_rate_applies_until_the_next_one(self):
+        self.assertEqual(convert(Decimal('10'), self.euro.pk, date(2024, 3, 31)), (Decimal('20'), Decimal('0.5')))
+        self.assertEqual(convert(Decimal('10'), self.euro.pk, date(2024, 4, 1)), (Decimal('12.5'), Decimal('0.8')))
+        # Before the first rate, the rate typed in with the amount is used
+        self.assertEqual(convert(Decimal('10'), self.euro.pk, date(2024, 1, 1), Decimal('2')), (Decimal('5'), Decimal('2')))
+        with self.assertNumQueries(0):
+            convert(Decimal('10'), self.euro.pk, date(2024, 5, 1))
+
+    def test_saving_a_rate_invalidates_the_table(self):
+        convert(Decimal('10'), self.euro.pk, date(2024, 5, 1))
+        ExchangeRate.objects.create(currency=self.euro, date=date(2024, 5, 1), rate=Decimal('0.25'))
+        self.assertEqual(convert(Decimal('10'), self.euro.pk, date(2024, 5, 1))[0], Decimal('40'))
+
+    def test_convert_many_matches_convert(self):
+        amounts = [Decimal('10'), Decimal('10'), Decimal('7.5'), Decimal('3')]
+        currencies = [self.euro.pk, self.euro.pk, self.currency.pk, self.euro.pk]
+        days = [date(2024, 3, 15), date(2024, 4, 2), date(2024, 4, 2), date(2024, 2, 1)]
+        converted = convert_many(amounts, currencies, days, fallback_rates=[1, 1, 1, 3])
+        expected = [convert(*row)[0] for row in zip(amounts, currencies, days, [1, 1, 1, 3])]
+        self.assertEqual(converted.tolist(), [float(round(value, 2)) for value in expected])
+
+    def test_saved_amounts_use_the_table_rate(self):
+        sale = Transaction.objects.create(
+            trans_name='Sale', amount=Decimal('10.00'), currency=self.euro, exchange_rate=Decimal('1'),
+            date_trans=date(2024, 3, 2), cashregister=self.cashregister, salon=self.salon,
+        )
+        self.assertEqual((sale.exchange_rate, sale.amount_in_default_currency), (Decimal('0.5'), Decimal('20.00')))
+
+    def test_backfill_recomputes_amounts_and_rollups(self):
+        sale = Transaction.objects.create(
+            trans_name='Sale', amount=Decimal('10.00'), currency=self.euro, exchange_rate=Decimal('2'),
+            date_trans=date(2024, 2, 1), cashregister=self.cashregister, salon=self.salon,
+        )
+        ExchangeRate.objects.create(currency=self.euro, date=date(2024, 1, 1), rate=Decimal('4'))
+        call_command('backfill_default_amounts', '--only', 'transactions', '--chunk-size', '1', stdout=StringIO())
+        sale.refresh_from_db()
+        self.assertEqual((sale.exchange_rate, sale.amount_in_default_currency), (Decimal('4'), Decimal('2.50')))
+        rollup = DailyFinanceRollup.objects.get(date=date(2024, 2, 1))
+        self.assertEqual(rollup.amount_in_default_currency, Decimal('2.50'))
+
+    def test_backfill_leaves_amounts_saved_by_convert_alone(self):
+        ExchangeRate.objects.create(currency=self.euro, date=date(2024, 1, 1), rate=Decimal('4'))
+        # 2.18 / 4 = 0.545, rounded half-even to 0.54 in Decimal but to 0.55 in float
+        sale = Transaction.objects.create(
+            trans_name='Sale', amount=Decimal('2.18'), currency=self.euro,
+            date_trans=date(2024, 2, 1), cashregister=self.cashregister, salon=self.salon,
+        )
+        local = Transaction.objects.create(
+            trans_name='Local sale', amount=Decimal('5.00'), currency=self.currency, exchange_rate=Decimal('2'),
+            date_trans=date(2024, 2, 1), cashregister=self.cashregister, salon=self.salon,
+        )
+        stdout = StringIO()
+        call_command('backfill_default_amounts', '--only', 'transactions', stdout=stdout)
+        self.assertIn('transactions: 0 rows updated', stdout.getvalue())
+        sale.refresh_from_db()
+        local.refresh_from_db()
+        self.assertEqual(sale.amount_in_default_currency, Decimal('0.54'))
+        self.assertEqual((local.exchange_rate, local.amount_in_default_currency), (Decimal('2'), Decimal('5.00')))
+
+def assert_no_sequential_scan(testcase, queryset):
+    if connection.vendor == 'postgresql':
+        # Tiny test tables are always cheapest to scan; make the planner show whether an index can serve the query
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+        testcase.assertNotIn('Seq Scan', queryset.explain())
+    else:
+        plan = queryset.explain()
+        testcase.assertNotRegex(plan, r'\bSCAN ' + queryset.model._meta.db_table, plan)
+
+class TransactionHistoryIndexTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        other_salon = Salon.objects.create(name='Other salon', owner=self.owner)
+        other_register = CashRegister.objects.create(name='Front desk', currency=self.currency, salon=other_salon)
+        transactions = []
+        for day in range(1, 29):
+            for salon, cashregister in ((self.salon, self.cashregister), (other_salon, other_register)):
+                for trans_type in Transaction.TransactionType.values:
+                    transactions.append(Transaction(
+                        trans_name=f'{trans_type} {day}', amount=Decimal('10.00'), amount_in_default_currency=Decimal('10.00'),
+                        trans_type=trans_type, date_trans=date(2024, 2, day), cashregister=cashregister, salon=salon,
+                    ))
+        Transaction.objects.bulk_create(transactions)
+
+    def test_salon_date_range_by_type_uses_an_index(self):
+        queryset = Transaction.objects.for_salon(self.salon).between(date(2024, 2, 1), date(2024, 2, 10)).income()
+        self.assertEqual(queryset.count(), 10)
+        assert_no_sequential_scan(self, queryset)
+
+    def test_cashregister_date_range_uses_an_index(self):
+        queryset = Transaction.objects.for_cashregister(self.cashregister).between(date(2024, 2, 5))
+        self.assertEqual(queryset.count(), 48)
+        assert_no_sequential_scan(self, queryset)
+
+class KeysetPaginatorTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        Transaction.objects.bulk_create([
+            Transaction(
+                trans_name=f'Sale {i}', amount=Decimal('1.00'), amount_in_default_currency=Decimal('1.00'),
+                trans_type=Transaction.TransactionType.INCOME, date_trans=date(2024, 1, 1 + i // 4),
+                cashregister=self.cashregister, salon=self.salon,
+            )
+            for i in range(23)
+        ])
+        self.expected = list(Transaction.objects.order_by('-date_trans', '-pk').values_list('pk', flat=True))
+
+    def test_walks_forward_and_back_across_ties(self):
+        paginator = KeysetPaginator(Transaction.objects.for_salon(self.salon), 'date_trans', per_page=5)
+        pages, cursor = [], None
+        while True:
+            with self.assertNumQueries(1):
+                page = paginator.page(cursor)
+            pages.append([transaction.pk for transaction in page])
+            if not page.has_next():
+                break
+            cursor = page.next_cursor
+        self.assertEqual([pk for page in pages for pk in page], self.expected)
+        self.assertEqual([len(page) for page in pages], [5, 5, 5, 5, 3])
+
+        page = paginator.page(cursor)
+        backwards = []
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            backwards.append([transaction.pk for transaction in page])
+        self.assertEqual(backwards, pages[-2::-1])
+
+    def test_rejects_tampered_cursor(self):
+        paginator = KeysetPaginator(Transaction.objects.all(), 'date_trans', per_page=5)
+        with self.assertRaises(InvalidCursor):
+            paginator.page('not-a-cursor')
+
+class BalanceEngineTests(FinanceTestMixin, TestCase):
+    def test_update_balance_only_writes_the_balance(self):
+        stale = CashRegister.objects.get(pk=self.cashregister.pk)
+        CashRegister.objects.filter(pk=self.cashregister.pk).update(name='Renamed desk')
+        with self.assertNumQueries(1):
+            self.assertEqual(stale.update_balance(Decimal('12.50'), 'INCOME'), Decimal('12.50'))
+        self.assertEqual(stale.balance, Decimal('12.50'))
+        stale.update_balance(Decimal('2.25'), 'EXPENSE')
+        self.cashregister.refresh_from_db()
+        self.assertEqual((self.cashregister.name, self.cashregister.balance), ('Renamed desk', Decimal('10.25')))
+
+    def test_batch_returns_new_balances_and_records_metrics(self):
+        other = CashRegister.objects.create(name='Back desk', currency=self.currency, salon=self.salon)
+        balance_metrics.reset()
+        balances = apply_balance_deltas({other.pk: Decimal('3.00'), self.cashregister.pk: Decimal('-1.00')}, lock=True)
+        self.assertEqual(balances, {self.cashregister.pk: Decimal('-1.00'), other.pk: Decimal('3.00')})
+        self.assertEqual(balance_metrics.snapshot()['updates'], 2)
+
+class ConcurrentBalanceTests(FinanceTestMixin, TransactionTestCase):
+    def test_concurrent_updates_are_not_lost(self):
+        threads_count, updates_per_thread = 4, 25
+        errors = []
+
+        def till(cashregister):
+            try:
+                for i in range(updates_per_thread):
+                    while True:
+                        try:
+                            cashregister.update_balance(Decimal('1.00'), 'INCOME')
+                            break
+                        except OperationalError:
+                            # SQLite's shared in-memory test database reports contention instead of waiting
+                            if connection.vendor != 'sqlite':
+                                raise
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connections.close_all()
+
+        threads = [
+            threading.Thread(target=till, args=(CashRegister.objects.get(pk=self.cashregister.pk),))
+            for i in range(threads_count)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal(threads_count * updates_per_thread))
+
+class ExportViewTests(FinanceTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.make_transaction('Sale 1', '10.00', date_trans=date(2024, 2, 28))
+        self.make_transaction('Sale 2', '5.00', date_trans=date(2024, 3, 1))
+        self.make_transaction('Rent', '7.00', Transaction.TransactionType.EXPENSE, date_trans=date(2024, 3, 31))
+        self.client.force_login(self.owner)
+
+    def test_csv_export_streams_the_requested_range(self):
+        url = reverse('saloonfinance:transaction_export', kwargs={'salon_id': self.salon.pk})
+        response = self.client.get(url, {'start': '2024-03-01', 'end': '2024-03-31'})
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual(rows[0][:4], ['id', 'date_trans', 'trans_name', 'trans_type'])
+        self.assertEqual([(row[1], row[2], row[4]) for row in rows[1:]], [('2024-03-01', 'Sale 2', '5.00'), ('2024-03-31', 'Rent', '7.00')])
+
+    def test_csv_export_quotes_cells_read_as_formulas(self):
+        self.make_transaction('=HYPERLINK("http://example.com")', '3.00', date_trans=date(2024, 4, 1))
+        self.make_transaction('-2+3', '4.00', date_trans=date(2024, 4, 2))
+        url = reverse('saloonfinance:transaction_export', kwargs={'salon_id': self.salon.pk})
+        response = self.client.get(url, {'start': '2024-04-01'})
+        rows = list(csv.reader(b''.join(response.streaming_content).decode().splitlines()))
+        self.assertEqual([row[2] for row in rows[1:]], ['\'=HYPERLINK("http://example.com")', "'-2+3"])
+        self.assertEqual([row[4] for row in rows[1:]], ['3.00', '4.00'])
+
+    def test_ndjson_export_and_ownership(self):
+        url = reverse('saloonfinance:transaction_export', kwargs={'salon_id': self.salon.pk})
+        response = self.client.get(url, {'format': 'ndjson'})
+        records = [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+        self.assertEqual([record['trans_name'] for record in records], ['Sale 1', 'Sale 2', 'Rent'])
+        self.assertEqual(self.client.get(url, {'start': '03/01/2024'}).status_code, 400)
+
+        intruder = CustomUser.objects.create_user(email='intruder@example.com', password='secret')
+        self.client.force_login(intruder)
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+class ReferenceChoiceTests(FinanceTestMixin, TestCase):
+    reference_tables = ('saloonfinance_currency', 'saloonfinance_paymenttype')
+
+    def reference_queries(self, function):
+        with CaptureQueriesContext(connection) as context:
+            function()
+        return [query['sql'] for query in context.captured_queries if any(table in query['sql'] for table in self.reference_tables)]
+
+    def test_payment_form_renders_without_reference_queries(self):
+        PaymentType.get_default()
+        html = str(PaymentForm())
+        self.assertIn('SALARY', html)
+        self.assertEqual(self.reference_queries(lambda: str(PaymentForm())), [])
+        Currency.objects.create(code='EUR', name='Euro')
+        self.assertIn('EUR - Euro', str(PaymentForm()['currency']))
+
+    def test_serializers_validate_against_the_cache(self):
+        euro = Currency.objects.create(code='EUR', name='Euro')
+        field = PaymentSerializer().fields['currency']
+        field.to_internal_value(euro.pk)
+        self.assertEqual(self.reference_queries(lambda: self.assertEqual(field.to_internal_value(str(euro.pk)), euro)), [])
+        serializer = PaymentSerializer(data={'currency': 0, 'payment_type': PaymentType.get_default().pk})
+        self.assertFalse(serializer.is_valid())
+        self.assertIn('currency', serializer.errors)
+        self.assertNotIn('payment_type', serializer.errors)
+
+    def test_ids_missing_from_stale_cached_rows_are_looked_up(self):
+        field = PaymentSerializer().fields['currency']
+        field.to_internal_value(self.currency.pk)
+        # Saved through another worker, whose version bump this cache did not see
+        euro = Currency.objects.bulk_create([Currency(code='EUR', name='Euro')])[0]
+        self.assertEqual(field.to_internal_value(euro.pk), euro)
+        # The lookup invalidated the table, which is reloaded once with the new row
+        self.assertEqual(len(self.reference_queries(lambda: field.to_internal_value(euro.pk))), 1)
+        self.assertEqual(self.reference_queries(lambda: field.to_internal_value(euro.pk)), [])
+        with self.assertRaises(serializers.ValidationError):
+            field.to_internal_value(0)
 
-# Create your tests here.
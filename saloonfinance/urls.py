@@ -24,13 +24,18 @@ urlpatterns = [
 
     # Payment URLs
     path('salon/<int:salon_id>/payments/', views.PaymentListView.as_view(), name='payment_list'),
+    path('salon/<int:salon_id>/payments/export/', views.PaymentExportView.as_view(), name='payment_export'),
     path('salon/<int:salon_id>/payments/create/', views.PaymentCreateView.as_view(), name='payment_create'),
     path('salon/<int:salon_id>/payments/<int:pk>/update/', views.PaymentUpdateView.as_view(), name='payment_update'),
     path('salon/<int:salon_id>/payments/<int:pk>/delete/', views.PaymentDeleteView.as_view(), name='payment_delete'),
 
     # Transaction URLs
     path('salon/<int:salon_id>/transactions/', views.TransactionListView.as_view(), name='transaction_list'),
+    path('salon/<int:salon_id>/transactions/export/', views.TransactionExportView.as_view(), name='transaction_export'),
     path('salon/<int:salon_id>/transactions/create/', views.TransactionCreateView.as_view(), name='transaction_create'),
     path('salon/<int:salon_id>/transactions/<int:pk>/update/', views.TransactionUpdateView.as_view(), name='transaction_update'),
     path('salon/<int:salon_id>/transactions/<int:pk>/delete/', views.TransactionDeleteView.as_view(), name='transaction_delete'),
+
+    # Shave URLs
+    path('salon/<int:salon_id>/shaves/export/', views.ShaveExportView.as_view(), name='shave_export'),
 ]
\ No newline at end of file
@@ -1,27 +1,61 @@
+from datetime import datetime, time
+from django.views import View
 from django.views.generic import ListView, CreateView, UpdateView, DeleteView, DetailView
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.urls import reverse_lazy
 from django.shortcuts import get_object_or_404
 from django.core.exceptions import PermissionDenied
+from django.http import Http404, HttpResponseBadRequest
+from django.db import models
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from django.contrib.messages.views import SuccessMessageMixin
 from django.utils.translation import gettext_lazy as _
 from saloon.models import Salon
+from saloon.ownership import get_salon_ownership
+from saloon.reference import get_reference
 from .models import Currency, CashRegister, PaymentType, Payment, Transaction
 from .forms import CurrencyForm, CashRegisterForm, PaymentTypeForm, PaymentForm, TransactionForm
+from .pagination import KeysetPaginator, InvalidCursor
+from .exports import EXPORT_FORMATS, streaming_export
+from saloonservices.models import Shave
 
 class SalonOwnerMixin(UserPassesTestMixin):
     """
     Mixin to check if the current user is the owner of the salon.
     """
     def test_func(self):
-        salon_id = self.kwargs.get('salon_id')
-        return self.request.user.owned_salons.filter(id=salon_id).exists()
+        return get_salon_ownership(self.request).owns(self.kwargs.get('salon_id'))
+
+    def get_salon(self):
+        if not hasattr(self, '_salon'):
+            self._salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
+        return self._salon
+
+class KeysetPaginationMixin:
+    """
+    Mixin for list views paginated newest first on (keyset_date_field, pk)
+    with opaque ``?cursor=`` links instead of page numbers.
+    """
+    paginate_by = 25
+    keyset_date_field = 'created_at'
+
+    def paginate_queryset(self, queryset, page_size):
+        paginator = KeysetPaginator(queryset, self.keyset_date_field, page_size)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'))
+        except InvalidCursor:
+            raise Http404(_("Invalid cursor."))
+        return (paginator, page, page.object_list, page.has_other_pages())
 
 class CurrencyListView(LoginRequiredMixin, ListView):
     model = Currency
     template_name = 'saloonfinance/currency_list.html'
     context_object_name = 'currencies'
 
+    def get_queryset(self):
+        return get_reference('currencies')
+
 class CurrencyCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     model = Currency
     form_class = CurrencyForm
@@ -41,18 +75,18 @@ class CurrencyDeleteView(LoginRequiredMixin, DeleteView):
     template_name = 'saloonfinance/currency_confirm_delete.html'
     success_url = reverse_lazy('saloonfinance:currency_list')
 
-class CashRegisterListView(LoginRequiredMixin, SalonOwnerMixin, ListView):
+class CashRegisterListView(LoginRequiredMixin, SalonOwnerMixin, KeysetPaginationMixin, ListView):
     model = CashRegister
     template_name = 'saloonfinance/cashregister_list.html'
     context_object_name = 'cash_registers'
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
-        return CashRegister.objects.filter(salon=salon).select_related('salon')
+        salon = self.get_salon()
+        return CashRegister.objects.filter(salon=salon).select_related('salon', 'currency')
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['salon'] = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
+        context['salon'] = self.get_salon()
         return context
 
 class CashRegisterCreateView(LoginRequiredMixin, SalonOwnerMixin, CreateView):
@@ -66,12 +100,12 @@ class CashRegisterCreateView(LoginRequiredMixin, SalonOwnerMixin, CreateView):
     def form_valid(self, form):
         if not self.request.user.has_perm('saloonfinance.add_cashregister'):
             raise PermissionDenied(_("You do not have permission to add a cash register."))
-        form.instance.salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
+        form.instance.salon = self.get_salon()
         return super().form_valid(form)
     
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context['salon'] = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
+        context['salon'] = self.get_salon()
         return context
 
 class CashRegisterUpdateView(LoginRequiredMixin, SalonOwnerMixin, UpdateView):
@@ -99,6 +133,9 @@ class PaymentTypeListView(LoginRequiredMixin, ListView):
     template_name = 'saloonfinance/paymenttype_list.html'
     context_object_name = 'payment_types'
 
+    def get_queryset(self):
+        return get_reference('payment_types')
+
 class PaymentTypeCreateView(LoginRequiredMixin, SuccessMessageMixin, CreateView):
     model = PaymentType
     form_class = PaymentTypeForm
@@ -118,14 +155,20 @@ class PaymentTypeDeleteView(LoginRequiredMixin, DeleteView):
     template_name = 'saloonfinance/paymenttype_confirm_delete.html'
     success_url = reverse_lazy('saloonfinance:paymenttype_list')
 
-class PaymentListView(LoginRequiredMixin, SalonOwnerMixin, ListView):
+class PaymentListView(LoginRequiredMixin, SalonOwnerMixin, KeysetPaginationMixin, ListView):
     model = Payment
     template_name = 'saloonfinance/payment_list.html'
     context_object_name = 'payments'
+    keyset_date_field = 'date_payment'
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
-        return Payment.objects.filter(salon=salon).select_related('salon', 'payment_type')
+        salon = self.get_salon()
+        return Payment.objects.filter(salon=salon).select_related('salon', 'payment_type', 'currency', 'barber__user')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['salon'] = self.get_salon()
+        return context
 
 class PaymentCreateView(LoginRequiredMixin, SalonOwnerMixin, CreateView):
     model = Payment
@@ -136,7 +179,7 @@ class PaymentCreateView(LoginRequiredMixin, SalonOwnerMixin, CreateView):
         return reverse_lazy('saloonfinance:payment_list', kwargs={'salon_id': self.kwargs['salon_id']})
 
     def form_valid(self, form):
-        form.instance.salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
+        form.instance.salon = self.get_salon()
         return super().form_valid(form)
 
 class PaymentUpdateView(LoginRequiredMixin, SalonOwnerMixin, UpdateView):
@@ -154,14 +197,20 @@ class PaymentDeleteView(LoginRequiredMixin, SalonOwnerMixin, DeleteView):
     def get_success_url(self):
         return reverse_lazy('saloonfinance:payment_list', kwargs={'salon_id': self.object.salon.id})
 
-class TransactionListView(LoginRequiredMixin, SalonOwnerMixin, ListView):
+class TransactionListView(LoginRequiredMixin, SalonOwnerMixin, KeysetPaginationMixin, ListView):
     model = Transaction
     template_name = 'saloonfinance/transaction_list.html'
     context_object_name = 'transactions'
+    keyset_date_field = 'date_trans'
 
     def get_queryset(self):
-        salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
-        return Transaction.objects.filter(salon=salon).select_related('salon')
+        salon = self.get_salon()
+        return Transaction.objects.filter(salon=salon).select_related('salon', 'currency')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['salon'] = self.get_salon()
+        return context
 
 class TransactionCreateView(LoginRequiredMixin, SalonOwnerMixin, CreateView):
     model = Transaction
@@ -172,7 +221,7 @@ class TransactionCreateView(LoginRequiredMixin, SalonOwnerMixin, CreateView):
         return reverse_lazy('saloonfinance:transaction_list', kwargs={'salon_id': self.kwargs['salon_id']})
 
     def form_valid(self, form):
-        form.instance.salon = get_object_or_404(Salon, pk=self.kwargs['salon_id'])
+        form.instance.salon = self.get_salon()
         return super().form_valid(form)
 
 class TransactionUpdateView(LoginRequiredMixin, SalonOwnerMixin, UpdateView):
@@ -188,4 +237,63 @@ class TransactionDeleteView(LoginRequiredMixin, SalonOwnerMixin, DeleteView):
     template_name = 'saloonfinance/transaction_confirm_delete.html'
 
     def get_success_url(self):
-        return reverse_lazy('saloonfinance:transaction_list', kwargs={'salon_id': self.object.salon.id})
\ No newline at end of file
+        return reverse_lazy('saloonfinance:transaction_list', kwargs={'salon_id': self.object.salon.id})
+
+class ExportView(LoginRequiredMixin, SalonOwnerMixin, View):
+    """
+    Streams a salon's rows as CSV or NDJSON, optionally limited to
+    ``?start=YYYY-MM-DD&end=YYYY-MM-DD`` (both inclusive).
+    """
+    model = None
+    export_fields = ()
+    export_name = None
+
+    def get_date_bound(self, date_field, name, end_of_day=False):
+        value = self.request.GET.get(name)
+        if not value:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise ValueError(name)
+        if isinstance(self.model._meta.get_field(date_field), models.DateTimeField):
+            return timezone.make_aware(datetime.combine(day, time.max if end_of_day else time.min))
+        return day
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get('format', 'csv')
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest(_("Unsupported export format."))
+        queryset = self.model.objects.for_salon(self.kwargs['salon_id'])
+        date_field = queryset.date_field
+        try:
+            start_date = self.get_date_bound(date_field, 'start')
+            end_date = self.get_date_bound(date_field, 'end', end_of_day=True)
+        except ValueError:
+            return HttpResponseBadRequest(_("Dates must use the YYYY-MM-DD format."))
+        queryset = queryset.between(start_date, end_date).order_by(date_field, 'pk')
+        filename = f"{self.export_name}-{self.kwargs['salon_id']}"
+        return streaming_export(queryset, self.export_fields, export_format, filename)
+
+class TransactionExportView(ExportView):
+    model = Transaction
+    export_name = 'transactions'
+    export_fields = (
+        'id', 'date_trans', 'trans_name', 'trans_type', 'amount', 'currency__code', 'exchange_rate',
+        'amount_in_default_currency', 'cashregister__name',
+    )
+
+class PaymentExportView(ExportView):
+    model = Payment
+    export_name = 'payments'
+    export_fields = (
+        'id', 'date_payment', 'barber__user__email', 'payment_type__name', 'start_date', 'end_date', 'amount',
+        'currency__code', 'exchange_rate', 'amount_in_default_currency', 'cashregister__name',
+    )
+
+class ShaveExportView(ExportView):
+    model = Shave
+    export_name = 'shaves'
+    export_fields = (
+        'id', 'date_shave', 'status', 'barber__user__email', 'hairstyle__name', 'client__name', 'amount',
+        'currency__code', 'exchange_rate', 'amount_in_default_currency', 'cashregister__name',
+    )
@@ -1,29 +1,34 @@
 from django.contrib import admin
+from saloon.ownership import get_salon_ownership
 from .models import Item, ItemUsed, ItemPurchase
 
 class ItemAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'currency', 'current_stock', 'salon')
+    list_display = ('name', 'price', 'currency', 'current_stock', 'average_cost', 'salon')
     list_filter = ('salon', 'currency')
     search_fields = ('name', 'salon__name')
 
+    def get_readonly_fields(self, request, obj=None):
+        # Stock only moves through purchases and uses once the item exists
+        return Item.ledger_fields if obj else ('average_cost',)
+
     def get_queryset(self, request):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Item, ItemAdmin)
 
@@ -36,20 +41,20 @@ class ItemUsedAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(ItemUsed, ItemUsedAdmin)
 
@@ -62,19 +67,19 @@ class ItemPurchaseAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(ItemPurchase, ItemPurchaseAdmin)
@@ -0,0 +1,194 @@
+''' Bulk CSV import of a salon's items, clients and item purchases '''
+
+import csv
+import time
+from itertools import islice
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils.translation import gettext_lazy as _
+from saloon.dashboard import invalidate_dashboard
+from saloon.models import Client
+from saloonfinance.ledger import LedgerService
+from saloonfinance.models import Currency
+from saloonfinance.rates import convert
+from .ledger import StockLedger
+from .reports import invalidate_inventory_report
+from .models import Item, ItemPurchase
+
+class ImportReport:
+    def __init__(self, kind, total):
+        self.kind = kind
+        self.total = total
+        self.created = 0
+        self.started = time.monotonic()
+
+    @property
+    def elapsed(self):
+        return time.monotonic() - self.started
+
+    @property
+    def rows_per_second(self):
+        return self.created / self.elapsed if self.elapsed else 0.0
+
+    def as_dict(self):
+        return {
+            'kind': self.kind,
+            'created': self.created,
+            'total': self.total,
+            'elapsed': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+class SalonDataImporter:
+    """
+    Base importer. The CSV is parsed row by row, each row is built and
+    validated against lookups loaded once per import, and nothing is written
+    unless every row is valid. Rows are then inserted with ``bulk_create`` in
+    chunks within a single transaction, so a database error in any chunk
+    leaves nothing behind, with the side effects of each chunk (stock,
+    balances, ledger) applied as aggregated deltas.
+    """
+    kind = None
+    columns = ()
+    required_columns = ()
+    # Dashboard sections of the salon made stale by the import
+    dashboard_sections = ()
+
+    def __init__(self, salon, chunk_size=500, progress=None):
+        self.salon = salon
+        self.chunk_size = chunk_size
+        self.progress = progress
+        self.default_currency_id = Currency.get_default()
+
+    def load_lookups(self):
+        pass
+
+    def build(self, row):
+        raise NotImplementedError
+
+    def write(self, objects):
+        raise NotImplementedError
+
+    def parse(self, lines):
+        reader = csv.DictReader(lines)
+        objects, errors = [], {}
+        try:
+            missing = set(self.required_columns) - set(reader.fieldnames or ())
+            if missing:
+                raise ValidationError(_("Missing columns: %(columns)s") % {'columns': ', '.join(sorted(missing))})
+            # Line 1 is the header
+            for line_number, row in enumerate(reader, start=2):
+                values = {column: (row.get(column) or '').strip() for column in self.columns}
+                try:
+                    objects.append(self.build({column: value for column, value in values.items() if value}))
+                except ValidationError as e:
+                    errors[line_number] = e.messages
+        except UnicodeDecodeError:
+            raise ValidationError(_("The file is not UTF-8 encoded text."))
+        except csv.Error as e:
+            raise ValidationError(_("The file is not a valid CSV (line %(line)s: %(error)s).") % {
+                'line': reader.line_num, 'error': e,
+            })
+        if errors:
+            raise ValidationError(errors)
+        return objects
+
+    def run(self, lines):
+        self.load_lookups()
+        objects = self.parse(lines)
+        report = ImportReport(self.kind, len(objects))
+        iterator = iter(objects)
+        with transaction.atomic():
+            while True:
+                chunk = list(islice(iterator, self.chunk_size))
+                if not chunk:
+                    break
+                self.write(chunk)
+                report.created += len(chunk)
+                if self.progress:
+                    self.progress(report)
+        invalidate_dashboard({self.salon.pk}, self.dashboard_sections)
+        return report
+
+    def lookup(self, objects, key, field_name):
+        try:
+            return objects[key]
+        except KeyError:
+            raise ValidationError({field_name: _("Unknown value '%(value)s'.") % {'value': key}})
+
+class ClientImporter(SalonDataImporter):
+    kind = 'clients'
+    columns = ('name', 'phone', 'address')
+    dashboard_sections = ('team',)
+    required_columns = ('name',)
+
+    def build(self, row):
+        client = Client(salon=self.salon, **row)
+        client.full_clean(exclude=['user', 'salon'])
+        return client
+
+    def write(self, objects):
+        Client.objects.bulk_create(objects)
+
+class ItemImporter(SalonDataImporter):
+    kind = 'items'
+    columns = ('name', 'price', 'currency', 'exchange_rate')
+    required_columns = ('name', 'price')
+    dashboard_sections = ('stock',)
+
+    def load_lookups(self):
+        self.currencies = {currency.code: currency for currency in Currency.objects.all()}
+        self.seen_names = set(self.salon.items.values_list('name', flat=True))
+
+    def build(self, row):
+        currency = self.lookup(self.currencies, row.pop('currency'), 'currency') if 'currency' in row else None
+        item = Item(salon=self.salon, currency_id=currency.pk if currency else self.default_currency_id, **row)
+        item.clean_fields(exclude=['salon', 'currency', 'amount_in_default_currency'])
+        if item.name in self.seen_names:
+            raise ValidationError({'name': _("An item with this name already exists in the salon.")})
+        item.clean()
+        item.amount_in_default_currency, item.exchange_rate = convert(
+            item.price, item.currency_id, exchange_rate=item.exchange_rate, default_currency_id=self.default_currency_id
+        )
+        self.seen_names.add(item.name)
+        return item
+
+    def write(self, objects):
+        Item.objects.bulk_create(objects)
+        invalidate_inventory_report({self.salon.pk})
+
+class ItemPurchaseImporter(SalonDataImporter):
+    kind = 'purchases'
+    columns = ('item', 'quantity', 'purchase_price', 'currency', 'exchange_rate', 'purchase_date', 'supplier', 'cashregister')
+    required_columns = ('item', 'quantity', 'purchase_price', 'cashregister')
+    dashboard_sections = ('finance', 'balances', 'stock')
+
+    def load_lookups(self):
+        self.items = {item.name: item for item in self.salon.items.all()}
+        self.cashregisters = {cashregister.name: cashregister for cashregister in self.salon.cash_registers.all()}
+        self.currencies = {currency.code: currency for currency in Currency.objects.all()}
+
+    def build(self, row):
+        item = self.lookup(self.items, row.pop('item'), 'item')
+        cashregister = self.lookup(self.cashregisters, row.pop('cashregister'), 'cashregister')
+        currency = self.lookup(self.currencies, row.pop('currency'), 'currency') if 'currency' in row else None
+        purchase = ItemPurchase(
+            salon=self.salon, item=item, cashregister=cashregister,
+            currency_id=currency.pk if currency else self.default_currency_id, **row
+        )
+        purchase.clean_fields(exclude=['salon', 'item', 'cashregister', 'currency', 'purchase_price_in_default_currency'])
+        purchase.set_price_in_default_currency(self.default_currency_id)
+        purchase.clean()
+        return purchase
+
+    def write(self, objects):
+        purchases = ItemPurchase.objects.bulk_create(objects)
+        stock = StockLedger()
+        for purchase in purchases:
+            stock.add(purchase.build_stock_movement())
+        stock.apply()
+        ledger = LedgerService()
+        ledger.post_new(purchases)
+        ledger.apply()
+
+IMPORTERS = {importer.kind: importer for importer in (ClientImporter, ItemImporter, ItemPurchaseImporter)}
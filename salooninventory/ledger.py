@@ -0,0 +1,222 @@
+''' Append-only stock ledger with per-day running balances '''
+
+from bisect import bisect_right
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+from django.apps import apps
+from django.db import transaction
+from django.db.models import F, QuerySet, Sum
+from saloon.dashboard import invalidate_dashboard
+from saloonfinance.rollups import to_rollup_date
+from .reports import invalidate_inventory_report
+
+COST = Decimal('0.000001')
+
+def weighted_average_cost(stock, average_cost, quantity, unit_cost):
+    """
+    Moving average cost after ``quantity`` units at ``unit_cost`` enter the
+    stock (or leave it, for a reversed purchase).
+    """
+    remaining = stock + quantity
+    if remaining <= 0:
+        return average_cost
+    return ((stock * average_cost + quantity * unit_cost) / remaining).quantize(COST)
+
+class StockLedger:
+    """
+    Collects stock movements and writes them with one insert, one UPDATE per
+    touched item and one snapshot UPDATE per touched (item, day).
+    """
+    def __init__(self):
+        self.movements = []
+
+    def add(self, movement):
+        self.movements.append(movement)
+
+    def apply(self):
+        """
+        Write the collected movements and return the new ``(current_stock,
+        average_cost)`` of every touched item.
+        """
+        if not self.movements:
+            return {}
+        StockMovement = apps.get_model('salooninventory', 'StockMovement')
+        with transaction.atomic(savepoint=False):
+            movements = StockMovement.objects.bulk_create(self.movements)
+            levels = self.update_items(movements)
+            self.update_snapshots(movements)
+        salon_ids = {movement.salon_id for movement in movements}
+        invalidate_inventory_report(salon_ids)
+        invalidate_dashboard(salon_ids, ['stock'])
+        self.movements = []
+        return levels
+
+    def update_items(self, movements):
+        Item = apps.get_model('salooninventory', 'Item')
+        by_item = defaultdict(list)
+        for movement in movements:
+            by_item[movement.item_id].append(movement)
+        levels = {}
+        # Rows are locked in pk order so concurrent writers cannot deadlock
+        items = Item.objects.select_for_update().filter(pk__in=by_item).order_by('pk')
+        for pk, stock, average_cost in items.values_list('pk', 'current_stock', 'average_cost'):
+            for movement in by_item[pk]:
+                if movement.unit_cost is not None:
+                    average_cost = weighted_average_cost(stock, average_cost, movement.quantity, movement.unit_cost)
+                stock += movement.quantity
+            Item.objects.filter(pk=pk).update(current_stock=stock, average_cost=average_cost)
+            levels[pk] = (stock, average_cost)
+        return levels
+
+    def update_snapshots(self, movements):
+        """
+        Shift the snapshots from each touched day up to the next one by the
+        running total of the new movements, and create the touched days that
+        had no snapshot yet.
+        """
+        StockSnapshot = apps.get_model('salooninventory', 'StockSnapshot')
+        deltas = defaultdict(lambda: defaultdict(int))
+        for movement in movements:
+            deltas[movement.item_id][movement.date] += movement.quantity
+        for item_id, by_date in deltas.items():
+            dates = sorted(date for date, quantity in by_date.items() if quantity)
+            if not dates:
+                continue
+            snapshots = StockSnapshot.objects.filter(item_id=item_id)
+            stored = dict(snapshots.filter(date__range=(dates[0], dates[-1])).values_list('date', 'balance'))
+            stored_dates = sorted(stored)
+            opening = stock_on(item_id, dates[0] - timedelta(days=1))
+            missing, shift = [], 0
+            for index, date in enumerate(dates):
+                shift += by_date[date]
+                if date not in stored:
+                    position = bisect_right(stored_dates, date)
+                    balance = stored[stored_dates[position - 1]] if position else opening
+                    missing.append(StockSnapshot(item_id=item_id, date=date, balance=balance + shift))
+                following = snapshots.filter(date__gte=date)
+                if index + 1 < len(dates):
+                    following = following.filter(date__lt=dates[index + 1])
+                following.update(balance=F('balance') + shift)
+            StockSnapshot.objects.bulk_create(missing)
+
+def stock_on(item_id, date):
+    """
+    Stock of an item at the end of ``date``, read from the latest snapshot
+    on or before that day.
+    """
+    StockSnapshot = apps.get_model('salooninventory', 'StockSnapshot')
+    balance = StockSnapshot.objects.filter(item_id=item_id, date__lte=to_rollup_date(date)).order_by('-date').values_list('balance', flat=True).first()
+    return balance or 0
+
+def sync_stock(source, field_name, movement):
+    """
+    Make the movements linked to ``source`` (a purchase or a use) net to
+    ``movement``, or to nothing when it is None. Whatever they replace is
+    reversed by appending movements, never by editing them.
+    """
+    StockMovement = apps.get_model('salooninventory', 'StockMovement')
+    linked = StockMovement.objects.filter(**{field_name: source}).values('item_id', 'salon_id', 'date', 'unit_cost')
+    current = {
+        (row['item_id'], row['salon_id'], row['date'], row['unit_cost']): row['net']
+        for row in linked.annotate(net=Sum('quantity')).order_by() if row['net']
+    }
+    wanted = {}
+    if movement is not None:
+        wanted[(movement.item_id, movement.salon_id, movement.date, movement.unit_cost)] = movement.quantity
+    if current == wanted:
+        return {}
+    ledger = StockLedger()
+    for (item_id, salon_id, date, unit_cost), net in current.items():
+        ledger.add(StockMovement(
+            item_id=item_id, salon_id=salon_id, kind=StockMovement.Kind.REVERSAL, quantity=-net,
+            unit_cost=unit_cost, date=date, **{field_name: source}
+        ))
+    if movement is not None:
+        ledger.add(movement)
+    levels = ledger.apply()
+    if type(source).item.is_cached(source) and source.item_id in levels:
+        source.item.current_stock, source.item.average_cost = levels[source.item_id]
+    return levels
+
+def deleted_with_item(origin):
+    """
+    Whether a delete was cascaded from the item or salon, in which case the
+    ledger rows go with it and nothing needs reversing.
+    """
+    Item = apps.get_model('salooninventory', 'Item')
+    Salon = apps.get_model('saloon', 'Salon')
+    model = origin.model if isinstance(origin, QuerySet) else type(origin)
+    return issubclass(model, (Item, Salon))
+
+def rebuild_stock_ledger(salon_ids=None):
+    """
+    Recreate the movements, snapshots and average costs from the purchases
+    and uses. Stock that no purchase accounts for is kept as an opening
+    adjustment. Returns the number of movements written.
+    """
+    Item = apps.get_model('salooninventory', 'Item')
+    ItemPurchase = apps.get_model('salooninventory', 'ItemPurchase')
+    ItemUsed = apps.get_model('salooninventory', 'ItemUsed')
+    StockMovement = apps.get_model('salooninventory', 'StockMovement')
+    StockSnapshot = apps.get_model('salooninventory', 'StockSnapshot')
+
+    items = Item.objects.all()
+    purchases = ItemPurchase.objects.all()
+    uses = ItemUsed.objects.all()
+    if salon_ids is not None:
+        items = items.filter(salon_id__in=salon_ids)
+        purchases = purchases.filter(salon_id__in=salon_ids)
+        uses = uses.filter(salon_id__in=salon_ids)
+
+    # Movements are replayed in the order they were recorded, which is the
+    # order the incremental moving average saw them in
+    by_item = defaultdict(list)
+    for pk, item_id, salon_id, quantity, unit_cost, date, created_at in purchases.values_list(
+        'pk', 'item_id', 'salon_id', 'quantity', 'purchase_price_in_default_currency', 'purchase_date', 'created_at'
+    ).iterator():
+        by_item[item_id].append((created_at, StockMovement(
+            item_id=item_id, salon_id=salon_id, kind=StockMovement.Kind.PURCHASE, quantity=quantity,
+            unit_cost=unit_cost, date=date, purchase_id=pk,
+        )))
+    for pk, item_id, salon_id, quantity, moment, created_at in uses.values_list(
+        'pk', 'item_id', 'salon_id', 'quantity', 'shave__date_shave', 'created_at'
+    ).iterator():
+        by_item[item_id].append((created_at, StockMovement(
+            item_id=item_id, salon_id=salon_id, kind=StockMovement.Kind.USE, quantity=-quantity,
+            date=to_rollup_date(moment), item_used_id=pk,
+        )))
+
+    movements, snapshots, costs = [], [], []
+    for item_id, salon_id, current_stock, created_at in items.values_list('pk', 'salon_id', 'current_stock', 'created_at').iterator():
+        item_movements = [movement for _, movement in sorted(by_item.pop(item_id, ()), key=lambda entry: entry[0])]
+        opening = current_stock - sum(movement.quantity for movement in item_movements)
+        if opening:
+            first_day = min((movement.date for movement in item_movements), default=to_rollup_date(created_at))
+            item_movements.insert(0, StockMovement(
+                item_id=item_id, salon_id=salon_id, kind=StockMovement.Kind.ADJUSTMENT, quantity=opening, date=first_day,
+            ))
+        stock, average_cost, changes = 0, Decimal('0'), defaultdict(int)
+        for movement in item_movements:
+            if movement.unit_cost is not None:
+                average_cost = weighted_average_cost(stock, average_cost, movement.quantity, movement.unit_cost)
+            stock += movement.quantity
+            changes[movement.date] += movement.quantity
+        balances, balance = {}, 0
+        for date in sorted(changes):
+            balance += changes[date]
+            balances[date] = balance
+        movements.extend(item_movements)
+        snapshots.extend(StockSnapshot(item_id=item_id, date=date, balance=balance) for date, balance in balances.items())
+        costs.append(Item(pk=item_id, average_cost=average_cost))
+
+    with transaction.atomic():
+        StockMovement.objects.filter(item__in=items).delete()
+        StockSnapshot.objects.filter(item__in=items).delete()
+        StockMovement.objects.bulk_create(movements, batch_size=5000)
+        StockSnapshot.objects.bulk_create(snapshots, batch_size=5000)
+        Item.objects.bulk_update(costs, ['average_cost'], batch_size=1000)
+    salon_ids = set(items.values_list('salon_id', flat=True).distinct())
+    invalidate_inventory_report(salon_ids)
+    invalidate_dashboard(salon_ids, ['stock'])
+    return len(movements)
@@ -0,0 +1,37 @@
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from saloon.models import Salon
+from salooninventory.imports import IMPORTERS
+
+class Command(BaseCommand):
+    help = "Import a salon's clients, items or item purchases from a CSV file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path', help="CSV file with a header row.")
+        parser.add_argument('--salon', type=int, required=True)
+        parser.add_argument('--chunk-size', type=int, default=500)
+
+    def handle(self, *args, **options):
+        try:
+            salon = Salon.objects.get(pk=options['salon'])
+        except Salon.DoesNotExist:
+            raise CommandError(f"Salon {options['salon']} does not exist.")
+
+        def progress(report):
+            self.stdout.write(f"{report.created}/{report.total} {report.kind} ({report.rows_per_second:.0f} rows/s)")
+
+        importer = IMPORTERS[options['kind']](salon, chunk_size=options['chunk_size'], progress=progress)
+        try:
+            with open(options['path'], newline='', encoding='utf-8-sig') as lines:
+                report = importer.run(lines)
+        except ValidationError as e:
+            if hasattr(e, 'error_dict'):
+                for line_number, messages in e.message_dict.items():
+                    self.stderr.write(f"line {line_number}: {'; '.join(messages)}")
+            else:
+                self.stderr.write('; '.join(e.messages))
+            raise CommandError("Nothing was imported.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {report.created} {report.kind} in {report.elapsed:.2f}s ({report.rows_per_second:.0f} rows/s)."
+        ))
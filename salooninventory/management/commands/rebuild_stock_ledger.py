@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from salooninventory.ledger import rebuild_stock_ledger
+
+class Command(BaseCommand):
+    help = "Rebuild the stock movements, daily snapshots and average costs from the purchases and uses."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--salon', type=int, action='append', dest='salons', help="Only rebuild this salon (can be repeated).")
+
+    def handle(self, *args, **options):
+        count = rebuild_stock_ledger(salon_ids=options['salons'])
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {count} stock movements."))
@@ -0,0 +1,103 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:03
+
+from collections import defaultdict
+from decimal import Decimal
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models.functions import TruncDate
+
+
+def populate_stock_ledger(apps, schema_editor):
+    Item = apps.get_model('salooninventory', 'Item')
+    ItemPurchase = apps.get_model('salooninventory', 'ItemPurchase')
+    ItemUsed = apps.get_model('salooninventory', 'ItemUsed')
+    StockMovement = apps.get_model('salooninventory', 'StockMovement')
+    StockSnapshot = apps.get_model('salooninventory', 'StockSnapshot')
+    by_item = defaultdict(list)
+    for pk, item_id, salon_id, quantity, unit_cost, date, created_at in ItemPurchase.objects.values_list(
+        'pk', 'item_id', 'salon_id', 'quantity', 'purchase_price_in_default_currency', 'purchase_date', 'created_at'
+    ):
+        by_item[item_id].append((created_at, StockMovement(
+            item_id=item_id, salon_id=salon_id, kind='PURCHASE', quantity=quantity, unit_cost=unit_cost, date=date, purchase_id=pk,
+        )))
+    uses = ItemUsed.objects.annotate(day=TruncDate('shave__date_shave'))
+    for pk, item_id, salon_id, quantity, date, created_at in uses.values_list('pk', 'item_id', 'salon_id', 'quantity', 'day', 'created_at'):
+        by_item[item_id].append((created_at, StockMovement(
+            item_id=item_id, salon_id=salon_id, kind='USE', quantity=-quantity, date=date, item_used_id=pk,
+        )))
+    movements, snapshots, costs = [], [], []
+    for item in Item.objects.all():
+        item_movements = [movement for _, movement in sorted(by_item.pop(item.pk, ()), key=lambda entry: entry[0])]
+        opening = item.current_stock - sum(movement.quantity for movement in item_movements)
+        if opening:
+            first_day = min((movement.date for movement in item_movements), default=item.created_at.date())
+            item_movements.insert(0, StockMovement(item_id=item.pk, salon_id=item.salon_id, kind='ADJUSTMENT', quantity=opening, date=first_day))
+        stock, average_cost, changes = 0, Decimal('0'), defaultdict(int)
+        for movement in item_movements:
+            if movement.unit_cost is not None and stock + movement.quantity > 0:
+                average_cost = ((stock * average_cost + movement.quantity * movement.unit_cost) / (stock + movement.quantity)).quantize(Decimal('0.000001'))
+            stock += movement.quantity
+            changes[movement.date] += movement.quantity
+        balances, balance = {}, 0
+        for date in sorted(changes):
+            balance += changes[date]
+            balances[date] = balance
+        movements.extend(item_movements)
+        snapshots.extend(StockSnapshot(item_id=item.pk, date=date, balance=balance) for date, balance in balances.items())
+        item.average_cost = average_cost
+        costs.append(item)
+    StockMovement.objects.bulk_create(movements, batch_size=5000)
+    StockSnapshot.objects.bulk_create(snapshots, batch_size=5000)
+    Item.objects.bulk_update(costs, ['average_cost'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+        ('salooninventory', '0002_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='item',
+            name='average_cost',
+            field=models.DecimalField(decimal_places=6, default=0, max_digits=19, verbose_name='Average cost'),
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('PURCHASE', 'Purchase'), ('USE', 'Use'), ('ADJUSTMENT', 'Adjustment'), ('REVERSAL', 'Reversal')], max_length=10, verbose_name='Kind')),
+                ('quantity', models.IntegerField(verbose_name='Quantity')),
+                ('unit_cost', models.DecimalField(blank=True, decimal_places=6, max_digits=19, null=True, verbose_name='Unit cost')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Created at')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='salooninventory.item', verbose_name='Item')),
+                ('item_used', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='salooninventory.itemused', verbose_name='Item used')),
+                ('purchase', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to='salooninventory.itempurchase', verbose_name='Purchase')),
+                ('salon', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='saloon.salon', verbose_name='Salon')),
+            ],
+            options={
+                'verbose_name': 'Stock Movement',
+                'verbose_name_plural': 'Stock Movements',
+                'indexes': [models.Index(fields=['item', 'date'], name='salooninven_item_id_7c8b5f_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='Date')),
+                ('balance', models.IntegerField(verbose_name='Balance')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_snapshots', to='salooninventory.item', verbose_name='Item')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'unique_together': {('item', 'date')},
+            },
+        ),
+        migrations.RunPython(populate_stock_ledger, migrations.RunPython.noop),
+    ]
@@ -1,15 +1,24 @@
 ''' Models for the salooninventory app '''
 
+from decimal import Decimal
 from django.db import models, transaction 
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, post_delete, pre_delete
 from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.exceptions import ValidationError
 from django.db.models import Sum, F
+from saloon.dashboard import invalidate_dashboard
 from saloon.models import Salon, Barber, TimestampMixin
+from saloonfinance.ledger import LedgerService, deleted_with_source
 from saloonfinance.models import CashRegister, Currency, Transaction
+from saloonfinance.rates import convert
+from saloonfinance.rollups import to_rollup_date
 from saloonservices.models import Shave, Hairstyle
+from .ledger import deleted_with_item, stock_on, sync_stock, StockLedger
+from .reports import invalidate_inventory_report
+
+CENT = Decimal('0.01')
 
 class Item(TimestampMixin):
     name = models.CharField(_("Name"), max_length=255)
@@ -20,16 +29,33 @@ class Item(TimestampMixin):
     amount_in_default_currency = models.DecimalField(_("Amount in default currency"), max_digits=19, decimal_places=2)
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='items', verbose_name=_("Salon"))
     current_stock = models.PositiveIntegerField(_("Current stock"), default=0)
+    average_cost = models.DecimalField(_("Average cost"), max_digits=19, decimal_places=6, default=0)
+
+    # Maintained by the stock ledger, never written by a plain save
+    ledger_fields = ('current_stock', 'average_cost')
 
     def __str__(self):
         return f"{self.name} - {self.salon.name}"
     
     def save(self, *args, **kwargs):        
-        if self.currency != Currency.get_default():
-            self.amount_in_default_currency = self.price / self.exchange_rate
-        else:
-            self.amount_in_default_currency = self.price
-        super().save(*args, **kwargs)
+        self.amount_in_default_currency, self.exchange_rate = convert(self.price, self.currency_id, exchange_rate=self.exchange_rate)
+        if not self._state.adding:
+            if kwargs.get('update_fields') is None:
+                kwargs['update_fields'] = [
+                    field.name for field in self._meta.concrete_fields
+                    if not field.primary_key and field.name not in self.ledger_fields
+                ]
+            return super().save(*args, **kwargs)
+        opening_stock, self.current_stock = self.current_stock, 0
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            if opening_stock:
+                ledger = StockLedger()
+                ledger.add(StockMovement(
+                    item=self, salon_id=self.salon_id, kind=StockMovement.Kind.ADJUSTMENT,
+                    quantity=opening_stock, date=to_rollup_date(timezone.now()),
+                ))
+                self.current_stock, self.average_cost = ledger.apply()[self.pk]
 
     def clean(self):
         if self.price < 0:
@@ -39,13 +65,10 @@ class Item(TimestampMixin):
         return self.price * self.current_stock
 
     def get_average_purchase_price(self):
-        purchases = self.purchases.aggregate(
-            total_cost=Sum(F('purchase_price') * F('quantity')),
-            total_quantity=Sum('quantity')
-        )
-        if purchases['total_quantity']:
-            return purchases['total_cost'] / purchases['total_quantity']
-        return 0
+        return self.average_cost
+
+    def stock_on(self, date):
+        return stock_on(self.pk, date)
 
     class Meta:
         verbose_name = _("Item")
@@ -77,8 +100,13 @@ class ItemUsed(TimestampMixin):
         self.full_clean()
         with transaction.atomic():
             super().save(*args, **kwargs)
-            self.item.current_stock = F('current_stock') - self.quantity
-            self.item.save()
+            sync_stock(self, 'item_used', self.build_stock_movement())
+
+    def build_stock_movement(self):
+        return StockMovement(
+            item_id=self.item_id, salon_id=self.salon_id, kind=StockMovement.Kind.USE,
+            quantity=-self.quantity, date=to_rollup_date(self.shave.date_shave), item_used=self,
+        )
 
     class Meta:
         unique_together = ('item', 'shave', 'salon')
@@ -97,16 +125,19 @@ class ItemPurchase(TimestampMixin):
     cashregister = models.ForeignKey(CashRegister, on_delete=models.PROTECT, related_name='purchases', verbose_name=_("Cash Register"))
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='item_purchases', verbose_name=_("Salon"))
 
+    def set_price_in_default_currency(self, default_currency_id):
+        self.purchase_price_in_default_currency, self.exchange_rate = convert(
+            self.purchase_price, self.currency_id, self.purchase_date, self.exchange_rate, default_currency_id
+        )
+
     def save(self, *args, **kwargs):
-        if self.currency != Currency.get_default():
-            self.purchase_price_in_default_currency = self.purchase_price / self.exchange_rate
-        else:
-            self.purchase_price_in_default_currency = self.purchase_price
+        self.set_price_in_default_currency(Currency.get_default())
         self.full_clean()
+        created = self._state.adding
         with transaction.atomic():
             super().save(*args, **kwargs)
-            self.item.current_stock = F('current_stock') + self.quantity
-            self.item.save()
+            sync_stock(self, 'purchase', self.build_stock_movement())
+            LedgerService.post(self, created=created)
 
     def clean(self):
         if self.purchase_price <= 0:
@@ -119,27 +150,106 @@ class ItemPurchase(TimestampMixin):
     def __str__(self):
         return f"{self.item.name} - {self.quantity} - {self.purchase_date}"
 
+    def get_total_cost(self):
+        return self.purchase_price * self.quantity
+
+    def get_transaction_name(self):
+        return f"Purchase: {self.item.name} #{self.pk}"
+
+    def build_transaction(self):
+        return Transaction(
+            trans_name=self.get_transaction_name(),
+            amount=self.get_total_cost(),
+            currency_id=self.currency_id,
+            exchange_rate=self.exchange_rate,
+            amount_in_default_currency=self.purchase_price_in_default_currency * self.quantity,
+            date_trans=self.purchase_date,
+            trans_type=Transaction.TransactionType.EXPENSE,
+            cashregister_id=self.cashregister_id,
+            salon_id=self.salon_id,
+            purchase=self,
+        )
+
+    def build_stock_movement(self):
+        return StockMovement(
+            item_id=self.item_id, salon_id=self.salon_id, kind=StockMovement.Kind.PURCHASE, quantity=self.quantity,
+            unit_cost=Decimal(self.purchase_price_in_default_currency).quantize(CENT), date=self.purchase_date, purchase=self,
+        )
+
     class Meta:
         verbose_name = _("Item Purchase")
         verbose_name_plural = _("Item Purchases")
 
+class StockMovement(models.Model):
+    """
+    Append-only record of every change to an item's stock. Edits and deletes
+    of purchases and uses append reversals rather than rewriting history.
+    """
+    class Kind(models.TextChoices):
+        PURCHASE = 'PURCHASE', _('Purchase')
+        USE = 'USE', _('Use')
+        ADJUSTMENT = 'ADJUSTMENT', _('Adjustment')
+        REVERSAL = 'REVERSAL', _('Reversal')
+
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='movements', verbose_name=_("Item"))
+    salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='stock_movements', verbose_name=_("Salon"))
+    kind = models.CharField(_("Kind"), max_length=10, choices=Kind.choices)
+    quantity = models.IntegerField(_("Quantity"))
+    unit_cost = models.DecimalField(_("Unit cost"), max_digits=19, decimal_places=6, null=True, blank=True)
+    date = models.DateField(_("Date"))
+    purchase = models.ForeignKey(ItemPurchase, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements', verbose_name=_("Purchase"))
+    item_used = models.ForeignKey(ItemUsed, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements', verbose_name=_("Item used"))
+    created_at = models.DateTimeField(_("Created at"), auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} - {self.quantity} - {self.date}"
+
+    class Meta:
+        verbose_name = _("Stock Movement")
+        verbose_name_plural = _("Stock Movements")
+        indexes = [
+            models.Index(fields=['item', 'date']),
+        ]
+
+class StockSnapshot(models.Model):
+    """
+    Stock of an item at the end of every day on which it moved, so the stock
+    on any date is one index lookup.
+    """
+    item = models.ForeignKey(Item, on_delete=models.CASCADE, related_name='stock_snapshots', verbose_name=_("Item"))
+    date = models.DateField(_("Date"))
+    balance = models.IntegerField(_("Balance"))
+
+    def __str__(self):
+        return f"{self.item_id} - {self.date} - {self.balance}"
+
+    class Meta:
+        verbose_name = _("Stock Snapshot")
+        verbose_name_plural = _("Stock Snapshots")
+        unique_together = ['item', 'date']
+
+@receiver(post_save, sender=Item)
+@receiver(post_delete, sender=Item)
+def invalidate_salon_inventory_report(sender, instance, **kwargs):
+    invalidate_inventory_report({instance.salon_id})
+    invalidate_dashboard({instance.salon_id}, ['stock'])
+
 @receiver(post_save, sender=ItemPurchase)
-def update_cashregister_balance(sender, instance, created, **kwargs):
-    if created:
-        with transaction.atomic():
-            total_cost = instance.purchase_price * instance.quantity
-            instance.cashregister.update_balance(total_cost, 'EXPENSE')
-            Transaction.objects.create(
-                trans_name=f"Purchase: {instance.item.name}",
-                amount=total_cost,
-                currency=instance.currency,
-                exchange_rate=instance.exchange_rate,
-                amount_in_default_currency=instance.purchase_price_in_default_currency * instance.quantity,
-                date_trans=instance.purchase_date,
-                trans_type=Transaction.TransactionType.EXPENSE,
-                cashregister=instance.cashregister,
-                salon=instance.salon
-            )
+@receiver(pre_delete, sender=ItemPurchase)
+def invalidate_salon_purchase_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard({instance.salon_id}, ['finance', 'balances', 'stock'])
+
+@receiver(pre_delete, sender=ItemPurchase)
+def reverse_purchase_stock(sender, instance, origin=None, **kwargs):
+    if not deleted_with_item(origin):
+        sync_stock(instance, 'purchase', None)
+    if deleted_with_source(origin, instance):
+        LedgerService.reverse(instance)
+
+@receiver(pre_delete, sender=ItemUsed)
+def reverse_used_stock(sender, instance, origin=None, **kwargs):
+    if not deleted_with_item(origin):
+        sync_stock(instance, 'item_used', None)
 
 def get_total_inventory_value(salon):
     return salon.items.annotate(
@@ -0,0 +1,175 @@
+''' Inventory valuation and consumption forecasts computed over whole salons with NumPy '''
+
+import uuid
+from datetime import timedelta
+import numpy as np
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import FloatField
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+REPORT_VERSION_KEY = 'salooninventory:report_version:{salon_id}'
+REPORT_KEY = 'salooninventory:report:{salon_id}:{version}:{day}:{window_days}:{lead_time_days}'
+REPORT_TIMEOUT = 60 * 60
+# Safety stock covers demand up to this many standard deviations (~95%)
+SAFETY_FACTOR = 1.65
+
+class AsFloat(Cast):
+    """
+    Read a decimal column as a float. The database drivers already return
+    floats, so the per-row Python converters (which dominate the loading of
+    large reports) are skipped.
+    """
+    def __init__(self, expression):
+        super().__init__(expression, FloatField())
+
+    def get_db_converters(self, connection):
+        return []
+
+def column(values, dtype):
+    return np.array(values, dtype=dtype) if values else np.zeros(0, dtype=dtype)
+
+def group_cumsum(groups, values):
+    """
+    Running total of ``values`` restarting at every change of the (sorted)
+    ``groups``.
+    """
+    totals = np.cumsum(values)
+    if not len(values):
+        return totals
+    starts = np.flatnonzero(np.r_[True, groups[1:] != groups[:-1]])
+    lengths = np.diff(np.r_[starts, len(values)])
+    return totals - np.repeat(totals[starts] - values[starts], lengths)
+
+def fifo_values(stock, average_cost, layer_items, layer_quantities, layer_costs):
+    """
+    Value of each item's stock under FIFO: what is left is the newest
+    purchases, so the layers (sorted by item, newest first) are consumed
+    from the top until the stock is covered. Stock older than every layer
+    is valued at the average cost.
+    """
+    before = group_cumsum(layer_items, layer_quantities) - layer_quantities
+    taken = np.clip(stock[layer_items] - before, 0, layer_quantities)
+    values = np.bincount(layer_items, weights=taken * layer_costs, minlength=len(stock))
+    covered = np.bincount(layer_items, weights=taken, minlength=len(stock))
+    return values + np.maximum(stock - covered, 0) * average_cost
+
+class InventoryReport:
+    """
+    Valuation, consumption and reorder points of every item of a salon. The
+    items, purchase layers and recent uses are read with three queries
+    and everything else is array arithmetic.
+    """
+    def __init__(self, salon_id, window_days=90, lead_time_days=7, today=None):
+        self.salon_id = salon_id
+        self.window_days = window_days
+        self.lead_time_days = lead_time_days
+        self.today = today or timezone.localdate()
+
+    def load(self):
+        Item = apps.get_model('salooninventory', 'Item')
+        ItemPurchase = apps.get_model('salooninventory', 'ItemPurchase')
+        StockMovement = apps.get_model('salooninventory', 'StockMovement')
+
+        items = list(Item.objects.filter(salon_id=self.salon_id).order_by('pk').values_list(
+            'pk', 'name', 'current_stock', AsFloat('average_cost'), AsFloat('amount_in_default_currency')
+        ))
+        purchases = list(ItemPurchase.objects.filter(salon_id=self.salon_id).order_by('item_id', '-purchase_date', '-pk').values_list(
+            'item_id', 'quantity', AsFloat('purchase_price_in_default_currency')
+        ))
+        # Uses and their reversals are the movements without a cost
+        first_day = self.today - timedelta(days=self.window_days - 1)
+        uses = list(StockMovement.objects.filter(
+            salon_id=self.salon_id, unit_cost__isnull=True, date__range=(first_day, self.today),
+            kind__in=[StockMovement.Kind.USE, StockMovement.Kind.REVERSAL],
+        ).values_list('item_id', 'date', 'quantity'))
+        return items, purchases, uses, first_day
+
+    def compute(self):
+        items, purchases, uses, first_day = self.load()
+        ids, names, stock, average_cost, price = (list(values) for values in zip(*items)) if items else ([], [], [], [], [])
+        ids = column(ids, np.int64)
+        stock = column(stock, float)
+        average_cost = column(average_cost, float)
+        price = column(price, float)
+
+        layer_ids, layer_quantities, layer_costs = zip(*purchases) if purchases else ((), (), ())
+        fifo = fifo_values(
+            stock, average_cost, np.searchsorted(ids, column(layer_ids, np.int64)),
+            column(layer_quantities, float), column(layer_costs, float),
+        )
+        average_value = stock * average_cost
+
+        daily = np.zeros((len(ids), self.window_days))
+        if uses:
+            use_ids, use_dates, use_quantities = zip(*uses)
+            days = (column(use_dates, 'datetime64[D]') - np.datetime64(first_day, 'D')).astype(np.int64)
+            np.add.at(daily, (np.searchsorted(ids, column(use_ids, np.int64)), days), -column(use_quantities, float))
+        rate = daily.mean(axis=1)
+        deviation = daily.std(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            days_left = np.where(rate > 0, stock / rate, np.inf)
+        reorder_point = np.ceil(rate * self.lead_time_days + SAFETY_FACTOR * deviation * np.sqrt(self.lead_time_days))
+        to_reorder = (rate > 0) & (stock <= reorder_point)
+
+        rows = zip(
+            ids.tolist(), names, stock.astype(np.int64).tolist(), average_cost.round(6).tolist(),
+            fifo.round(2).tolist(), average_value.round(2).tolist(), rate.round(4).tolist(),
+            deviation.round(4).tolist(), days_left.round(1).tolist(), reorder_point.astype(np.int64).tolist(),
+            to_reorder.tolist(),
+        )
+        return {
+            'salon': self.salon_id,
+            'date': self.today.isoformat(),
+            'window_days': self.window_days,
+            'lead_time_days': self.lead_time_days,
+            'totals': {
+                'fifo_value': round(float(fifo.sum()), 2),
+                'average_cost_value': round(float(average_value.sum()), 2),
+                'retail_value': round(float((stock * price).sum()), 2),
+                'items_to_reorder': int(to_reorder.sum()),
+            },
+            'items': [
+                {
+                    'id': pk, 'name': name, 'current_stock': current, 'average_cost': cost,
+                    'fifo_value': fifo_value, 'average_cost_value': average_cost_value,
+                    'daily_consumption': daily_rate, 'consumption_deviation': daily_deviation,
+                    'days_of_stock': None if days == float('inf') else days,
+                    'reorder_point': point, 'needs_reorder': reorder,
+                }
+                for pk, name, current, cost, fifo_value, average_cost_value, daily_rate, daily_deviation, days, point, reorder in rows
+            ],
+        }
+
+def report_version(salon_id):
+    key = REPORT_VERSION_KEY.format(salon_id=salon_id)
+    version = cache.get(key)
+    if version is None:
+        version = uuid.uuid4().hex
+        cache.set(key, version, None)
+    return version
+
+def get_inventory_report(salon_id, window_days=90, lead_time_days=7):
+    """
+    Return the report of a salon from the cache, computing it on a miss.
+    Cached reports are dropped by ``invalidate_inventory_report`` whenever
+    the salon's stock or items change.
+    """
+    today = timezone.localdate()
+    key = REPORT_KEY.format(
+        salon_id=salon_id, version=report_version(salon_id), day=today.isoformat(),
+        window_days=window_days, lead_time_days=lead_time_days,
+    )
+    report = cache.get(key)
+    if report is None:
+        report = InventoryReport(salon_id, window_days, lead_time_days, today).compute()
+        cache.set(key, report, REPORT_TIMEOUT)
+    return report
+
+def invalidate_inventory_report(salon_ids):
+    def invalidate():
+        cache.delete_many([REPORT_VERSION_KEY.format(salon_id=salon_id) for salon_id in salon_ids])
+    invalidate()
+    transaction.on_commit(invalidate)
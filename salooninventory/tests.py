@@ -1,3 +1,245 @@
+import csv
+import os
+import tempfile
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+import numpy as np
+from decimal import Decimal
+from io import StringIO
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command, CommandError
+from django.db import IntegrityError
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIRequestFactory, force_authenticate
+from accounts.models import CustomUser
+from saloon.models import Salon, Client, Barber, BarberType
+from saloonfinance.models import Currency, CashRegister, Transaction, DailyFinanceRollup
+from api.salooninventory.serializers import ItemSerializer
+from api.salooninventory.views import SalonDataImportView, InventoryReportView
+from saloonservices.models import Hairstyle, Shave
+from .imports import ItemPurchaseImporter
+from .ledger import rebuild_stock_ledger
+from .reports import InventoryReport, fifo_values
+from .models import Item, ItemPurchase, ItemUsed, StockMovement
 
-# Create your tests here.
+class ImportTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        self.currency = Currency.objects.get(pk=Currency.get_default())
+        self.cashregister = CashRegister.objects.create(name='Front desk', currency=self.currency, salon=self.salon)
+        self.comb = Item.objects.create(name='Comb', price=Decimal('2.50'), salon=self.salon)
+        self.wax = Item.objects.create(name='Wax', price=Decimal('4.00'), salon=self.salon)
+
+    def purchase_lines(self, count):
+        lines = ['item,quantity,purchase_price,purchase_date,supplier,cashregister']
+        for i in range(count):
+            lines.append(f"{'Comb' if i % 2 else 'Wax'},2,1.50,2024-03-0{1 + i % 3},Acme,Front desk")
+        return lines
+
+class ItemPurchaseImportTests(ImportTestMixin, TestCase):
+    def test_import_aggregates_stock_balance_and_ledger(self):
+        with self.assertNumQueries(36):
+            report = ItemPurchaseImporter(self.salon, chunk_size=500).run(self.purchase_lines(60))
+        self.assertEqual(report.created, 60)
+        self.assertEqual(ItemPurchase.objects.count(), 60)
+        self.assertEqual(list(Item.objects.order_by('name').values_list('current_stock', flat=True)), [60, 60])
+        self.assertEqual([self.comb.stock_on(date(2024, 3, day)) for day in (1, 2, 3)], [20, 40, 60])
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.Kind.PURCHASE).count(), 60)
+        self.assertEqual(Transaction.objects.filter(trans_type=Transaction.TransactionType.EXPENSE).count(), 60)
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal('-180.00'))
+        self.assertEqual(self.cashregister.get_total_expenses(), Decimal('180.00'))
+        self.assertEqual(DailyFinanceRollup.objects.get(date='2024-03-01').count, 20)
+
+    def test_invalid_line_rejects_the_whole_file(self):
+        lines = self.purchase_lines(3) + ['Brush,1,1.00,2024-03-01,,Front desk', 'Wax,0,1.00,2024-03-01,,Front desk']
+        with self.assertRaises(ValidationError) as context:
+            ItemPurchaseImporter(self.salon).run(lines)
+        self.assertEqual(sorted(context.exception.message_dict), [5, 6])
+        self.assertFalse(ItemPurchase.objects.exists())
+
+    def test_database_error_rolls_back_earlier_chunks(self):
+        class FailingImporter(ItemPurchaseImporter):
+            def write(self, objects):
+                if ItemPurchase.objects.exists():
+                    raise IntegrityError("second chunk")
+                super().write(objects)
+
+        with self.assertRaises(IntegrityError):
+            FailingImporter(self.salon, chunk_size=2).run(self.purchase_lines(4))
+        self.assertFalse(ItemPurchase.objects.exists())
+        self.assertFalse(Transaction.objects.exists())
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal('0.00'))
+
+class ImportCommandTests(ImportTestMixin, TestCase):
+    def test_command_imports_clients_and_reports_progress(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('name,phone\nAda,+243999999999\nGrace,\n')
+        self.addCleanup(os.remove, csv_file.name)
+        stdout = StringIO()
+        call_command('import_salon_data', 'clients', csv_file.name, salon=self.salon.pk, chunk_size=1, stdout=stdout)
+        self.assertEqual(list(Client.objects.filter(salon=self.salon).order_by('name').values_list('name', flat=True)), ['Ada', 'Grace'])
+        self.assertIn('2/2 clients', stdout.getvalue())
+
+    def test_command_rejects_a_file_that_is_not_utf8(self):
+        with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as csv_file:
+            csv_file.write('name\nJosé\n'.encode('latin-1'))
+        self.addCleanup(os.remove, csv_file.name)
+        stderr = StringIO()
+        with self.assertRaisesMessage(CommandError, "Nothing was imported."):
+            call_command('import_salon_data', 'clients', csv_file.name, salon=self.salon.pk, stderr=stderr)
+        self.assertIn('not UTF-8', stderr.getvalue())
+        self.assertFalse(Client.objects.filter(salon=self.salon).exists())
+
+class ImportEndpointTests(ImportTestMixin, TestCase):
+    def post(self, kind, content, salon, encoding='utf-8'):
+        upload = SimpleUploadedFile('import.csv', content.encode(encoding), content_type='text/csv')
+        request = APIRequestFactory().post(f'/import/{kind}/', {'salon': salon.pk, 'file': upload}, format='multipart')
+        force_authenticate(request, user=self.owner)
+        return SalonDataImportView.as_view()(request, kind=kind)
+
+    def test_upload_imports_items_for_an_owned_salon(self):
+        response = self.post('items', 'name,price\nScissors,12.00\n', self.salon)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data['created'], 1)
+        self.assertEqual(Item.objects.get(name='Scissors').amount_in_default_currency, Decimal('12.00'))
+
+        response = self.post('items', 'name,price\nComb,1.00\n', self.salon)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn(2, response.data)
+
+        other_salon = Salon.objects.create(name='Other salon', owner=CustomUser.objects.create_user(email='other@example.com', password='secret'))
+        self.assertEqual(self.post('items', 'name,price\nRazor,3.00\n', other_salon).status_code, 400)
+
+    def test_unreadable_upload_is_rejected(self):
+        response = self.post('clients', 'name\nJosé\n', self.salon, encoding='latin-1')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('file', response.data)
+
+        response = self.post('clients', 'name\n"' + 'x' * (csv.field_size_limit() + 1) + '"\n', self.salon)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not a valid CSV', response.data['file'][0])
+        self.assertFalse(Client.objects.filter(salon=self.salon).exists())
+
+class StockTestMixin(ImportTestMixin):
+    def purchase(self, quantity, price, purchase_date):
+        return ItemPurchase.objects.create(
+            item=self.comb, quantity=quantity, purchase_price=Decimal(price), purchase_date=purchase_date,
+            cashregister=self.cashregister, salon=self.salon,
+        )
+
+    def use(self, quantity):
+        barber_type = BarberType.objects.create(name='Senior', salon=self.salon)
+        barber = Barber.objects.create(
+            user=CustomUser.objects.create_user(email='barber@example.com', password='secret'),
+            salon=self.salon, barber_type=barber_type, start_date=date(2024, 1, 1),
+        )
+        hairstyle = Hairstyle.objects.create(name='Fade', current_tariff=Decimal('10.00'), salon=self.salon)
+        shave = Shave.objects.create(
+            barber=barber, hairstyle=hairstyle, amount=Decimal('10.00'), cashregister=self.cashregister, salon=self.salon,
+            date_shave=datetime(2024, 3, 5, 10, tzinfo=dt_timezone.utc), status=Shave.Status.COMPLETED,
+        )
+        return ItemUsed.objects.create(item=self.comb, shave=shave, barber=barber, quantity=quantity, salon=self.salon)
+
+class StockLedgerTests(StockTestMixin, TestCase):
+
+    def test_purchases_maintain_stock_average_cost_and_snapshots(self):
+        first = self.purchase(10, '2.00', date(2024, 3, 1))
+        self.purchase(10, '4.00', date(2024, 3, 10))
+        self.comb.refresh_from_db()
+        self.assertEqual(self.comb.current_stock, 20)
+        self.assertEqual(self.comb.average_cost, Decimal('3.00'))
+        self.assertEqual(ItemSerializer(self.comb).data['average_purchase_price'], '3.00')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.comb.stock_on(date(2024, 3, 9)), 10)
+        self.assertEqual(self.comb.stock_on(date(2024, 2, 28)), 0)
+
+        # A backdated purchase moves every later day
+        self.purchase(5, '3.00', date(2024, 2, 1))
+        self.assertEqual([self.comb.stock_on(day) for day in (date(2024, 2, 1), date(2024, 3, 1), date(2024, 3, 10))], [5, 15, 25])
+
+        first.delete()
+        self.comb.refresh_from_db()
+        self.assertEqual(self.comb.current_stock, 15)
+        self.assertEqual(self.comb.average_cost, Decimal('3.666667'))
+        self.assertEqual(self.comb.stock_on(date(2024, 3, 1)), 5)
+        self.assertEqual(StockMovement.objects.filter(kind=StockMovement.Kind.REVERSAL).count(), 1)
+
+    def test_uses_consume_stock_and_deletes_restore_it(self):
+        self.purchase(10, '2.00', date(2024, 3, 1))
+        item_used = self.use(4)
+        self.assertEqual(item_used.item.current_stock, 6)
+        self.assertEqual(self.comb.stock_on(date(2024, 3, 5)), 6)
+
+        item_used.quantity = 3
+        item_used.save()
+        self.assertEqual(item_used.item.current_stock, 7)
+        item_used.shave.delete()
+        self.comb.refresh_from_db()
+        self.assertEqual(self.comb.current_stock, 10)
+        self.assertEqual(self.comb.average_cost, Decimal('2.00'))
+        self.assertEqual(StockMovement.objects.filter(item=self.comb).count(), 5)
+
+    def test_rebuild_matches_the_incremental_ledger(self):
+        self.purchase(10, '2.00', date(2024, 3, 1))
+        self.purchase(6, '5.00', date(2024, 3, 8))
+        self.use(4)
+        snapshots = list(self.comb.stock_snapshots.order_by('date').values_list('date', 'balance'))
+        self.comb.refresh_from_db()
+        average_cost = self.comb.average_cost
+        rebuild_stock_ledger(salon_ids=[self.salon.pk])
+        self.comb.refresh_from_db()
+        self.assertEqual(self.comb.current_stock, 12)
+        self.assertEqual(self.comb.average_cost, average_cost)
+        self.assertEqual(list(self.comb.stock_snapshots.order_by('date').values_list('date', 'balance')), snapshots)
+
+class InventoryReportTests(StockTestMixin, TestCase):
+    def test_fifo_values_take_the_newest_layers(self):
+        stock = np.array([15.0, 4.0, 0.0])
+        average_cost = np.array([3.0, 2.0, 1.0])
+        # Item 0: 10 @ 4 (newest), 10 @ 2; item 1: 2 @ 1 only
+        values = fifo_values(stock, average_cost, np.array([0, 0, 1]), np.array([10.0, 10.0, 2.0]), np.array([4.0, 2.0, 1.0]))
+        self.assertEqual(values.tolist(), [50.0, 6.0, 0.0])
+
+    def test_report_values_and_forecasts_every_item(self):
+        today = timezone.localdate()
+        self.purchase(10, '2.00', today - timedelta(days=20))
+        self.purchase(10, '4.00', today - timedelta(days=10))
+        item_used = self.use(6)
+        item_used.shave.date_shave = timezone.now() - timedelta(days=1)
+        item_used.shave.save()
+        rebuild_stock_ledger(salon_ids=[self.salon.pk])
+
+        with self.assertNumQueries(3):
+            report = InventoryReport(self.salon.pk, window_days=30, lead_time_days=7).compute()
+        comb, wax = report['items']
+        self.assertEqual((comb['name'], comb['current_stock']), ('Comb', 14))
+        self.assertEqual(comb['fifo_value'], 48.0)
+        self.assertEqual(comb['average_cost_value'], 42.0)
+        self.assertEqual(comb['daily_consumption'], 0.2)
+        self.assertEqual(comb['days_of_stock'], 70.0)
+        self.assertFalse(comb['needs_reorder'])
+        self.assertEqual((wax['current_stock'], wax['days_of_stock'], wax['needs_reorder']), (0, None, False))
+        self.assertEqual(report['totals']['fifo_value'], 48.0)
+
+    def get_report(self, **params):
+        request = APIRequestFactory().get('/reports/inventory/', params)
+        force_authenticate(request, user=self.owner)
+        return InventoryReportView.as_view()(request)
+
+    def test_endpoint_caches_until_the_stock_moves(self):
+        self.purchase(10, '2.00', timezone.localdate())
+        self.assertEqual(self.get_report(salon=self.salon.pk).data['totals']['fifo_value'], 20.0)
+        with self.assertNumQueries(0):
+            self.get_report(salon=self.salon.pk)
+        self.purchase(5, '4.00', timezone.localdate())
+        self.assertEqual(self.get_report(salon=self.salon.pk).data['totals']['fifo_value'], 40.0)
+
+        self.assertEqual(self.get_report(salon=self.salon.pk, window='0').status_code, 400)
+        other_salon = Salon.objects.create(name='Other salon', owner=CustomUser.objects.create_user(email='other@example.com', password='secret'))
+        self.assertEqual(self.get_report(salon=other_salon.pk).status_code, 400)
@@ -1,4 +1,5 @@
 from django.contrib import admin
+from saloon.ownership import get_salon_ownership
 from .models import HairstyleTariffHistory, Hairstyle, Shave
 
 class HairstyleTariffHistoryInline(admin.TabularInline):
@@ -6,7 +7,7 @@ class HairstyleTariffHistoryInline(admin.TabularInline):
     extra = 1
 
 class HairstyleAdmin(admin.ModelAdmin):
-    list_display = ('name', 'current_tariff', 'currency', 'salon')
+    list_display = ('name', 'current_tariff', 'duration', 'currency', 'salon')
     list_filter = ('salon', 'currency')
     search_fields = ('name', 'salon__name')
     inlines = [HairstyleTariffHistoryInline]
@@ -15,20 +16,20 @@ class HairstyleAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Hairstyle, HairstyleAdmin)
 
@@ -41,19 +42,19 @@ class ShaveAdmin(admin.ModelAdmin):
         qs = super().get_queryset(request)
         if request.user.is_superuser:
             return qs
-        return qs.filter(salon__owner=request.user)
+        return qs.filter(salon_id__in=get_salon_ownership(request).salon_ids)
 
     def has_add_permission(self, request):
-        return request.user.is_superuser or request.user.owned_salons.exists()
+        return request.user.is_superuser or get_salon_ownership(request).has_salon()
 
     def has_change_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
     def has_delete_permission(self, request, obj=None):
         if obj is None:
             return True
-        return obj.salon.owner == request.user or request.user.is_superuser
+        return get_salon_ownership(request).owns_object(obj) or request.user.is_superuser
 
 admin.site.register(Shave, ShaveAdmin)
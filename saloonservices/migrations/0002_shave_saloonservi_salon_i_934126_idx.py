@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+        ('saloonfinance', '0003_transaction_saloonfinan_salon_i_63652b_idx_and_more'),
+        ('saloonservices', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(fields=['salon', 'status', 'date_shave'], name='saloonservi_salon_i_934126_idx'),
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:46
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloonservices', '0002_shave_saloonservi_salon_i_934126_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='hairstyletariffhistory',
+            index=models.Index(fields=['hairstyle', 'effective_date'], name='saloonservi_hairsty_719dec_idx'),
+        ),
+    ]
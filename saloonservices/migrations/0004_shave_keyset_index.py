@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0003_remove_barber_permissions_and_more'),
+        ('saloonfinance', '0004_payment_saloonfinan_salon_i_960602_idx_and_more'),
+        ('saloonservices', '0003_hairstyletariffhistory_saloonservi_hairsty_719dec_idx'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(fields=['salon', 'date_shave', 'id'], name='saloonservi_salon_i_88bf0c_idx'),
+        ),
+    ]
@@ -0,0 +1,14 @@
+from django.db import migrations
+from saloon.search import CreateSearchIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloon', '0004_search_index'),
+        ('saloonservices', '0004_shave_keyset_index'),
+    ]
+
+    operations = [
+        CreateSearchIndex('Hairstyle', ['name'], scope='salon_id'),
+    ]
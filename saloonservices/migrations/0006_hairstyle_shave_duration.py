@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:24
+
+import django.core.validators
+from django.db import migrations, models
+from saloon.search import RebuildSearchIndex
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('saloonservices', '0005_hairstyle_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='hairstyle',
+            name='duration',
+            field=models.PositiveSmallIntegerField(default=30, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Duration (minutes)'),
+        ),
+        # Adding the column rebuilds the table on SQLite, dropping its search triggers
+        RebuildSearchIndex('Hairstyle', ['name'], scope='salon_id'),
+        migrations.AddField(
+            model_name='shave',
+            name='duration',
+            field=models.PositiveSmallIntegerField(blank=True, help_text="Defaults to the hairstyle's duration.", null=True, validators=[django.core.validators.MinValueValidator(1)], verbose_name='Duration (minutes)'),
+        ),
+        migrations.AddIndex(
+            model_name='shave',
+            index=models.Index(fields=['barber', 'date_shave'], name='saloonservi_barber__cc552e_idx'),
+        ),
+    ]
@@ -1,13 +1,26 @@
 ''' Models for the saloonservices app '''
 
+from datetime import timedelta
+from decimal import Decimal
+from django.apps import apps
 from django.db import models, transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
 from django.utils.translation import gettext_lazy as _
 from django.utils import timezone
-from django.db.models.signals import post_save, pre_delete
+from django.db.models.signals import post_save, pre_save, pre_delete, post_delete
 from django.dispatch import receiver
 from django.core.exceptions import ValidationError
-from saloon.models import Salon, Barber, Client, TimestampMixin
-from saloonfinance.models import CashRegister, Currency, Transaction
+from django.core.validators import MinValueValidator
+from saloon.dashboard import invalidate_dashboard
+from saloon.reference import invalidate_reference_on_commit
+from saloon.models import Salon, Barber, Client, TimestampMixin, SalonHistoryQuerySet
+from saloonfinance.models import CashRegister, Currency, Transaction, DailyFinanceRollup
+from saloonfinance.ledger import LedgerService, deleted_with_source
+from saloonfinance.rates import convert
+from saloonfinance.rollups import to_rollup_date, shave_entry, remember_rollup_entry, ensure_rollup_entry, update_rollup, remove_rollup
+from .scheduling import BUSY_STATUSES, Bookings, check_booking
+from .tariffs import get_tariff_timeline, invalidate_tariff_timeline
 
 class HairstyleTariffHistory(TimestampMixin):
     hairstyle = models.ForeignKey('Hairstyle', on_delete=models.CASCADE, related_name='tariff_history', verbose_name=_("Hairstyle"))
@@ -18,6 +31,9 @@ class HairstyleTariffHistory(TimestampMixin):
         verbose_name = _("Hairstyle Tariff History")
         verbose_name_plural = _("Hairstyle Tariff Histories")
         ordering = ['-effective_date']
+        indexes = [
+            models.Index(fields=['hairstyle', 'effective_date']),
+        ]
 
     def __str__(self):
         return f"{self.hairstyle.name} - {self.tariff} - {self.effective_date}"
@@ -28,6 +44,7 @@ class Hairstyle(TimestampMixin):
     currency = models.ForeignKey(Currency, on_delete=models.PROTECT, default=Currency.get_default, verbose_name=_("Currency"))
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='hairstyles', verbose_name=_("Salon"))
     image = models.ImageField(_("Image"), upload_to='hairstyles/', null=True, blank=True)
+    duration = models.PositiveSmallIntegerField(_("Duration (minutes)"), default=30, validators=[MinValueValidator(1)])
 
     def __str__(self):
         return f"{self.name} - {self.salon.name}"
@@ -47,14 +64,109 @@ class Hairstyle(TimestampMixin):
             )
 
     def get_tariff_at_date(self, date):
-        tariff_history = self.tariff_history.filter(effective_date__lte=date).order_by('-effective_date').first()
-        return tariff_history.tariff if tariff_history else self.current_tariff
+        return get_tariff_timeline(self.salon_id).tariff_at(self.pk, date, default=self.current_tariff)
 
     class Meta:
         verbose_name = _("Hairstyle")
         verbose_name_plural = _("Hairstyles")
         unique_together = ['name', 'salon']
 
+class ShaveQuerySet(SalonHistoryQuerySet):
+    date_field = 'date_shave'
+
+    def with_status(self, status):
+        return self.filter(status=status)
+
+    def completed(self):
+        return self.with_status(Shave.Status.COMPLETED)
+
+    def annotate_tariff_at_shave_date(self):
+        tariff = HairstyleTariffHistory.objects.filter(
+            hairstyle=OuterRef('hairstyle'), effective_date__lte=OuterRef('date_shave')
+        ).order_by('-effective_date', '-id').values('tariff')[:1]
+        return self.annotate(tariff_at_shave_date=Coalesce(Subquery(tariff), F('hairstyle__current_tariff')))
+
+    def with_totals(self):
+        ItemUsed = apps.get_model('salooninventory', 'ItemUsed')
+        items_total = ItemUsed.objects.filter(shave=OuterRef('pk')).order_by().values('shave').annotate(
+            total=Sum(F('item__price') * F('quantity'), output_field=models.DecimalField(max_digits=19, decimal_places=2))
+        ).values('total')
+        return self.annotate(items_total=Coalesce(
+            Subquery(items_total), Value(Decimal('0.00')), output_field=models.DecimalField(max_digits=19, decimal_places=2)
+        ))
+
+    def bulk_record(self, shaves, batch_size=500):
+        """
+        Validate and record a batch of shaves with a constant number of queries.
+        The whole batch is validated before anything is written; errors are
+        raised as a ValidationError keyed by the position of the shave in the batch.
+        Completed shaves get their income transaction, posted with a single
+        balance update per cash register, all inside one atomic block.
+        """
+        shaves = list(shaves)
+        if not shaves:
+            return []
+        related = {
+            'salon': Salon.objects.in_bulk({shave.salon_id for shave in shaves}),
+            'barber': Barber.objects.in_bulk({shave.barber_id for shave in shaves}),
+            'hairstyle': Hairstyle.objects.in_bulk({shave.hairstyle_id for shave in shaves}),
+            'cashregister': CashRegister.objects.in_bulk({shave.cashregister_id for shave in shaves}),
+            'currency': Currency.objects.in_bulk({shave.currency_id for shave in shaves}),
+            'client': Client.objects.in_bulk({shave.client_id for shave in shaves if shave.client_id is not None}),
+        }
+        default_currency_id = Currency.get_default()
+        errors = {}
+        for index, shave in enumerate(shaves):
+            try:
+                for field_name, objects in related.items():
+                    value = getattr(shave, f'{field_name}_id')
+                    if value is None and field_name == 'client':
+                        continue
+                    if value not in objects:
+                        raise ValidationError({field_name: _("Select a valid choice.")})
+                    setattr(shave, field_name, objects[value])
+                if shave.client_id is not None and shave.client.salon_id != shave.salon_id:
+                    raise ValidationError({'client': _("Client must belong to the same salon as the shave.")})
+                shave.set_amount_in_default_currency(default_currency_id)
+                shave.clean_fields(exclude=[*related, 'amount_in_default_currency'])
+            except ValidationError as e:
+                errors[index] = e.messages
+        valid = [(index, shave) for index, shave in enumerate(shaves) if index not in errors]
+        scheduled = [shave for index, shave in valid if shave.status == Shave.Status.SCHEDULED]
+        if scheduled:
+            # Bookings are checked against the stored ones of the same days and
+            # every busy shave of the batch, whatever its position in it
+            bookings = Bookings.load(
+                {shave.barber_id for shave in scheduled},
+                min(to_rollup_date(shave.date_shave) for shave in scheduled),
+                max(to_rollup_date(shave.end) for shave in scheduled),
+                unsaved=[(shave.barber_id, shave.date_shave, shave.end, ('batch', index)) for index, shave in valid if shave.status in BUSY_STATUSES],
+            )
+            for index, shave in valid:
+                shave._bookings, shave._booking_key = bookings, ('batch', index)
+        for index, shave in valid:
+            try:
+                shave.clean()
+            except ValidationError as e:
+                errors[index] = e.messages
+            finally:
+                shave.__dict__.pop('_bookings', None)
+                shave.__dict__.pop('_booking_key', None)
+        if errors:
+            raise ValidationError(errors)
+
+        with transaction.atomic():
+            shaves = self.bulk_create(shaves, batch_size=batch_size)
+            ledger = LedgerService()
+            ledger.post_new(shaves)
+            for shave in shaves:
+                ledger.rollups.add(shave_entry(shave))
+            ledger.apply()
+        for shave in shaves:
+            shave._rollup_entry = shave_entry(shave)
+        invalidate_dashboard({shave.salon_id for shave in shaves}, ['finance', 'balances', 'hairstyles'])
+        return shaves
+
 class Shave(TimestampMixin):
     class Status(models.TextChoices):
         SCHEDULED = 'SCHEDULED', _('Scheduled')
@@ -73,76 +185,147 @@ class Shave(TimestampMixin):
     date_shave = models.DateTimeField(_("Shave date"), default=timezone.now)
     salon = models.ForeignKey(Salon, on_delete=models.CASCADE, related_name='shaves', verbose_name=_("Salon"))
     status = models.CharField(_("Status"), max_length=20, choices=Status.choices, default=Status.SCHEDULED)
+    duration = models.PositiveSmallIntegerField(
+        _("Duration (minutes)"), null=True, blank=True, validators=[MinValueValidator(1)],
+        help_text=_("Defaults to the hairstyle's duration."),
+    )
+
+    objects = ShaveQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.barber} - {self.hairstyle} - {self.date_shave}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        return remember_rollup_entry(super().from_db(db, field_names, values), shave_entry)
+
     def clean(self):
         if self.amount < 0:
             raise ValidationError(_("Amount cannot be negative."))
-        if self.barber.salon != self.salon:
+        if self.barber.salon_id != self.salon_id:
             raise ValidationError(_("Barber must belong to the same salon as the shave."))
-        if self.hairstyle.salon != self.salon:
+        if self.hairstyle.salon_id != self.salon_id:
             raise ValidationError(_("Hairstyle must belong to the same salon as the shave."))
-        if self.cashregister.salon != self.salon:
+        if self.cashregister.salon_id != self.salon_id:
             raise ValidationError(_("Cash register must belong to the same salon as the shave."))
+        if self.status == Shave.Status.SCHEDULED:
+            check_booking(
+                self.barber, self.date_shave, self.minutes, exclude=getattr(self, '_booking_key', self.pk),
+                bookings=getattr(self, '_bookings', None),
+            )
 
     def save(self, *args, **kwargs):
-        if self.currency != Currency.get_default():
-            self.amount_in_default_currency = self.amount / self.exchange_rate
-        else:
-            self.amount_in_default_currency = self.amount
-        super().save(*args, **kwargs)
+        self.set_amount_in_default_currency(Currency.get_default())
+        created = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            LedgerService.post(self, created=created)
+
+    def set_amount_in_default_currency(self, default_currency_id):
+        self.amount_in_default_currency, self.exchange_rate = convert(
+            self.amount, self.currency_id, self.date_shave, self.exchange_rate, default_currency_id
+        )
+
+    @property
+    def minutes(self):
+        return self.duration or self.hairstyle.duration
+
+    @property
+    def end(self):
+        return self.date_shave + timedelta(minutes=self.minutes)
+
+    def get_transaction_name(self):
+        return f"Shave: {self.hairstyle.name} #{self.pk}"
+
+    def build_transaction(self):
+        # Only completed shaves are paid for
+        if self.status != Shave.Status.COMPLETED:
+            return None
+        return Transaction(
+            trans_name=self.get_transaction_name(),
+            amount=self.amount,
+            currency_id=self.currency_id,
+            exchange_rate=self.exchange_rate,
+            amount_in_default_currency=self.amount_in_default_currency,
+            date_trans=to_rollup_date(self.date_shave),
+            trans_type=Transaction.TransactionType.INCOME,
+            cashregister_id=self.cashregister_id,
+            salon_id=self.salon_id,
+            shave=self,
+        )
 
     @property
     def total_amount(self):
-        return self.amount + sum(item_used.item.price * item_used.quantity for item_used in self.items_used.all())
+        if hasattr(self, 'items_total'):
+            return self.amount + self.items_total
+        if 'items_used' in getattr(self, '_prefetched_objects_cache', {}):
+            return self.amount + sum(item_used.item.price * item_used.quantity for item_used in self.items_used.all())
+        items_total = self.items_used.aggregate(
+            total=Sum(F('item__price') * F('quantity'), output_field=models.DecimalField(max_digits=19, decimal_places=2))
+        )['total']
+        return self.amount + (items_total or Decimal('0.00'))
 
     @property
     def tariff_difference(self):
-        tariff_at_shave_date = self.hairstyle.get_tariff_at_date(self.date_shave)
-        return self.amount - tariff_at_shave_date
+        if hasattr(self, 'tariff_at_shave_date'):
+            return self.amount - self.tariff_at_shave_date
+        return self.amount - self.hairstyle.get_tariff_at_date(self.date_shave)
 
     @classmethod
     def get_total_revenue(cls, salon, start_date=None, end_date=None):
-        queryset = cls.objects.filter(salon=salon, status=cls.Status.COMPLETED)
+        """
+        Revenue of completed shaves read from the daily rollups; bounds are
+        applied per day.
+        """
+        queryset = DailyFinanceRollup.objects.filter(salon=salon, trans_type=DailyFinanceRollup.RollupType.SHAVE)
         if start_date:
-            queryset = queryset.filter(date_shave__gte=start_date)
+            queryset = queryset.filter(date__gte=to_rollup_date(start_date))
         if end_date:
-            queryset = queryset.filter(date_shave__lte=end_date)
+            queryset = queryset.filter(date__lte=to_rollup_date(end_date))
         return queryset.aggregate(total_revenue=models.Sum('amount_in_default_currency'))['total_revenue'] or 0
 
     class Meta:
         verbose_name = _("Shave")
         verbose_name_plural = _("Shaves")
+        indexes = [
+            models.Index(fields=['salon', 'status', 'date_shave']),
+            models.Index(fields=['salon', 'date_shave', 'id']),
+            # A barber's bookings of a day, for conflict checks and availability
+            models.Index(fields=['barber', 'date_shave']),
+        ]
+
+@receiver(post_save, sender=HairstyleTariffHistory)
+@receiver(post_delete, sender=HairstyleTariffHistory)
+def invalidate_hairstyle_tariffs(sender, instance, **kwargs):
+    salon_id = instance.hairstyle.salon_id
+    invalidate_tariff_timeline(salon_id)
+    transaction.on_commit(lambda: invalidate_tariff_timeline(salon_id))
+
+@receiver(pre_save, sender=Shave)
+def load_shave_rollup(sender, instance, **kwargs):
+    ensure_rollup_entry(instance, shave_entry)
 
-# Signals to update CashRegister balance
 @receiver(post_save, sender=Shave)
-def update_cashregister_balance(sender, instance, created, **kwargs):
-    if created and instance.status == Shave.Status.COMPLETED:
-        with transaction.atomic():
-            instance.cashregister.update_balance(instance.amount, 'INCOME')
-            Transaction.objects.create(
-                trans_name=f"Shave: {instance.hairstyle.name}",
-                amount=instance.amount,
-                currency=instance.currency,
-                exchange_rate=instance.exchange_rate,
-                amount_in_default_currency=instance.amount_in_default_currency,
-                date_trans=instance.date_shave,
-                trans_type=Transaction.TransactionType.INCOME,
-                cashregister=instance.cashregister,
-                salon=instance.salon
-            )
+def update_shave_rollup(sender, instance, **kwargs):
+    update_rollup(instance, shave_entry)
 
 @receiver(pre_delete, sender=Shave)
-def revert_cashregister_balance(sender, instance, **kwargs):
-    if instance.status == Shave.Status.COMPLETED:
-        with transaction.atomic():
-            instance.cashregister.update_balance(instance.amount, 'EXPENSE')
-            Transaction.objects.filter(
-                trans_name=f"Shave: {instance.hairstyle.name}",
-                amount=instance.amount,
-                date_trans=instance.date_shave,
-                cashregister=instance.cashregister,
-                salon=instance.salon
-            ).delete() 
\ No newline at end of file
+def reverse_shave_transaction(sender, instance, origin=None, **kwargs):
+    remove_rollup(instance, shave_entry)
+    if deleted_with_source(origin, instance):
+        LedgerService.reverse(instance)
+
+@receiver(post_save, sender=Shave)
+@receiver(pre_delete, sender=Shave)
+def invalidate_salon_shave_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard({instance.salon_id}, ['finance', 'balances', 'hairstyles'])
+
+@receiver(post_save, sender=Hairstyle)
+@receiver(post_delete, sender=Hairstyle)
+def invalidate_salon_hairstyle_dashboard(sender, instance, **kwargs):
+    invalidate_dashboard({instance.salon_id}, ['hairstyles'])
+
+@receiver(post_save, sender=Hairstyle)
+@receiver(post_delete, sender=Hairstyle)
+def invalidate_hairstyle_choices(sender, instance, **kwargs):
+    invalidate_reference_on_commit('hairstyles', instance.salon_id)
@@ -0,0 +1,249 @@
+''' Bookings of barbers per day: conflict checks, free time and open slots '''
+
+from bisect import bisect_left, bisect_right
+from collections import defaultdict
+from datetime import datetime, timedelta
+from itertools import accumulate
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import FilteredRelation, Q
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from django.utils.translation import gettext_lazy as _
+from saloon.dashboard import start_of
+from saloonfinance.rollups import to_rollup_date
+
+# Shaves that keep their barber busy; cancelled ones free the time
+BUSY_STATUSES = ('SCHEDULED', 'IN_PROGRESS', 'COMPLETED')
+SLOT_STEP = timedelta(minutes=15)
+
+def at(day, moment):
+    value = datetime.combine(day, moment)
+    return timezone.make_aware(value) if settings.USE_TZ else value
+
+def local_time(moment):
+    return (timezone.localtime(moment) if timezone.is_aware(moment) else moment).strftime('%H:%M')
+
+class IntervalIndex:
+    """
+    Half-open ``[start, end)`` intervals sorted by start, with the running
+    maximum of their ends. The intervals that can overlap a range are the
+    prefix starting before its end, found by bisection, and the prefix
+    maximum tells whether any of them reaches past its start: an O(log n)
+    overlap test, like an interval tree augmented with maximum ends.
+    """
+    def __init__(self, intervals=()):
+        self.intervals = sorted(intervals, key=lambda interval: interval[:2])
+        self.reindex()
+
+    def reindex(self):
+        self.starts = [interval[0] for interval in self.intervals]
+        self.max_ends = list(accumulate((interval[1] for interval in self.intervals), max))
+
+    def __len__(self):
+        return len(self.intervals)
+
+    def __iter__(self):
+        return iter(self.intervals)
+
+    def add(self, start, end, key=None):
+        """
+        Insert one interval, rebuilding the prefix maxima in O(n); an index
+        of many intervals is built in one go by the constructor.
+        """
+        self.intervals.insert(bisect_right(self.starts, start), (start, end, key))
+        self.reindex()
+
+    def overlaps(self, start, end):
+        index = bisect_left(self.starts, end)
+        return index > 0 and self.max_ends[index - 1] > start
+
+    def overlapping(self, start, end):
+        """
+        The intervals overlapping ``[start, end)``, latest start first; the
+        walk back stops once no earlier interval reaches ``start``.
+        """
+        index = bisect_left(self.starts, end) - 1
+        while index >= 0 and self.max_ends[index] > start:
+            if self.intervals[index][1] > start:
+                yield self.intervals[index]
+            index -= 1
+
+    def gaps(self, start, end):
+        """
+        The stretches of ``[start, end)`` covered by no interval.
+        """
+        gaps, cursor = [], start
+        for first, last, _key in self.intervals:
+            if first >= end:
+                break
+            if last <= cursor:
+                continue
+            if first > cursor:
+                gaps.append((cursor, first))
+            cursor = last
+        if cursor < end:
+            gaps.append((cursor, end))
+        return gaps
+
+def busy_shaves(first_day, last_day):
+    """
+    The busy shaves from ``first_day`` through ``last_day`` with their
+    length in minutes, their own or else their hairstyle's.
+    """
+    Shave = apps.get_model('saloonservices', 'Shave')
+    return Shave.objects.filter(
+        status__in=BUSY_STATUSES, date_shave__gte=start_of(first_day),
+        date_shave__lt=start_of(last_day + timedelta(days=1)),
+    ).annotate(minutes=Coalesce('duration', 'hairstyle__duration')).order_by()
+
+class Bookings:
+    """
+    Busy intervals of barbers, one IntervalIndex per barber and local day,
+    keyed by shave id. A booking belongs to the day it starts on; bookings
+    are assumed to last less than a day, so one running past midnight is
+    found by also looking at the day before.
+    """
+    def __init__(self, days=None):
+        self.days = defaultdict(IntervalIndex, days or {})
+
+    @classmethod
+    def load(cls, barber_ids, first_day, last_day, unsaved=()):
+        """
+        The stored bookings that can overlap a booking of ``barber_ids``
+        from ``first_day`` through ``last_day``, including those starting
+        the day before, along with ``unsaved`` (barber id, start, end, key)
+        bookings.
+        """
+        intervals = defaultdict(list)
+        rows = busy_shaves(first_day - timedelta(days=1), last_day).filter(barber_id__in=barber_ids).values_list(
+            'barber_id', 'date_shave', 'minutes', 'pk',
+        )
+        for barber_id, start, minutes, pk in rows:
+            intervals[(barber_id, to_rollup_date(start))].append((start, start + timedelta(minutes=minutes), pk))
+        for barber_id, start, end, key in unsaved:
+            intervals[(barber_id, to_rollup_date(start))].append((start, end, key))
+        return cls({day: IntervalIndex(day_intervals) for day, day_intervals in intervals.items()})
+
+    def conflict(self, barber_id, start, end, exclude=None):
+        """
+        The first booking of the barber overlapping ``[start, end)`` other
+        than ``exclude``, or None.
+        """
+        day, last_day = to_rollup_date(start) - timedelta(days=1), to_rollup_date(end)
+        while day <= last_day:
+            index = self.days.get((barber_id, day))
+            if index is not None and index.overlaps(start, end):
+                conflict = next((interval for interval in index.overlapping(start, end) if exclude is None or interval[2] != exclude), None)
+                if conflict is not None:
+                    return conflict
+            day += timedelta(days=1)
+        return None
+
+def check_booking(barber, start, minutes, exclude=None, bookings=None):
+    """
+    Raise a ValidationError if ``barber`` is busy at any time of the
+    ``minutes`` from ``start``. The barber's bookings around that time are
+    loaded with one query unless preloaded ``bookings`` are given;
+    ``exclude`` is the key of the booking being moved.
+    """
+    end = start + timedelta(minutes=minutes)
+    if bookings is None:
+        bookings = Bookings.load([barber.pk], to_rollup_date(start), to_rollup_date(end))
+    conflict = bookings.conflict(barber.pk, start, end, exclude=exclude)
+    if conflict is not None:
+        raise ValidationError({'date_shave': _("%(barber)s is already booked from %(start)s to %(end)s.") % {
+            'barber': barber, 'start': local_time(conflict[0]), 'end': local_time(conflict[1]),
+        }})
+
+class SalonDay:
+    """
+    The opening hours of a salon on one day and the bookings of every
+    barber employed that day, loaded with a single query: the salon
+    left-joined to its barbers employed that day and to their busy shaves
+    of the day, so the hours come back even when no barber is employed.
+    """
+    def __init__(self, salon_id, day, opens=None, closes=None, barbers=None):
+        self.salon_id = salon_id
+        self.day = day
+        self.opens = opens
+        self.closes = closes
+        # barber id -> (name, IntervalIndex of its bookings)
+        self.barbers = barbers or {}
+
+    @classmethod
+    def load(cls, salon_id, day):
+        Salon = apps.get_model('saloon', 'Salon')
+        Barber = apps.get_model('saloon', 'Barber')
+        day_barbers = FilteredRelation('barbers', condition=Barber.objects.employed_filter(day, prefix='barbers__'))
+        day_shaves = FilteredRelation('day_barbers__shaves', condition=Q(
+            day_barbers__shaves__status__in=BUSY_STATUSES, day_barbers__shaves__date_shave__gte=start_of(day),
+            day_barbers__shaves__date_shave__lt=start_of(day + timedelta(days=1)),
+        ))
+        rows = Salon.objects.filter(pk=salon_id).annotate(
+            day_barbers=day_barbers, day_shaves=day_shaves,
+            minutes=Coalesce('day_shaves__duration', 'day_shaves__hairstyle__duration'),
+        ).order_by('day_barbers__user__first_name', 'day_barbers__user__last_name', 'day_barbers__id').values_list(
+            'opens_at', 'closes_at', 'day_barbers__id', 'day_barbers__user__first_name', 'day_barbers__user__last_name',
+            'day_barbers__user__email', 'day_shaves__id', 'day_shaves__date_shave', 'minutes',
+        )
+        salon_day, names, intervals = cls(salon_id, day), {}, defaultdict(list)
+        for opens_at, closes_at, barber_id, first_name, last_name, email, shave_id, start, minutes in rows:
+            salon_day.opens, salon_day.closes = at(day, opens_at), at(day, closes_at)
+            if barber_id is None:
+                continue
+            if barber_id not in names:
+                names[barber_id] = f'{first_name} {last_name}'.strip() or email
+            if shave_id is not None:
+                intervals[barber_id].append((start, start + timedelta(minutes=minutes), shave_id))
+        salon_day.barbers = {barber_id: (name, IntervalIndex(intervals[barber_id])) for barber_id, name in names.items()}
+        return salon_day
+
+    def free(self, barber_id):
+        return self.barbers[barber_id][1].gaps(self.opens, self.closes)
+
+    def slots(self, barber_id, minutes, not_before=None, step=SLOT_STEP):
+        """
+        The times, every ``step`` from opening, at which the barber is free
+        for ``minutes`` in a row, from ``not_before`` on.
+        """
+        length, slots = timedelta(minutes=minutes), []
+        for gap_start, gap_end in self.free(barber_id):
+            earliest = max(gap_start, not_before) if not_before is not None else gap_start
+            start = self.opens + -(-(earliest - self.opens) // step) * step
+            while start + length <= gap_end:
+                slots.append(start)
+                start += step
+        return slots
+
+    def next_slots(self, minutes, limit=5, not_before=None, step=SLOT_STEP):
+        """
+        The ``limit`` earliest open (start, barber id) pairs over all barbers.
+        """
+        found = [(start, barber_id) for barber_id in self.barbers for start in self.slots(barber_id, minutes, not_before, step)]
+        return sorted(found)[:limit]
+
+    def as_dict(self, minutes=None, not_before=None, limit=5):
+        barbers = []
+        for barber_id, (name, bookings) in self.barbers.items():
+            barber = {
+                'id': barber_id,
+                'name': name,
+                'bookings': [{'shave': key, 'start': start, 'end': end} for start, end, key in bookings],
+                'free': [{'start': start, 'end': end} for start, end in self.free(barber_id)],
+            }
+            if minutes is not None:
+                barber['slots'] = self.slots(barber_id, minutes, not_before)
+            barbers.append(barber)
+        result = {
+            'salon': self.salon_id,
+            'date': self.day,
+            'opens_at': self.opens,
+            'closes_at': self.closes,
+            'duration': minutes,
+            'barbers': barbers,
+        }
+        if minutes is not None:
+            result['next'] = [{'barber': barber_id, 'start': start} for start, barber_id in self.next_slots(minutes, limit, not_before)]
+        return result
@@ -0,0 +1,74 @@
+''' Cached per-salon tariff timelines used to resolve a hairstyle's tariff at a date '''
+
+from bisect import bisect_right
+from datetime import datetime, time
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+
+TARIFF_TIMELINE_KEY = 'saloonservices:tariff_timeline:{salon_id}'
+
+def as_datetime(value):
+    # Mirror how a DateTimeField lookup interprets dates and naive datetimes
+    if not isinstance(value, datetime):
+        value = datetime.combine(value, time.min)
+    if settings.USE_TZ and timezone.is_naive(value):
+        value = timezone.make_aware(value)
+    return value
+
+class TariffTimeline:
+    """
+    Sorted effective dates and tariffs per hairstyle of one salon; a lookup is
+    a binary search over the hairstyle's history.
+    """
+    def __init__(self, entries):
+        self.entries = entries
+
+    @staticmethod
+    def history(salon_id):
+        HairstyleTariffHistory = apps.get_model('saloonservices', 'HairstyleTariffHistory')
+        return HairstyleTariffHistory.objects.filter(hairstyle__salon_id=salon_id).order_by(
+            'hairstyle_id', 'effective_date', 'id'
+        ).values_list('hairstyle_id', 'effective_date', 'tariff')
+
+    @classmethod
+    def from_history(cls, history):
+        entries = {}
+        for hairstyle_id, effective_date, tariff in history:
+            dates, tariffs = entries.setdefault(hairstyle_id, ([], []))
+            dates.append(effective_date)
+            tariffs.append(tariff)
+        return cls(entries)
+
+    @classmethod
+    def build(cls, salon_id):
+        return cls.from_history(cls.history(salon_id))
+
+    @classmethod
+    async def abuild(cls, salon_id):
+        return cls.from_history([row async for row in cls.history(salon_id)])
+
+    def tariff_at(self, hairstyle_id, at, default=None):
+        dates, tariffs = self.entries.get(hairstyle_id, ((), ()))
+        index = bisect_right(dates, as_datetime(at))
+        return tariffs[index - 1] if index else default
+
+def get_tariff_timeline(salon_id):
+    key = TARIFF_TIMELINE_KEY.format(salon_id=salon_id)
+    timeline = cache.get(key)
+    if timeline is None:
+        timeline = TariffTimeline.build(salon_id)
+        cache.set(key, timeline, None)
+    return timeline
+
+async def aget_tariff_timeline(salon_id):
+    key = TARIFF_TIMELINE_KEY.format(salon_id=salon_id)
+    timeline = await cache.aget(key)
+    if timeline is None:
+        timeline = await TariffTimeline.abuild(salon_id)
+        await cache.aset(key, timeline, None)
+    return timeline
+
+def invalidate_tariff_timeline(salon_id):
+    cache.delete(TARIFF_TIMELINE_KEY.format(salon_id=salon_id))
@@ -1,3 +1,430 @@
-from django.test import TestCase
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+from importlib import import_module
+from django.apps import apps
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
+from django.urls import include, path
+from rest_framework.test import APIRequestFactory, force_authenticate
+from django.utils import timezone
+from accounts.models import CustomUser
+from saloon.models import Salon, BarberType, Barber, Client
+from saloonfinance.models import Currency, CashRegister, Transaction
+from saloonfinance.tests import assert_no_sequential_scan
+from salooninventory.models import Item, ItemUsed
+from api.saloonservices.views import ShaveViewSet
+from .models import Hairstyle, HairstyleTariffHistory, Shave
+from .scheduling import IntervalIndex, SalonDay
+
+# The API is not mounted by config.urls
+urlpatterns = [
+    path('api/services/', include('api.saloonservices.apiurls')),
+]
+
+class ShaveTestMixin:
+    def setUp(self):
+        cache.clear()
+        self.owner = CustomUser.objects.create_user(email='owner@example.com', password='secret')
+        self.salon = Salon.objects.create(name='Main salon', owner=self.owner)
+        self.barber_type = BarberType.objects.create(name='Senior', salon=self.salon)
+        barber_user = CustomUser.objects.create_user(email='barber@example.com', password='secret')
+        self.barber = Barber.objects.create(
+            user=barber_user, salon=self.salon, barber_type=self.barber_type, start_date=date(2024, 1, 1)
+        )
+        self.currency = Currency.objects.get(pk=Currency.get_default())
+        self.hairstyle = Hairstyle.objects.create(name='Fade', current_tariff=Decimal('10.00'), salon=self.salon)
+        self.cashregister = CashRegister.objects.create(name='Front desk', currency=self.currency, salon=self.salon)
+
+    def make_shave(self, **kwargs):
+        values = {
+            'barber': self.barber,
+            'hairstyle': self.hairstyle,
+            'amount': Decimal('10.00'),
+            'cashregister': self.cashregister,
+            'salon': self.salon,
+        }
+        values.update(kwargs)
+        return Shave(**values)
+
+class DefaultCurrencyCacheTests(ShaveTestMixin, TestCase):
+    def test_get_default_is_cached(self):
+        Currency.get_default()
+        with self.assertNumQueries(0):
+            self.assertEqual(Currency.get_default(), self.currency.pk)
+
+    def test_shave_save_only_inserts_the_shave(self):
+        Currency.get_default()
+        with self.assertNumQueries(1):
+            self.make_shave().save()
+
+    def test_flipping_default_invalidates_cache(self):
+        euro = Currency.objects.create(code='EUR', name='Euro', is_default=True)
+        self.assertEqual(Currency.get_default(), euro.pk)
+        euro.is_default = False
+        euro.save()
+        self.currency.is_default = True
+        self.currency.save()
+        self.assertEqual(Currency.get_default(), self.currency.pk)
+
+class BulkRecordTests(ShaveTestMixin, TestCase):
+    def test_bulk_record_writes_shaves_transactions_and_balance(self):
+        shaves = [self.make_shave(status=Shave.Status.COMPLETED) for i in range(20)]
+        shaves.append(self.make_shave(date_shave=timezone.now() + timedelta(days=1)))
+        Currency.get_default()
+        with self.assertNumQueries(19):
+            Shave.objects.bulk_record(shaves)
+        self.assertEqual(Shave.objects.count(), 21)
+        self.assertEqual(Transaction.objects.filter(salon=self.salon).count(), 20)
+        self.cashregister.refresh_from_db()
+        self.assertEqual(self.cashregister.balance, Decimal('200.00'))
+
+    def test_bulk_record_rejects_the_whole_batch(self):
+        other_salon = Salon.objects.create(name='Other salon', owner=self.owner)
+        other_register = CashRegister.objects.create(name='Other desk', currency=self.currency, salon=other_salon)
+        shaves = [self.make_shave(), self.make_shave(cashregister=other_register, date_shave=timezone.now() + timedelta(hours=1))]
+        with self.assertRaises(ValidationError) as cm:
+            Shave.objects.bulk_record(shaves)
+        self.assertEqual(list(cm.exception.message_dict), [1])
+        self.assertFalse(Shave.objects.exists())
+
+    def post_bulk(self, data):
+        request = APIRequestFactory().post('/shaves/bulk/', data, format='json')
+        force_authenticate(request, user=self.owner)
+        return ShaveViewSet.as_view({'post': 'bulk'})(request)
+
+    def test_bulk_endpoint_records_into_the_named_salon(self):
+        Salon.objects.create(name='Second salon', owner=self.owner)
+        shave = {'barber': self.barber.pk, 'hairstyle': self.hairstyle.pk, 'amount': '10.00', 'cashregister': self.cashregister.pk, 'status': 'COMPLETED'}
+        response = self.post_bulk({'salon': self.salon.pk, 'shaves': [shave]})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Shave.objects.get(pk=response.data['ids'][0]).salon, self.salon)
+        stranger = Salon.objects.create(name='Stranger salon', owner=CustomUser.objects.create_user(email='stranger@example.com', password='secret'))
+        for data in ({'shaves': [shave]}, {'salon': stranger.pk, 'shaves': [shave]}, [shave]):
+            response = self.post_bulk(data)
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('salon', response.data)
+
+    def test_bulk_record_rejects_other_salons_clients(self):
+        other_salon = Salon.objects.create(name='Other salon', owner=self.owner)
+        shaves = [
+            self.make_shave(client=Client.objects.create(name='Ada', salon=self.salon)),
+            self.make_shave(client=Client.objects.create(name='Grace', salon=other_salon), date_shave=timezone.now() + timedelta(hours=1)),
+        ]
+        with self.assertRaises(ValidationError) as cm:
+            Shave.objects.bulk_record(shaves)
+        self.assertEqual(cm.exception.message_dict, {1: ["Client must belong to the same salon as the shave."]})
+
+class ShaveLedgerTests(ShaveTestMixin, TestCase):
+    def balance(self):
+        self.cashregister.refresh_from_db()
+        return self.cashregister.balance
+
+    def test_completed_shave_is_credited_once(self):
+        shave = self.make_shave(status=Shave.Status.COMPLETED)
+        shave.save()
+        self.assertEqual(shave.ledger_transaction.amount, Decimal('10.00'))
+        self.assertEqual(self.balance(), Decimal('10.00'))
+        shave.save()
+        self.assertEqual(Transaction.objects.filter(shave=shave).count(), 1)
+        self.assertEqual(self.balance(), Decimal('10.00'))
+
+    def test_status_and_amount_changes_repost_the_transaction(self):
+        shave = self.make_shave()
+        shave.save()
+        self.assertFalse(Transaction.objects.filter(shave=shave).exists())
+        shave.status = Shave.Status.COMPLETED
+        shave.save()
+        self.assertEqual(self.balance(), Decimal('10.00'))
+        shave.amount = Decimal('15.00')
+        shave.save()
+        self.assertEqual(Transaction.objects.get(shave=shave).amount, Decimal('15.00'))
+        self.assertEqual(self.balance(), Decimal('15.00'))
+        shave.status = Shave.Status.CANCELLED
+        shave.save()
+        self.assertFalse(Transaction.objects.filter(shave=shave).exists())
+        self.assertEqual(self.balance(), Decimal('0.00'))
+
+    def test_deleting_a_shave_reverses_its_transaction(self):
+        shave = self.make_shave(status=Shave.Status.COMPLETED)
+        shave.save()
+        self.make_shave(status=Shave.Status.COMPLETED).save()
+        shave.delete()
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(self.balance(), Decimal('10.00'))
+
+    def test_legacy_transaction_is_linked_by_the_migration(self):
+        link_sources = import_module('saloonfinance.migrations.0005_ledger_transaction_sources').link_sources
+        shave = self.make_shave(status=Shave.Status.COMPLETED)
+        shave.save()
+        # As posted before transactions were linked to their source
+        Transaction.objects.filter(shave=shave).update(shave=None, trans_name='Shave: Fade')
+        link_sources(apps, None)
+        posted = Transaction.objects.get()
+        self.assertEqual((posted.shave_id, posted.trans_name), (shave.pk, f'Shave: Fade #{shave.pk}'))
+
+        shave = Shave.objects.get(pk=shave.pk)
+        shave.save()
+        self.assertEqual(Transaction.objects.count(), 1)
+        self.assertEqual(self.balance(), Decimal('10.00'))
+        shave.delete()
+        self.assertFalse(Transaction.objects.exists())
+        self.assertEqual(self.balance(), Decimal('0.00'))
+
+class RevenueRollupTests(ShaveTestMixin, TestCase):
+    def test_total_revenue_reads_daily_rollups(self):
+        self.make_shave(status=Shave.Status.COMPLETED).save()
+        Shave.objects.bulk_record([self.make_shave(status=Shave.Status.COMPLETED, amount=Decimal('15.00'))])
+        scheduled = self.make_shave()
+        scheduled.save()
+        self.assertEqual(Shave.get_total_revenue(self.salon), Decimal('25.00'))
+
+        scheduled = Shave.objects.get(pk=scheduled.pk)
+        scheduled.status = Shave.Status.COMPLETED
+        scheduled.save()
+        self.assertEqual(Shave.get_total_revenue(self.salon), Decimal('35.00'))
+
+        scheduled.delete()
+        with self.assertNumQueries(1):
+            self.assertEqual(Shave.get_total_revenue(self.salon), Decimal('25.00'))
+
+class ShaveHistoryIndexTests(ShaveTestMixin, TestCase):
+    def test_salon_status_date_range_uses_an_index(self):
+        Shave.objects.bulk_record(
+            self.make_shave(status=status, date_shave=timezone.now() - timedelta(hours=index))
+            for index, status in enumerate(Shave.Status.values * 10)
+        )
+        queryset = Shave.objects.for_salon(self.salon).completed().between(timezone.make_aware(datetime(2024, 1, 1)))
+        self.assertEqual(queryset.count(), 10)
+        assert_no_sequential_scan(self, queryset)
+
+    def test_newest_shaves_of_a_salon_use_an_index(self):
+        Shave.objects.bulk_record(self.make_shave(date_shave=timezone.now() - timedelta(hours=i)) for i in range(10))
+        assert_no_sequential_scan(self, Shave.objects.for_salon(self.salon).order_by('-date_shave', '-pk')[:5])
+
+class TariffTimelineTests(ShaveTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        HairstyleTariffHistory.objects.all().delete()
+        for month, tariff in ((1, '8.00'), (3, '9.00'), (6, '12.00')):
+            HairstyleTariffHistory.objects.create(
+                hairstyle=self.hairstyle, tariff=Decimal(tariff), effective_date=timezone.make_aware(datetime(2024, month, 1))
+            )
+
+    def test_lookup_is_served_from_the_cached_timeline(self):
+        self.assertEqual(self.hairstyle.get_tariff_at_date(date(2023, 12, 31)), Decimal('10.00'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.hairstyle.get_tariff_at_date(date(2024, 1, 1)), Decimal('8.00'))
+            self.assertEqual(self.hairstyle.get_tariff_at_date(date(2024, 5, 31)), Decimal('9.00'))
+            self.assertEqual(self.hairstyle.get_tariff_at_date(timezone.make_aware(datetime(2024, 7, 1))), Decimal('12.00'))
+
+    def test_new_history_invalidates_the_timeline(self):
+        self.assertEqual(self.hairstyle.get_tariff_at_date(date(2024, 9, 1)), Decimal('12.00'))
+        HairstyleTariffHistory.objects.create(
+            hairstyle=self.hairstyle, tariff=Decimal('14.00'), effective_date=timezone.make_aware(datetime(2024, 8, 1))
+        )
+        self.assertEqual(self.hairstyle.get_tariff_at_date(date(2024, 9, 1)), Decimal('14.00'))
+
+    def test_annotation_matches_per_object_lookup(self):
+        Shave.objects.bulk_record(
+            self.make_shave(date_shave=timezone.make_aware(datetime(2024, month, 15)), amount=Decimal('11.00'))
+            for month in (1, 2, 4, 7)
+        )
+        shaves = list(Shave.objects.annotate_tariff_at_shave_date().order_by('date_shave'))
+        self.assertEqual([shave.tariff_at_shave_date for shave in shaves], [Decimal('8.00'), Decimal('8.00'), Decimal('9.00'), Decimal('12.00')])
+        for shave in shaves:
+            self.assertEqual(shave.tariff_at_shave_date, shave.hairstyle.get_tariff_at_date(shave.date_shave))
+        with self.assertNumQueries(0):
+            self.assertEqual([shave.tariff_difference for shave in shaves], [Decimal('3.00'), Decimal('3.00'), Decimal('2.00'), Decimal('-1.00')])
+
+@override_settings(ROOT_URLCONF='saloonservices.tests')
+class AsyncEndpointTests(ShaveTestMixin, TestCase):
+    async def test_shave_list_is_keyset_paginated(self):
+        await Shave.objects.abulk_create([
+            self.make_shave(date_shave=timezone.make_aware(datetime(2024, 1, day)), amount_in_default_currency=Decimal('10.00'))
+            for day in range(1, 31)
+        ])
+        response = await self.async_client.get('/api/services/async/shaves/')
+        self.assertEqual(response.status_code, 403)
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get('/api/services/async/shaves/', {'salon': self.salon.pk})
+        page = response.json()
+        self.assertEqual(len(page['results']), 25)
+        self.assertEqual(page['results'][0]['date_shave'], '2024-01-30T00:00:00Z')
+        self.assertEqual(page['results'][0]['total_amount'], '10.00')
+        self.assertIsNone(page['previous'])
+        response = await self.async_client.get(page['next'])
+        self.assertEqual([shave['date_shave'][:10] for shave in response.json()['results']], [f'2024-01-0{day}' for day in range(5, 0, -1)])
+        other = await Salon.objects.acreate(name='Other salon', owner=await CustomUser.objects.acreate(email='other@example.com'))
+        response = await self.async_client.get('/api/services/async/shaves/', {'salon': other.pk})
+        self.assertEqual(response.status_code, 400)
+
+    async def test_tariffs_are_read_at_a_date(self):
+        await HairstyleTariffHistory.objects.acreate(hairstyle=self.hairstyle, tariff=Decimal('8.00'), effective_date=timezone.make_aware(datetime(2024, 1, 1)))
+        await self.async_client.aforce_login(self.owner)
+        url = f'/api/services/async/salons/{self.salon.pk}/tariffs/'
+        response = await self.async_client.get(url, {'at': '2024-02-01'})
+        self.assertEqual(response.json()['results'], [{'id': self.hairstyle.pk, 'name': 'Fade', 'current_tariff': 10.0, 'tariff': 8.0}])
+        response = await self.async_client.get(url)
+        self.assertEqual(response.json()['results'][0]['tariff'], 10.0)
+        self.assertEqual((await self.async_client.get(url, {'at': '2024-13-45'})).status_code, 400)
+
+class ShaveTotalsTests(ShaveTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        comb = Item.objects.create(name='Comb', price=Decimal('2.50'), salon=self.salon, current_stock=100)
+        wax = Item.objects.create(name='Wax', price=Decimal('4.00'), salon=self.salon, current_stock=100)
+        self.shaves = [self.make_shave(status=Shave.Status.COMPLETED) for i in range(5)]
+        for shave in self.shaves:
+            shave.save()
+        ItemUsed.objects.bulk_create([
+            ItemUsed(item=item, shave=shave, barber=self.barber, quantity=2, salon=self.salon)
+            for shave in self.shaves[:4] for item in (comb, wax)
+        ])
+
+    def test_annotation_matches_property_fallbacks(self):
+        annotated = {shave.pk: shave.total_amount for shave in Shave.objects.with_totals()}
+        prefetched = {shave.pk: shave.total_amount for shave in Shave.objects.prefetch_related('items_used__item')}
+        aggregated = {shave.pk: Shave.objects.get(pk=shave.pk).total_amount for shave in self.shaves}
+        self.assertEqual(annotated, prefetched)
+        self.assertEqual(annotated, aggregated)
+        self.assertEqual(annotated[self.shaves[0].pk], Decimal('23.00'))
+        self.assertEqual(annotated[self.shaves[4].pk], Decimal('10.00'))
+
+    def test_list_endpoint_uses_constant_queries(self):
+        view = ShaveViewSet.as_view({'get': 'list'})
+
+        def list_shaves():
+            request = APIRequestFactory().get('/shaves/')
+            force_authenticate(request, user=self.owner)
+            return view(request)
+
+        list_shaves()
+        with self.assertNumQueries(1) as context:
+            response = list_shaves()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 5)
+        Shave.objects.bulk_record(self.make_shave(status=Shave.Status.COMPLETED) for i in range(20))
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = list_shaves()
+        self.assertEqual(len(response.data), 25)
+
+@override_settings(ROOT_URLCONF='saloonservices.tests')
+class SchedulingTests(ShaveTestMixin, TestCase):
+    day = date(2030, 3, 4)
+
+    def at(self, hour, minute=0):
+        return timezone.make_aware(datetime.combine(self.day, time(hour, minute)))
+
+    def book(self, hour, minute=0, **kwargs):
+        shave = self.make_shave(date_shave=self.at(hour, minute), **kwargs)
+        shave.full_clean(exclude=['amount_in_default_currency'])
+        shave.save()
+        return shave
+
+    def test_interval_index(self):
+        index = IntervalIndex([(1, 3, 'a'), (2, 9, 'b'), (10, 12, 'c')])
+        self.assertTrue(index.overlaps(8, 10))
+        self.assertFalse(index.overlaps(9, 10))
+        self.assertFalse(index.overlaps(12, 20))
+        self.assertEqual([key for _, _, key in index.overlapping(2, 11)], ['c', 'b', 'a'])
+        self.assertEqual(index.gaps(0, 14), [(0, 1), (9, 10), (12, 14)])
+        index.add(9, 10, 'd')
+        self.assertEqual(index.gaps(0, 14), [(0, 1), (12, 14)])
+
+    def test_bookings_of_a_barber_must_not_overlap(self):
+        first = self.book(10)
+        with self.assertRaises(ValidationError) as cm:
+            self.book(10, 15)
+        self.assertEqual(cm.exception.message_dict['date_shave'], [f"{self.barber} is already booked from 10:00 to 10:30."])
+        self.book(10, 30)
+        self.book(11, duration=5, status=Shave.Status.COMPLETED)
+        # Moving a booking does not conflict with itself, and cancelled shaves free their time
+        first.date_shave = self.at(9, 45)
+        first.full_clean(exclude=['amount_in_default_currency'])
+        first.status = Shave.Status.CANCELLED
+        first.save()
+        self.book(9, 30)
+
+    def test_bulk_record_checks_bookings_within_the_batch(self):
+        self.book(14)
+        shaves = [
+            self.make_shave(date_shave=self.at(15)),
+            self.make_shave(date_shave=self.at(15, 15)),
+            self.make_shave(date_shave=self.at(14, 15), duration=10),
+        ]
+        with self.assertRaises(ValidationError) as cm:
+            Shave.objects.bulk_record(shaves)
+        self.assertEqual(sorted(cm.exception.message_dict), [0, 1, 2])
+
+    def test_bulk_record_result_does_not_depend_on_batch_order(self):
+        for statuses in ((Shave.Status.SCHEDULED, Shave.Status.COMPLETED), (Shave.Status.COMPLETED, Shave.Status.SCHEDULED)):
+            shaves = [self.make_shave(date_shave=self.at(16 + minute // 60, minute % 60), status=status) for minute, status in zip((0, 15), statuses)]
+            with self.assertRaises(ValidationError) as cm:
+                Shave.objects.bulk_record(shaves)
+            self.assertEqual(list(cm.exception.message_dict), [statuses.index(Shave.Status.SCHEDULED)])
+
+    def test_bookings_running_past_midnight_conflict(self):
+        self.book(23, 45)
+        self.day += timedelta(days=1)
+        with self.assertRaises(ValidationError):
+            self.book(0, 5)
+        self.book(0, 15)
+
+    def test_api_rejects_overlapping_bookings(self):
+        self.book(10)
+        view = ShaveViewSet.as_view({'post': 'create'})
+        data = {
+            'barber': self.barber.pk, 'hairstyle': self.hairstyle.pk, 'amount': '10.00',
+            'cashregister': self.cashregister.pk, 'salon': self.salon.pk, 'date_shave': self.at(10, 20).isoformat(),
+        }
+        request = APIRequestFactory().post('/shaves/', data)
+        force_authenticate(request, user=self.owner)
+        response = view(request)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('date_shave', response.data)
+        request = APIRequestFactory().post('/shaves/', dict(data, date_shave=self.at(10, 30).isoformat()))
+        force_authenticate(request, user=self.owner)
+        self.assertEqual(view(request).status_code, 201)
+
+    def test_salon_day_is_loaded_with_one_query(self):
+        self.book(9)
+        self.book(12, duration=60)
+        self.book(13, status=Shave.Status.CANCELLED)
+        barber_user = CustomUser.objects.create_user(email='second@example.com', password='secret')
+        second = Barber.objects.create(user=barber_user, salon=self.salon, barber_type=self.barber_type, start_date=date(2024, 1, 1))
+        Barber.objects.create(
+            user=CustomUser.objects.create_user(email='gone@example.com', password='secret'),
+            salon=self.salon, barber_type=self.barber_type, start_date=date(2024, 1, 1), end_date=date(2025, 1, 1),
+        )
+        with self.assertNumQueries(1):
+            salon_day = SalonDay.load(self.salon.pk, self.day)
+        self.assertEqual(set(salon_day.barbers), {self.barber.pk, second.pk})
+        self.assertEqual(salon_day.free(self.barber.pk), [(self.at(9, 30), self.at(12)), (self.at(13), self.at(19))])
+        self.assertEqual(salon_day.slots(self.barber.pk, 120, not_before=self.at(9, 40))[:2], [self.at(9, 45), self.at(10)])
+        self.assertEqual(salon_day.slots(self.barber.pk, 120)[-1], self.at(17))
+        self.assertEqual(salon_day.next_slots(30, limit=3), [(self.at(9), second.pk), (self.at(9, 15), second.pk), (self.at(9, 30), self.barber.pk)])
+
+    def test_salon_day_without_barbers_keeps_the_opening_hours(self):
+        self.barber.end_date = self.day - timedelta(days=1)
+        self.barber.save()
+        with self.assertNumQueries(1):
+            salon_day = SalonDay.load(self.salon.pk, self.day)
+        self.assertEqual((salon_day.opens, salon_day.closes), (self.at(9), self.at(19)))
+        self.assertEqual(salon_day.barbers, {})
+
+    def test_availability_endpoint(self):
+        self.book(9)
+        self.client.force_login(self.owner)
+        url = '/api/services/availability/'
+        response = self.client.get(url, {'date': self.day.isoformat(), 'hairstyle': self.hairstyle.pk, 'limit': 2})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['duration'], 30)
+        self.assertEqual(data['barbers'][0]['bookings'][0]['shave'], Shave.objects.get().pk)
+        self.assertEqual(len(data['barbers'][0]['slots']), 37)
+        self.assertEqual([slot['start'] for slot in data['next']], ['2030-03-04T09:30:00Z', '2030-03-04T09:45:00Z'])
+        self.assertNotIn('next', self.client.get(url, {'date': self.day.isoformat()}).json())
+        for params in ({'date': '2030-02-30'}, {'duration': '0'}, {'hairstyle': 'x'}, {'salon': 999}):
+            self.assertEqual(self.client.get(url, params).status_code, 400)
 
-# Create your tests here.